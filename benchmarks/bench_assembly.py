@@ -0,0 +1,66 @@
+"""
+Per-stage timing of the dense grid assembly: vectorized (formulation.py)
+versus the original loop implementation (reference.py).
+
+Usage:
+    python benchmarks/bench_assembly.py --depths 4 5 6 --points 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.pysr.formulation import splat_normals_dense, compute_divergence_dense, build_laplacian_dense
+from src.pysr.reference import (
+    splat_normals_dense_reference, compute_divergence_dense_reference, build_laplacian_dense_reference
+)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense assembly timing comparison")
+    parser.add_argument("--depths", type=int, nargs="+", default=[4, 5, 6])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--skip-reference", action="store_true", help="Only time the vectorized path (for large depths).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0.05, 0.95, (args.points, 3))
+    normals = rng.normal(size=(args.points, 3))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+
+    print(f"{'depth':>5} {'stage':>10} {'loop [s]':>10} {'vector [s]':>11} {'speedup':>8} {'match':>6}")
+    for depth in args.depths:
+        res = 2 ** depth
+
+        V, t_splat = timed(splat_normals_dense, points, normals, res)
+        b, t_div = timed(compute_divergence_dense, V, res)
+        A, t_lap = timed(build_laplacian_dense, res)
+        stages = [("splat", t_splat), ("divergence", t_div), ("laplacian", t_lap)]
+
+        if args.skip_reference:
+            for name, t in stages:
+                print(f"{depth:>5} {name:>10} {'-':>10} {t:>11.4f} {'-':>8} {'-':>6}")
+            continue
+
+        V_ref, r_splat = timed(splat_normals_dense_reference, points, normals, res)
+        b_ref, r_div = timed(compute_divergence_dense_reference, V, res)
+        A_ref, r_lap = timed(build_laplacian_dense_reference, res)
+
+        matches = [
+            np.array_equal(V, V_ref),
+            np.array_equal(b, b_ref),
+            (A != A_ref).nnz == 0,
+        ]
+        for (name, t), r, ok in zip(stages, [r_splat, r_div, r_lap], matches):
+            print(f"{depth:>5} {name:>10} {r:>10.4f} {t:>11.4f} {r / max(t, 1e-9):>7.1f}x {str(ok):>6}")
+
+if __name__ == "__main__":
+    main()
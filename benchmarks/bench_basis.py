@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the B-spline basis: the scalar evaluators
+(b_spline_generic, one Python call per sample) against the vectorized
+b_spline / b_spline_derivative, the degree 1 and 2 splat stencils, and the
+integral tables (checked against their closed forms).
+
+Usage:
+    python benchmarks/bench_basis.py --samples 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.pysr.basis import b_spline, b_spline_derivative, b_spline_generic, b_spline_derivative_generic, integral_tables
+from src.pysr.formulation import bspline_stencil
+
+# Closed-form 1D inner products for offsets 0, 1, 2
+CLOSED_FORM = {
+    1: {"mass": [2 / 3, 1 / 6], "stiffness": [2.0, -1.0], "gradient": [0.0, 0.5]},
+    2: {"mass": [11 / 20, 13 / 60, 1 / 120], "stiffness": [1.0, -1 / 3, -1 / 6], "gradient": [0.0, 5 / 12, 1 / 24]},
+}
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description="B-spline evaluator timing")
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--scalar-samples", type=int, default=100_000, help="The scalar loop is timed on fewer samples and scaled.")
+    parser.add_argument("--resolution", type=int, default=128, help="Grid resolution for the stencils.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    t = rng.uniform(-2.0, 2.0, args.samples)
+    t_scalar = t[:args.scalar_samples]
+    scale = args.samples / len(t_scalar)
+
+    print(f"{'function':>22} {'degree':>6} {'scalar [s]':>11} {'vectorized [s]':>15} {'speedup':>8} {'max diff':>9}")
+    for name, vec, scalar in (("b_spline", b_spline, b_spline_generic),
+                              ("b_spline_derivative", b_spline_derivative, b_spline_derivative_generic)):
+        for degree in (1, 2):
+            t_s, ref = timed(lambda: np.array([scalar(v, degree) for v in t_scalar]), 1)
+            t_s *= scale
+            t_v, out = timed(lambda: vec(t, degree), args.repeat)
+            diff = np.abs(out[:len(ref)] - ref).max()
+            print(f"{name:>22} {degree:>6} {t_s:>11.3f} {t_v:>15.4f} {t_s / t_v:>7.0f}x {diff:>9.1e}")
+
+    points = rng.uniform(0.05, 0.95, (args.samples, 3))
+    print(f"\nSplat stencils for {args.samples} points at {args.resolution}^3:")
+    for degree in (1, 2):
+        t_v, (idx, w) = timed(lambda: bspline_stencil(points, args.resolution, degree), args.repeat)
+        print(f"  degree {degree}: {idx.shape[1]:>2} nodes/point, {t_v:.3f} s, partition of unity error {np.abs(w.sum(axis=1) - 1).max():.1e}")
+
+    print("\nIntegral tables (offsets 0, 1, 2):")
+    for degree in (1, 2):
+        integral_tables.cache_clear()
+        t_v, tables = timed(lambda: integral_tables(degree), 1)
+        for kind, expected in CLOSED_FORM[degree].items():
+            values = tables[kind][degree:]
+            err = np.abs(values - expected).max()
+            print(f"  degree {degree} {kind:>9}: {np.array2string(values, precision=5)} (closed form error {err:.1e})")
+        print(f"  degree {degree} built in {t_v * 1e3:.2f} ms")
+
+if __name__ == "__main__":
+    main()
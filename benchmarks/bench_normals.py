@@ -0,0 +1,87 @@
+"""
+Timing and accuracy of normal estimation + orientation: the Open3D path
+(estimate_normals + orient_normals_consistent_tangent_plane) versus batched
+PCA over a scipy cKDTree with the cheap orientation options.
+
+Accuracy is measured against the analytic normals of a sphere (convex) and a
+torus (not star-shaped, where centroid orientation fails).
+
+Usage:
+    python benchmarks/bench_normals.py --points 100000 1000000
+    python benchmarks/bench_normals.py --points 100000 --skip-open3d
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.preprocess import pca_normals, orient_normals, RADIUS_FRACTION
+
+def sphere(rng, n, noise):
+    normals = rng.normal(size=(n, 3))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals + rng.normal(0, noise, (n, 3)), normals
+
+def torus(rng, n, noise, R=1.0, r=0.35):
+    u = rng.uniform(0, 2 * np.pi, n)
+    v = rng.uniform(0, 2 * np.pi, n)
+    normals = np.stack([np.cos(v) * np.cos(u), np.cos(v) * np.sin(u), np.sin(v)], axis=1)
+    center = np.stack([R * np.cos(u), R * np.sin(u), np.zeros(n)], axis=1)
+    return center + r * normals + rng.normal(0, noise, (n, 3)), normals
+
+def scores(normals, truth):
+    """(mean unoriented angle error in degrees, fraction oriented like truth)."""
+    dots = np.einsum("ij,ij->i", normals, truth) / np.linalg.norm(normals, axis=1)
+    angle = np.degrees(np.arccos(np.clip(np.abs(dots), 0, 1))).mean()
+    return angle, (dots > 0).mean()
+
+def run_open3d(points, k_nn, radius):
+    import open3d as o3d
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(points)
+    start = time.perf_counter()
+    pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=radius, max_nn=k_nn))
+    t_est = time.perf_counter() - start
+    start = time.perf_counter()
+    pcd.orient_normals_consistent_tangent_plane(k_nn)
+    return np.asarray(pcd.normals), t_est, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Normal estimation timing")
+    parser.add_argument("--points", type=int, nargs="+", default=[100000])
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--noise", type=float, default=0.001)
+    parser.add_argument("--workers", type=int, default=-1)
+    parser.add_argument("--skip-open3d", action="store_true", help="The tangent-plane MST takes minutes on millions of points.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'shape':>7} {'points':>9} {'method':>22} {'normals [s]':>12} {'orient [s]':>11} {'angle err':>10} {'oriented':>9}")
+    for n in args.points:
+        for name, make in (("sphere", sphere), ("torus", torus)):
+            points, truth = make(rng, n, args.noise)
+            radius = RADIUS_FRACTION * np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+
+            rows = []
+            if not args.skip_open3d:
+                normals, t_est, t_orient = run_open3d(points, args.k, radius)
+                rows.append(("open3d + tangent-plane", t_est, t_orient, normals))
+
+            start = time.perf_counter()
+            pca, neighbors = pca_normals(points, args.k, radius, args.workers)
+            t_pca = time.perf_counter() - start
+            for orient in ("centroid", "propagate"):
+                start = time.perf_counter()
+                normals = orient_normals(points, pca, orient, neighbors=neighbors, workers=args.workers)
+                rows.append((f"pca + {orient}", t_pca, time.perf_counter() - start, normals))
+
+            for method, t_est, t_orient, normals in rows:
+                angle, oriented = scores(normals, truth)
+                print(f"{name:>7} {n:>9} {method:>22} {t_est:>12.2f} {t_orient:>11.2f} {angle:>9.2f}° {oriented:>9.4f}")
+
+if __name__ == "__main__":
+    main()
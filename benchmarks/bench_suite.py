@@ -0,0 +1,252 @@
+"""
+Reproducible benchmark sweep over backend, depth, point count and noise on
+the synthetic sphere from generate_sphere_point_cloud.
+
+Every run executes in a fresh process (so peak RSS belongs to that run
+alone) with a fixed seed, and records the stage metrics from src/metrics.py:
+per-stage wall time, peak RSS, solver iterations and the mesh size.
+
+Usage:
+    python benchmarks/bench_suite.py --out results.json --csv results.csv
+    python benchmarks/bench_suite.py --preset full --out full.json
+    python benchmarks/bench_suite.py --out new.json --baseline results.json
+    python benchmarks/bench_suite.py --load new.json --baseline results.json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.pysr.solver import SOLVERS
+
+BACKENDS = ("open3d", "manual", "sparse")
+
+PRESETS = {
+    "quick": {"depths": [5, 6, 7], "points": [2000, 20000, 200000], "noise": [0.0, 0.02]},
+    "full": {"depths": [5, 6, 7, 8, 9], "points": [2000, 20000, 200000, 2000000], "noise": [0.0, 0.02]},
+}
+
+# Stages whose wall time gets its own column in the table / CSV
+STAGE_COLUMNS = ("splat", "divergence", "laplacian", "solve", "marching_cubes")
+
+def run_case(case, manual_options):
+    """
+    Runs one configuration and returns its result dict. Executed in a child
+    process; the pipeline's progress output is captured, not printed.
+    """
+    from src import metrics
+    from src.utils import generate_sphere_point_cloud
+    from src.reconstruction import run_poisson, run_poisson_manual, run_poisson_sparse
+
+    np.random.seed(case["seed"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        pcd = generate_sphere_point_cloud(num_points=case["points"], noise_std=case["noise"])
+
+    metrics.enable()
+    result = dict(case)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            with metrics.stage("reconstruct", backend=case["backend"]):
+                if case["backend"] == "open3d":
+                    mesh, _ = run_poisson(pcd, depth=case["depth"])
+                elif case["backend"] == "manual":
+                    mesh, _ = run_poisson_manual(pcd, depth=case["depth"], **manual_options)
+                else:
+                    mesh, _ = run_poisson_sparse(pcd, depth=case["depth"])
+        result["status"] = "ok"
+        result["vertices"] = len(mesh.vertices)
+        result["triangles"] = len(mesh.triangles)
+    except Exception as e:
+        result["status"] = f"error: {e!r}"
+    result["total_time"] = time.perf_counter() - start
+
+    records = metrics.get_records()
+    result["stages"] = records
+    result["peak_rss_mb"] = max((r["peak_rss_mb"] for r in records), default=0.0)
+    solves = [r for r in records if r["stage"].endswith("/solve")]
+    result["iterations"] = sum(r.get("iterations", 0) for r in solves) if solves else None
+    return result
+
+def stage_times(result):
+    """Wall time per leaf stage name, summed over cascade levels."""
+    times = {}
+    for rec in result.get("stages", []):
+        name = rec["stage"].rsplit("/", 1)[-1]
+        times[name] = times.get(name, 0.0) + rec["wall_time"]
+    return times
+
+def case_key(result):
+    return (result["backend"], result["depth"], result["points"], result["noise"])
+
+def build_cases(args):
+    cases = []
+    for backend, depth, points, noise in itertools.product(args.backends, args.depths, args.points, args.noise):
+        case = {"backend": backend, "depth": depth, "points": points, "noise": noise, "seed": args.seed}
+        if backend == "manual" and depth > args.max_manual_depth:
+            case["status"] = f"skipped: depth > --max-manual-depth {args.max_manual_depth}"
+        cases.append(case)
+    return cases
+
+def run_all(cases, manual_options, repeat):
+    """Runs every case `repeat` times in fresh processes; keeps the fastest run."""
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for i, case in enumerate(cases):
+        label = f"{case['backend']} d{case['depth']} n{case['points']} noise={case['noise']}"
+        if "status" in case:
+            print(f"  [{i + 1}/{len(cases)}] {label}: {case['status']}")
+            results.append(dict(case))
+            continue
+
+        best = None
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(run_case, case, manual_options).result()
+            if best is None or result["total_time"] < best["total_time"]:
+                best = result
+        print(f"  [{i + 1}/{len(cases)}] {label}: {best['status']}, {best['total_time']:.2f} s")
+        results.append(best)
+    return results
+
+def flat_row(result):
+    """One CSV/table row per run."""
+    row = {
+        "backend": result["backend"],
+        "depth": result["depth"],
+        "points": result["points"],
+        "noise": result["noise"],
+        "status": result.get("status", ""),
+        "total_time": result.get("total_time"),
+        "peak_rss_mb": result.get("peak_rss_mb"),
+        "iterations": result.get("iterations"),
+        "vertices": result.get("vertices"),
+        "triangles": result.get("triangles"),
+    }
+    times = stage_times(result)
+    for name in STAGE_COLUMNS:
+        row[f"t_{name}"] = times.get(name)
+    return row
+
+def write_csv(results, path):
+    rows = [flat_row(r) for r in results]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def print_table(results):
+    rows = [flat_row(r) for r in results]
+    print(tabulate(rows, headers="keys", floatfmt=".3f", missingval="-"))
+
+def compare(results, baseline, threshold, min_time):
+    """
+    Compares total and per-stage times against a baseline run.
+    A time is flagged when it is more than `threshold` times the baseline and
+    longer than min_time seconds (to ignore timer noise on tiny stages).
+    Returns the number of flagged runs.
+    """
+    base = {case_key(r): r for r in baseline if r.get("status") == "ok"}
+    rows = []
+    flagged = 0
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None or r.get("status") != "ok":
+            continue
+
+        slow = []
+        pairs = [("total", r["total_time"], b["total_time"])]
+        cur_t, base_t = stage_times(r), stage_times(b)
+        pairs += [(name, cur_t[name], base_t[name]) for name in cur_t if name in base_t]
+        for name, cur, old in pairs:
+            if cur > min_time and cur > threshold * old:
+                slow.append(f"{name} {cur / max(old, 1e-9):.2f}x")
+
+        mem_ratio = r["peak_rss_mb"] / max(b["peak_rss_mb"], 1e-9)
+        if mem_ratio > threshold:
+            slow.append(f"peak RSS {mem_ratio:.2f}x")
+
+        flagged += bool(slow)
+        rows.append({
+            "backend": r["backend"], "depth": r["depth"], "points": r["points"], "noise": r["noise"],
+            "baseline [s]": b["total_time"], "current [s]": r["total_time"],
+            "ratio": r["total_time"] / max(b["total_time"], 1e-9),
+            "iterations": f"{b.get('iterations')} -> {r.get('iterations')}",
+            "flags": ", ".join(slow) or "ok",
+        })
+
+    print(tabulate(rows, headers="keys", floatfmt=".3f"))
+    print(f"{flagged} of {len(rows)} runs slower than {threshold:.2f}x the baseline.")
+    return flagged
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sweep over backend, depth and point count")
+    parser.add_argument("--preset", choices=PRESETS, default="quick", help="Default sweep; the flags below override it.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["open3d", "manual"])
+    parser.add_argument("--depths", type=int, nargs="+", default=None)
+    parser.add_argument("--points", type=int, nargs="+", default=None)
+    parser.add_argument("--noise", type=float, nargs="+", default=None, help="Gaussian noise std of the sphere samples.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration; the fastest is kept.")
+    parser.add_argument("--max-manual-depth", type=int, default=8, help="Skip dense manual runs above this depth.")
+    parser.add_argument("--solver", choices=SOLVERS, default="pcg-mg", help="Manual backend solver.")
+    parser.add_argument("--matrix-free", action="store_true", help="Manual backend: matrix-free Laplacian.")
+    parser.add_argument("--out", type=str, default=None, help="Write full results (with stage records) to this JSON file.")
+    parser.add_argument("--csv", type=str, default=None, help="Write one row per run to this CSV file.")
+    parser.add_argument("--load", type=str, default=None, help="Read results from this JSON file instead of running.")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare against this results JSON and flag slowdowns.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown factor that counts as a regression.")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Ignore stages faster than this (seconds).")
+    args = parser.parse_args()
+
+    for key, value in PRESETS[args.preset].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    if args.load:
+        with open(args.load) as f:
+            results = json.load(f)["runs"]
+    else:
+        cases = build_cases(args)
+        print(f"Running {len(cases)} configurations...")
+        manual_options = {"solver": args.solver, "matrix_free": args.matrix_free}
+        results = run_all(cases, manual_options, args.repeat)
+
+    print_table(results)
+
+    if args.out:
+        info = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        }
+        with open(args.out, "w") as f:
+            json.dump({"environment": info, "runs": results}, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.csv:
+        write_csv(results, args.csv)
+        print(f"CSV written to {args.csv}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["runs"]
+        print(f"\nComparison against {args.baseline}:")
+        if compare(results, baseline, args.threshold, args.min_time):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Runs main.py --batch on two small synthetic spheres (written to a
+temporary directory) and checks the manifest: every job succeeds and
+records its top-level stage times, including "reconstruct". A recursive
+glob over two files with the same name in different directories must
+write two meshes.
+
+Usage:
+    python benchmarks/check_batch.py
+"""
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src.geometry import Mesh, write_ply
+from src.utils import generate_sphere_point_cloud
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        in_dir = os.path.join(tmp, "in")
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(in_dir)
+        for i, n in enumerate((2000, 3000)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                pcd = generate_sphere_point_cloud(num_points=n)
+            write_ply(os.path.join(in_dir, f"sphere{i}.ply"), Mesh(pcd.points, vertex_normals=pcd.normals))
+
+        cmd = [sys.executable, os.path.join(ROOT, "main.py"), "--batch", in_dir, "--output", out_dir,
+               "--manual", "--depth", "4", "--no-cache", "--batch-workers", "2"]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        print(proc.stdout)
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        # Same file name in two subdirectories
+        for sub in ("a", "b"):
+            os.makedirs(os.path.join(in_dir, sub))
+            os.replace(os.path.join(in_dir, f"sphere{'ab'.index(sub)}.ply"), os.path.join(in_dir, sub, "scan.ply"))
+        nested_dir = os.path.join(tmp, "nested")
+        cmd[cmd.index("--batch") + 1] = os.path.join(in_dir, "**", "*.ply")
+        cmd[cmd.index("--output") + 1] = nested_dir
+        nested = subprocess.run(cmd, capture_output=True, text=True)
+        with open(os.path.join(nested_dir, "manifest.json")) as f:
+            nested_outputs = {e["output"] for e in json.load(f)["jobs"]}
+        nested_meshes = [name for name in os.listdir(nested_dir) if name.endswith(".ply")]
+
+    entries = manifest["jobs"]
+    checks = [
+        ("main.py --batch exits cleanly", proc.returncode == 0),
+        ("manifest has an entry per input", len(entries) == 2),
+        ("every job succeeded", all(e["status"] == "ok" for e in entries)),
+        ("stages include reconstruct", all("reconstruct" in e.get("stages", {}) for e in entries)),
+        ("stages are top-level only", all("/" not in s for e in entries for s in e.get("stages", {}))),
+        ("same-named files get distinct outputs", nested.returncode == 0 and len(nested_outputs) == 2),
+        ("a mesh per same-named file", len(nested_meshes) == 2),
+    ]
+    for name, ok in checks:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    ok = all(ok for _, ok in checks)
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
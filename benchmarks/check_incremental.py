@@ -0,0 +1,94 @@
+"""
+Checks IncrementalSession against a from-scratch solve_poisson_dense. The
+first pass is a small random subset (--first) of the synthetic sphere minus
+a polar cap (an unscanned region), like a quick preview scan. The second
+pass adds the rest of the sphere outside the cap, and the later passes fill
+the cap in azimuth sectors, like extra scans of the missing part. The
+surface after the last pass is compared with a single dense solve over all
+points in the same box.
+
+Usage:
+    python benchmarks/check_incremental.py --depth 6 --passes 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.incremental import IncrementalSession
+from src.pysr.solver import solve_poisson_dense, extract_isosurface_from_dense
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental vs from-scratch reconstruction")
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--passes", type=int, default=4, help="Two passes outside the cap plus passes-2 passes over the cap.")
+    parser.add_argument("--first", type=float, default=0.02, help="Fraction of the points in the first pass.")
+    parser.add_argument("--cap", type=float, default=0.1, help="Fraction of the sphere's area missing from the first pass.")
+    parser.add_argument("--solver", choices=("cg", "pcg-mg"), default="pcg-mg")
+    parser.add_argument("--margin", type=int, default=16, help="Solve window margin in voxels; -1 solves every pass globally.")
+    parser.add_argument("--weight-tol", type=float, default=0.05, help="IncrementalSession weight_tol.")
+    parser.add_argument("--tol", type=float, default=0.05, help="Allowed mean vertex distance to the reference, in voxels.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    normals = rng.normal(size=(args.points, 3))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    points = normals.copy()
+    bounds = (np.full(3, -1.0), np.full(3, 1.0))
+
+    # Passes 0 and 1: outside the cap z > 1 - 2 * cap (pass 0 a random
+    # subset of it); passes 2..: cap sectors
+    azimuth = np.arctan2(points[:, 1], points[:, 0])
+    cap_sectors = max(args.passes - 2, 1)
+    sector = np.minimum(((azimuth + np.pi) / (2 * np.pi) * cap_sectors).astype(int), cap_sectors - 1) + 2
+    outside = points[:, 2] <= 1 - 2 * args.cap
+    sector[outside] = np.where(rng.random(np.count_nonzero(outside)) < args.first, 0, 1)
+
+    margin = None if args.margin < 0 else args.margin
+    session = IncrementalSession(args.depth, bounds=bounds, solver=args.solver, margin=margin,
+                                 weight_tol=args.weight_tol)
+    print(f"{'pass':>4} {'points':>8} {'touched':>8} {'window':>12} {'weight':>8} {'iterations':>10} {'bricks':>9} "
+          f"{'time [s]':>9}")
+    for k in range(max(args.passes, 3)):
+        idx = np.nonzero(sector == k)[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            mesh, _ = session.add_points(points[idx], normals[idx])
+        u = session.last_update
+        window = "x".join(str(n) for n in u["window"]) if u["local"] else "global"
+        print(f"{k + 1:>4} {u['points']:>8} {u['touched_nodes']:>8} {window:>12} {u['weight']:>8.4g} "
+              f"{u['iterations']:>10} {u['bricks_remarched']:>4}/{u['bricks_total']:<4} {u['time']:>9.2f}")
+
+    # Reference: one dense solve over all points, normalized like the session
+    res = session.resolution
+    normalized = np.clip((points - session.center) / session.max_dim + 0.5, 0.05, 0.95)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ref_x = solve_poisson_dense(normalized, normals, res, session.alpha, matrix_free=True, solver=args.solver,
+                                    rtol=session.rtol, screening=session.screening)
+        ref_verts, _ = extract_isosurface_from_dense(ref_x, res, level=0.0)
+    print(f"From scratch (solve_poisson_dense): {time.perf_counter() - start:.2f} s")
+
+    field_err = np.abs(session.x - ref_x).max() / np.abs(ref_x).max()
+    verts = np.asarray(mesh.vertices)
+    ref_verts = (ref_verts - 0.5) * session.max_dim + session.center
+    voxel = session.max_dim / (session.resolution - 1)
+    dist, _ = cKDTree(ref_verts).query(verts)
+    radius_err = np.abs(np.linalg.norm(verts, axis=1) - 1).mean()
+    print(f"Field difference: {field_err:.2e} of max|x|")
+    print(f"Vertex distance to reference: mean {dist.mean() / voxel:.4f}, max {dist.max() / voxel:.4f} voxels")
+    print(f"Vertices: {len(verts)} incremental, {len(ref_verts)} reference; mean radius error {radius_err:.2e}")
+
+    ok = dist.mean() / voxel <= args.tol
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
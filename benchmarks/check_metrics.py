@@ -0,0 +1,79 @@
+"""
+Checks the stage records of src/metrics.py: nesting levels, stage fields
+that share a name with record keys (e.g. depth=), reserved field names,
+the iso-value on marching cubes records, and the summary table.
+
+Usage:
+    python benchmarks/check_metrics.py
+"""
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from src import metrics
+from src.pysr.solver import extract_isosurface_from_dense
+
+def main():
+    metrics.enable()
+    metrics.reset()
+    with metrics.stage("reconstruct", depth=8):
+        with metrics.stage("solve", depth=7) as s:
+            s["iterations"] = 12
+    records = {r["stage"]: r for r in metrics.get_records()}
+
+    summary = io.StringIO()
+    with contextlib.redirect_stdout(summary):
+        metrics.print_summary()
+    # Records are in completion order: the nested stage comes first
+    lines = {line.strip().split()[0]: line for line in summary.getvalue().splitlines()[1:]}
+
+    # Marching cubes of a sphere's signed distance, at a fixed and at the mean level
+    res = 16
+    axis = np.linspace(-1, 1, res)
+    field = np.sqrt(sum(c ** 2 for c in np.meshgrid(axis, axis, axis, indexing="ij"))) - 0.5
+    metrics.reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract_isosurface_from_dense(field.ravel(), res, level=0.0)
+        extract_isosurface_from_dense(field.ravel(), res)
+    iso = [r for r in metrics.get_records() if r["stage"] == "marching_cubes"]
+
+    rejected = []
+    for key in ("level", "stage", "wall_time"):
+        try:
+            with metrics.stage("bad", **{key: 1}):
+                pass
+        except ValueError:
+            rejected.append(key)
+    try:
+        with metrics.stage("bad") as s:
+            s["level"] = 1
+    except ValueError:
+        rejected.append("s[level]")
+    metrics.disable()
+
+    checks = [
+        ("top-level stage has level 0", records["reconstruct"]["level"] == 0),
+        ("nested stage has level 1", records["reconstruct/solve"]["level"] == 1),
+        ("depth= field is kept on the top-level stage", records["reconstruct"]["depth"] == 8),
+        ("depth= field is kept on the nested stage", records["reconstruct/solve"]["depth"] == 7),
+        ("counters are recorded", records["reconstruct/solve"]["iterations"] == 12),
+        ("summary does not indent the top-level stage", lines["reconstruct"].startswith("reconstruct")),
+        ("summary indents the nested stage once", lines["solve"].startswith("  solve ")),
+        ("marching_cubes records carry the iso-value", len(iso) == 2 and iso[0].get("iso_value") == 0.0
+         and abs(iso[1].get("iso_value", np.inf) - field.mean()) < 1e-9),
+        ("marching_cubes records keep their nesting level", all(r["level"] == 0 for r in iso)),
+        ("reserved field names are rejected", rejected == ["level", "stage", "wall_time", "s[level]"]),
+    ]
+    for name, ok in checks:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    ok = all(ok for _, ok in checks)
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
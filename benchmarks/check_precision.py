@@ -0,0 +1,63 @@
+"""
+Accuracy check of the float32 / mixed precision manual solve against the
+float64 result on the synthetic sphere from generate_sphere_point_cloud.
+
+Usage:
+    python benchmarks/check_precision.py --depth 6 --solver pcg-mg
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.utils import generate_sphere_point_cloud
+from src.reconstruction import _normalize_points
+from src.pysr.solver import solve_poisson_dense, extract_isosurface_from_dense, SOLVERS, PRECISIONS
+
+def main():
+    parser = argparse.ArgumentParser(description="float32/mixed vs float64 accuracy check")
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--solver", choices=SOLVERS, default="pcg-mg")
+    parser.add_argument("--matrix-free", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Max allowed vertex deviation, in voxels.")
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    pcd = generate_sphere_point_cloud(num_points=args.points)
+    points, center, max_dim = _normalize_points(np.asarray(pcd.points), 1.1)
+    normals = np.asarray(pcd.normals)
+    resolution = 2 ** args.depth
+
+    results = {}
+    for precision in PRECISIONS:
+        start = time.perf_counter()
+        x = solve_poisson_dense(points, normals, resolution, solver=args.solver,
+                                matrix_free=args.matrix_free, precision=precision)
+        elapsed = time.perf_counter() - start
+        verts, _ = extract_isosurface_from_dense(np.asarray(x, dtype=np.float64), resolution, level=0.0)
+        results[precision] = (x, verts, elapsed)
+
+    x_ref, verts_ref, t_ref = results["float64"]
+    tree = cKDTree(verts_ref)
+    failed = False
+
+    print(f"{'precision':>10} {'time [s]':>9} {'field rel. err':>15} {'max vertex dev [vox]':>21}")
+    for precision, (x, verts, elapsed) in results.items():
+        rel = np.linalg.norm(x - x_ref) / np.linalg.norm(x_ref)
+        dev = tree.query(verts)[0].max() * (resolution - 1)
+        failed |= dev > args.tolerance
+        print(f"{precision:>10} {elapsed:>9.3f} {rel:>15.2e} {dev:>21.2e}")
+
+    if failed:
+        print(f"FAILED: vertex deviation above {args.tolerance} voxels")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,371 @@
 import argparse
+import contextlib
+import functools
 import sys
-import open3d as o3d
+import traceback
+import numpy as np
 import os
 
-from src.preprocess import load_point_cloud, estimate_normals
-from src.reconstruction import run_poisson
-from src.postprocess import clean_mesh, filter_by_density
-from src.utils import generate_sphere_point_cloud, visualize
+# Only light modules at import time: the pipeline modules (scipy, skimage,
+# the solver stack) are imported where they are used, so --help and the
+# batch parent process start fast
+from src.pysr.options import SOLVERS, PRECISIONS, SCREENING, FEM_DEGREES
+from src.preprocess import NORMAL_METHODS, ORIENTATIONS
+from src import metrics
+from src.batch import find_inputs, input_root, estimate_job_mb, run_batch
 
-def main():
+# Bump when the cached arrays change meaning (2: manual/sparse densities)
+CACHE_VERSION = 2
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Screened Poisson Surface Reconstruction")
     parser.add_argument("--input", type=str, help="Path to input point cloud (PLY, XYZ, etc.). If not provided, a sphere is generated.")
     parser.add_argument("--output", type=str, default=None, help="Path to save the output mesh. If not provided, auto-generated in data/.")
     parser.add_argument("--depth", type=int, default=8, help="Octree depth (resolution).")
     parser.add_argument("--scale", type=float, default=1.1, help="Bounding box scale.")
     parser.add_argument("--density_quantile", type=float, default=0.01, help="Quantile of low-density vertices to trim.")
+    parser.add_argument("--normals", choices=NORMAL_METHODS, default="open3d", help="Normal estimation for clouds without normals: Open3D, or batched PCA over a scipy cKDTree (faster on large clouds).")
+    parser.add_argument("--orient", choices=ORIENTATIONS, default="tangent-plane", help="Normal orientation: Open3D's global MST (tangent-plane), kNN-tree propagation, centroid, viewpoint, or none.")
+    parser.add_argument("--viewpoint", type=float, nargs=3, default=None, metavar=("X", "Y", "Z"), help="Scanner position for --orient viewpoint.")
     parser.add_argument("--visualize", action="store_true", help="Visualize the result.")
     parser.add_argument("--manual", action="store_true", help="Use manual Python implementation (slower, demonstrative).")
+    parser.add_argument("--sparse", action="store_true", help="Use the manual solver on a sparse band around the samples (memory scales with surface area).")
+    parser.add_argument("--matrix-free", action="store_true", help="Manual mode: apply the Laplacian as a stencil instead of storing a sparse matrix.")
+    parser.add_argument("--solver", choices=SOLVERS, default="cg", help="Manual mode: linear solver (cg, multigrid, or multigrid-preconditioned CG).")
+    parser.add_argument("--cascade", type=int, default=0, help="Manual mode: solve this many coarser depths first and warm-start each finer depth.")
+    parser.add_argument("--workers", type=int, default=1, help="Manual/sparse mode: processes for brick-wise marching cubes.")
+    parser.add_argument("--scratch-dir", type=str, default=None, help="Manual mode: keep the vector field, RHS and solution in memory-mapped files in this directory (the solver's work vectors stay in RAM).")
+    parser.add_argument("--working-set-mb", type=int, default=512, help="Manual mode with --scratch-dir: RAM budget per slab for splatting/divergence; does not bound the solve.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64", help="Manual mode: arithmetic for assembly and solve (mixed = float32 iterations with float64 residual correction).")
+    parser.add_argument("--stream", action="store_true", help="Manual mode: read --input (binary/ASCII PLY or XYZN with normals) in chunks instead of loading it, and splat it chunk by chunk.")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="With --stream: points per chunk.")
+    parser.add_argument("--screening", type=float, default=SCREENING, help="Manual/sparse mode: strength of the point-interpolation term (0 = plain Poisson).")
+    parser.add_argument("--fem-degree", type=int, choices=FEM_DEGREES, default=None, help="Manual mode: solve the Galerkin system of degree 1 or 2 B-splines instead of finite differences.")
+    parser.add_argument("--tiles", type=int, default=0, help="Split the scene into this many overlapping tiles along its longest axis, each reconstructed at --depth in parallel, and merge them (0 = one grid).")
+    parser.add_argument("--tile-overlap", type=float, default=0.1, help="With --tiles: overlap margin on each side of a tile, as a fraction of the tile.")
+    parser.add_argument("--tile-workers", type=int, default=2, help="With --tiles: worker processes; jobs also respect --worker-memory-mb per worker.")
+    parser.add_argument("--lod", type=int, default=0, help="Manual mode: also write this many coarser meshes (<name>_lod1.ply, ...), each extracted from the same solve on a 2x coarser grid.")
     parser.add_argument("--decimate", type=int, default=None, help="Target number of triangles for mesh decimation.")
+    parser.add_argument("--cache-dir", type=str, default=os.path.join("data", "cache"), help="Directory of cached reconstructions, keyed by the input points/normals and reconstruction parameters.")
+    parser.add_argument("--cache-size-mb", type=int, default=2048, help="Size limit of --cache-dir; least recently used entries are evicted beyond it.")
+    parser.add_argument("--no-cache", action="store_true", help="Always reconstruct, and do not store the result.")
+    parser.add_argument("--metrics-json", type=str, default=None, help="Record per-stage wall time, peak memory and counters, print a summary and write them to this JSON file.")
+    parser.add_argument("--trace-memory", action="store_true", help="With --metrics-json: also record the tracemalloc peak of each stage (slower).")
     
-    args = parser.parse_args()
+    parser.add_argument("--batch", type=str, default=None, help="Reconstruct every point cloud in this directory (or matching this glob) in parallel; --output is then the output directory.")
+    parser.add_argument("--batch-workers", type=int, default=2, help="Batch mode: number of worker processes.")
+    parser.add_argument("--worker-memory-mb", type=int, default=4096, help="Batch mode: memory budget per worker. Jobs are only started while their estimated peak memory fits into batch-workers x this.")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    validate_args(args)
+
+    if args.batch:
+        run_batch_mode(args)
+        return
+
+    if args.metrics_json:
+        metrics.enable(trace_memory=args.trace_memory)
     
     # Determine output path
     if args.output is None:
         os.makedirs("data", exist_ok=True)
-        method = "manual" if args.manual else "open3d"
-        input_name = os.path.splitext(os.path.basename(args.input))[0] if args.input else "sphere"
-        output_path = f"data/{input_name}_{method}_d{args.depth}.ply"
+        output_path = os.path.join("data", output_name(args.input, args))
     else:
         output_path = args.output
+
+    pcd, mesh = run_pipeline(args.input, output_path, args)
+
+    if args.metrics_json:
+        print("Stage metrics:")
+        metrics.print_summary()
+        metrics.write_json(args.metrics_json)
+        print(f"Metrics written to {args.metrics_json}")
     
+    # 6. Visualize
+    if args.visualize:
+        from src.utils import visualize
+        from src.geometry import Mesh
+    if args.visualize and args.stream:
+        visualize([mesh], window_name="Result")
+    elif args.visualize:
+        print("Visualizing (Input Point Cloud + Reconstructed Mesh)...")
+        points = np.asarray(pcd.points)
+        extent = points.max(axis=0) - points.min(axis=0)
+        mesh_translated = Mesh(np.asarray(mesh.vertices) + [extent[0] * 1.5, 0, 0], np.asarray(mesh.triangles),
+                               np.asarray(mesh.vertex_normals))
+        
+        visualize([pcd, mesh_translated], window_name="Result")
+
+def validate_args(args):
+    """
+    Rejects invalid flag combinations up front, before a single run or a
+    batch is started (in a batch every job would otherwise fail on its own).
+    """
+    if args.input and not os.path.exists(args.input):
+        print(f"Error: Input file {args.input} does not exist.")
+        sys.exit(1)
+    if args.orient == "viewpoint" and args.viewpoint is None:
+        print("Error: --orient viewpoint needs --viewpoint X Y Z.")
+        sys.exit(1)
+    if args.stream and not ((args.input or args.batch) and args.manual and not args.sparse):
+        print("Error: --stream needs --input (or --batch) and the dense --manual backend.")
+        sys.exit(1)
+    if args.stream and args.tiles:
+        print("Error: --tiles needs the whole point cloud for bucketing and cannot be combined with --stream.")
+        sys.exit(1)
+
+    if args.lod and not (args.manual and not args.sparse):
+        print("Error: --lod needs the dense --manual backend (the solved field on the full grid).")
+        sys.exit(1)
+    if args.lod and args.tiles:
+        print("Error: --lod cannot be combined with --tiles.")
+        sys.exit(1)
+    if args.lod < 0 or args.lod > args.depth - 2:
+        print(f"Error: --lod must be between 0 and depth - 2 ({args.depth - 2}).")
+        sys.exit(1)
+
+    if args.fem_degree is not None and not (args.manual and not args.sparse):
+        print("Error: --fem-degree needs the dense --manual backend.")
+        sys.exit(1)
+    if args.fem_degree is not None and args.solver == "mg":
+        print("Error: --fem-degree supports --solver cg and pcg-mg only.")
+        sys.exit(1)
+    if args.fem_degree is not None and args.scratch_dir:
+        print("Error: --fem-degree solves in memory and cannot be combined with --scratch-dir.")
+        sys.exit(1)
+
+def run_pipeline(input_path, output_path, args):
+    """
+    Load -> cache hit, or normals -> reconstruct -> clean -> decimate -> save
+    for one input (None generates the synthetic sphere).
+    Returns (pcd, mesh).
+    """
+    from src.preprocess import load_point_cloud, estimate_normals
+    from src.postprocess import clean_mesh, filter_by_density
+    from src.utils import generate_sphere_point_cloud
+    from src.geometry import Mesh, write_mesh
+    from src.cache import ResultCache, cache_key, file_cache_key
+    from src.loader import PointStream
+
     # 1. Input
-    if args.input:
-        if not os.path.exists(args.input):
-            print(f"Error: Input file {args.input} does not exist.")
-            sys.exit(1)
-        pcd = load_point_cloud(args.input)
+    if args.stream:
+        # Only the header is read here; the solver streams the points
+        pcd = PointStream(input_path, chunk_size=args.chunk_size)
+    elif input_path:
+        pcd = load_point_cloud(input_path)
     else:
         print("No input provided. Generating synthetic sphere...")
         pcd = generate_sphere_point_cloud(noise_std=0.02)
         
-    # 2. Preprocess
-    pcd = estimate_normals(pcd)
-    
-    # 3. Reconstruction
-    if args.manual:
-        from src.reconstruction import run_poisson_manual
-        mesh, densities = run_poisson_manual(pcd, depth=args.depth, scale=args.scale)
+    # 2. Cached result for the same input and parameters, looked up before
+    # the normal estimation so a hit skips it as well
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_size_mb)
+    cached = None
+    if cache is not None:
+        params = reconstruction_params(args)
+        if args.stream:
+            key = file_cache_key(input_path, **params)
+        elif pcd.has_normals():
+            key = cache_key(np.asarray(pcd.points), np.asarray(pcd.normals), **params)
+        else:
+            key = cache_key(np.asarray(pcd.points), None, **params, **normal_params(args))
+        cached = cache.get(key)
+
+    if cached is not None:
+        print(f"Cache hit ({key[:12]}), skipping normal estimation and reconstruction.")
+        mesh, densities = mesh_from_arrays(cached), cached["densities"]
+        lods = lods_from_arrays(cached)
     else:
-        mesh, densities = run_poisson(pcd, depth=args.depth, scale=args.scale)
+        # 3. Preprocess + reconstruction
+        if not args.stream:
+            pcd = estimate_normals(pcd, method=args.normals, orient=args.orient, viewpoint=args.viewpoint)
+        with metrics.stage("reconstruct", method=method_name(args), octree_depth=args.depth):
+            mesh, densities, lods = reconstruct(pcd, args)
+        if cache is not None:
+            cache.put(key, **mesh_to_arrays(mesh, densities), **lods_to_arrays(lods))
     
-    # 4. Post-process
+    # 4. Post-process (trim low-density surface first, while densities still match the vertices)
+    mesh = filter_by_density(mesh, densities, quantile=args.density_quantile)
     mesh = clean_mesh(mesh)
     
     # 5. Decimate (optional)
     if args.decimate and len(mesh.triangles) > args.decimate:
         print(f"Decimating mesh from {len(mesh.triangles)} to {args.decimate} triangles...")
-        mesh = mesh.simplify_quadric_decimation(args.decimate)
-        mesh.compute_vertex_normals()
+        with metrics.stage("decimate", target=args.decimate) as s:
+            # Open3D's quadric decimation (the only step of a manual run that imports it)
+            if isinstance(mesh, Mesh):
+                mesh = mesh.to_open3d()
+            mesh = mesh.simplify_quadric_decimation(args.decimate)
+            mesh.compute_vertex_normals()
+            s["vertices"] = len(mesh.vertices)
+            s["triangles"] = len(mesh.triangles)
         print(f"After decimation: {len(mesh.vertices)} vertices, {len(mesh.triangles)} triangles.")
     
     # 5. Save
     print(f"Saving mesh to {output_path}...")
-    o3d.io.write_triangle_mesh(output_path, mesh)
-    
-    # 6. Visualize
-    if args.visualize:
-        print("Visualizing (Input Point Cloud + Reconstructed Mesh)...")
-        bbox = pcd.get_axis_aligned_bounding_box()
-        extent = bbox.get_extent()
-        mesh_translated = o3d.geometry.TriangleMesh(mesh)
-        mesh_translated.translate((extent[0] * 1.5, 0, 0))
-        
-        visualize([pcd, mesh_translated], window_name="Result")
+    with metrics.stage("save"):
+        write_mesh(output_path, mesh)
+
+    # 6. Coarser levels of detail (trimmed and cleaned like the full mesh, not decimated)
+    stem = os.path.splitext(output_path)[0]
+    for k, (lod_mesh, lod_densities) in enumerate(lods, 1):
+        lod_mesh = filter_by_density(lod_mesh, lod_densities, quantile=args.density_quantile)
+        lod_mesh = clean_mesh(lod_mesh)
+        lod_path = f"{stem}_lod{k}.ply"
+        print(f"Saving LOD {k} ({len(lod_mesh.triangles)} triangles) to {lod_path}...")
+        with metrics.stage("save", lod=k):
+            write_mesh(lod_path, lod_mesh)
+
+    return pcd, mesh
+
+def run_batch_mode(args):
+    """Reconstructs every file matched by --batch in a process pool and writes a manifest."""
+    inputs = find_inputs(args.batch)
+    if not inputs:
+        print(f"Error: no point clouds found for --batch {args.batch}")
+        sys.exit(1)
+
+    out_dir = args.output or os.path.join("data", "batch")
+    os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
+    budget_mb = args.batch_workers * args.worker_memory_mb
+
+    # Name outputs by the path below the glob root, so scans/a/scan.ply and
+    # scans/b/scan.ply do not write to the same mesh and log
+    root = input_root(args.batch)
+    names = {}
+    for path in inputs:
+        stem = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, "_")
+        names.setdefault(output_name(path, args, stem), []).append(path)
+    collisions = {name: paths for name, paths in names.items() if len(paths) > 1}
+    if collisions:
+        for name, paths in collisions.items():
+            print(f"Error: {', '.join(paths)} would all be written to {name}")
+        sys.exit(1)
+
+    jobs = []
+    for name, (path,) in names.items():
+        jobs.append({
+            "input": path,
+            "output": os.path.join(out_dir, name),
+            "log": os.path.join(out_dir, "logs", os.path.splitext(name)[0] + ".log"),
+            "estimated_mb": estimate_job_mb(path, method_name(args), args.depth, args.matrix_free, args.precision),
+        })
+    for job in jobs:
+        if job["estimated_mb"] > budget_mb:
+            print(f"  Warning: {job['input']} needs ~{job['estimated_mb']:.0f} MB, over the {budget_mb} MB budget; it will run alone.")
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    print(f"Batch: {len(jobs)} files, {args.batch_workers} workers, {budget_mb} MB budget...")
+    results = run_batch(functools.partial(batch_job, args=args), jobs, args.batch_workers, budget_mb, manifest_path)
+
+    failed = [r for r in results if r["status"] != "ok"]
+    print(f"Batch complete: {len(results) - len(failed)} ok, {len(failed)} failed. Manifest: {manifest_path}")
+    for r in failed:
+        print(f"  FAILED {r['input']}: {r['error']}")
+
+def batch_job(job, args):
+    """One batch file, run in a worker process. Pipeline output goes to job["log"]."""
+    metrics.enable()
+    metrics.reset()
+    with open(job["log"], "w") as log, contextlib.redirect_stdout(log):
+        try:
+            _, mesh = run_pipeline(job["input"], job["output"], args)
+        except Exception as e:
+            traceback.print_exc(file=log)
+            return {"status": "failed", "error": repr(e)}
+
+    stages = {r["stage"]: r["wall_time"] for r in metrics.get_records() if r["level"] == 0}
+    return {"status": "ok", "vertices": len(mesh.vertices), "triangles": len(mesh.triangles), "stages": stages}
+
+def output_name(input_path, args, input_name=None):
+    if input_name is None:
+        input_name = os.path.splitext(os.path.basename(input_path))[0] if input_path else "sphere"
+    return f"{input_name}_{method_name(args)}_d{args.depth}.ply"
+
+def method_name(args):
+    return "sparse" if args.sparse else "manual" if args.manual else "open3d"
+
+def reconstruction_params(args):
+    """Parameters that change the reconstructed mesh; part of the cache key."""
+    params = {"method": method_name(args), "depth": args.depth, "scale": args.scale, "alpha": 1e-5,
+              "version": CACHE_VERSION}
+    if args.manual or args.sparse:
+        params["screening"] = args.screening
+    if args.manual and not args.sparse:
+        params.update(solver=args.solver, cascade=args.cascade, precision=args.precision, fem_degree=args.fem_degree)
+    if args.lod:
+        params["lod"] = args.lod
+    if args.tiles:
+        params.update(tiles=args.tiles, tile_overlap=args.tile_overlap)
+    return params
+
+def normal_params(args):
+    """Normal estimation parameters; part of the cache key of an input without normals."""
+    return {"normal_method": args.normals, "orient": args.orient, "viewpoint": args.viewpoint}
+
+def mesh_to_arrays(mesh, densities):
+    return {
+        "vertices": np.asarray(mesh.vertices),
+        "triangles": np.asarray(mesh.triangles),
+        "vertex_normals": np.asarray(mesh.vertex_normals),
+        "densities": np.asarray(densities, dtype=np.float64),
+    }
+
+def mesh_from_arrays(arrays):
+    from src.geometry import Mesh
+    return Mesh(arrays["vertices"], arrays["triangles"], arrays["vertex_normals"])
+
+def lods_to_arrays(lods):
+    """mesh_to_arrays of every LOD (mesh, densities), with keys prefixed by lod{k}_."""
+    arrays = {}
+    for k, (mesh, densities) in enumerate(lods, 1):
+        arrays.update({f"lod{k}_{name}": a for name, a in mesh_to_arrays(mesh, densities).items()})
+    return arrays
+
+def lods_from_arrays(arrays):
+    lods = []
+    while f"lod{len(lods) + 1}_vertices" in arrays:
+        prefix = f"lod{len(lods) + 1}_"
+        lod = {name[len(prefix):]: a for name, a in arrays.items() if name.startswith(prefix)}
+        lods.append((mesh_from_arrays(lod), lod["densities"]))
+    return lods
+
+def backend_options(args):
+    """Keyword arguments of the selected backend, besides the point cloud and depth."""
+    if args.sparse:
+        return {"scale": args.scale, "workers": args.workers, "screening": args.screening}
+    if args.manual:
+        return {
+            "scale": args.scale, "matrix_free": args.matrix_free, "solver": args.solver,
+            "cascade": args.cascade, "workers": args.workers,
+            "scratch_dir": args.scratch_dir, "working_set_mb": args.working_set_mb,
+            "precision": args.precision, "screening": args.screening, "fem_degree": args.fem_degree,
+        }
+    return {"scale": args.scale}
+
+def reconstruct(pcd, args):
+    """
+    Runs the reconstruction backend selected by the command line flags.
+    Returns (mesh, densities, lods); lods is a list of coarser (mesh,
+    densities), empty without --lod.
+    """
+    from src.reconstruction import run_poisson, run_poisson_manual, run_poisson_sparse
+    if args.tiles:
+        from src.tiling import run_tiled
+        mesh, densities = run_tiled(pcd, method_name(args), args.depth, backend_options(args), tiles=args.tiles,
+                                    overlap=args.tile_overlap, workers=args.tile_workers,
+                                    budget_mb=args.tile_workers * args.worker_memory_mb)
+    elif args.sparse:
+        mesh, densities = run_poisson_sparse(pcd, depth=args.depth, **backend_options(args))
+    elif args.manual:
+        if args.lod:
+            return run_poisson_manual(pcd, depth=args.depth, lod=args.lod, **backend_options(args))
+        mesh, densities = run_poisson_manual(pcd, depth=args.depth, **backend_options(args))
+    else:
+        mesh, densities = run_poisson(pcd, depth=args.depth, **backend_options(args))
+    return mesh, densities, []
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+INPUT_EXTENSIONS = (".ply", ".pcd", ".xyz", ".xyzn", ".xyzrgb", ".pts")
+
+# Runs per job when a worker crash takes the pool down
+MAX_ATTEMPTS = 2
+
+# Interpreter, open3d and the loaded point cloud
+BASE_JOB_MB = 300
+
+def find_inputs(pattern):
+    """Point cloud files in a directory, or the files matching a glob pattern."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        paths = [p for p in paths if p.lower().endswith(INPUT_EXTENSIONS)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+def input_root(pattern):
+    """
+    Directory the files found by find_inputs(pattern) are named relative to:
+    the directory itself, or the glob's longest leading part without wildcards.
+    """
+    if os.path.isdir(pattern):
+        return pattern
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+def estimate_job_mb(path, method, depth, matrix_free=False, precision="float64"):
+    """
+    Rough peak memory of one reconstruction, used to schedule the batch.
+    The dense manual solve stores V, b, x and the CG work vectors for every
+    one of the res^3 voxels (plus ~7 matrix entries unless matrix-free); the
+    adaptive backends scale with the surface, i.e. res^2.
+    """
+    res = 2 ** depth
+    input_mb = os.path.getsize(path) / 2**20 if os.path.exists(path) else 0.0
+    base = BASE_JOB_MB + 4 * input_mb
+
+    if method == "manual":
+        itemsize = 8 if precision == "float64" else 4
+        per_voxel = 9 * itemsize + (0 if matrix_free else 7 * (itemsize + 4))
+        return base + res ** 3 * per_voxel / 2**20
+    # ~16 band nodes per res^2, a few hundred bytes each
+    return base + res ** 2 * 16 * 200 / 2**20
+
+def run_batch(job_fn, jobs, workers, budget_mb, manifest_path=None):
+    """
+    Runs job_fn(job) for every job dict in a process pool.
+
+    Jobs are admitted in order while the summed "estimated_mb" of the running
+    jobs stays within budget_mb (a job larger than the whole budget runs
+    alone), so a few high-depth jobs cannot exhaust memory together.
+    job_fn returns a result dict; exceptions and crashed workers are recorded
+    as failures (jobs running when a worker dies are retried once) and the
+    batch continues. The manifest is rewritten after every finished job.
+    """
+    results = []
+    queue = list(jobs)
+    running = {}
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while queue or running:
+            # Admit jobs that fit into the remaining budget
+            in_use = sum(job["estimated_mb"] for job in running.values())
+            while queue and len(running) < workers:
+                job = queue[0]
+                if running and in_use + job["estimated_mb"] > budget_mb:
+                    break
+                queue.pop(0)
+                job["start"] = time.perf_counter()
+                running[pool.submit(job_fn, job)] = job
+                in_use += job["estimated_mb"]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    broken = True
+                    continue
+                job = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"status": "failed", "error": repr(e)}
+                _finish(results, job, result, len(jobs), manifest_path)
+
+            if broken:
+                # A worker died (e.g. killed for memory) and took the pool down. We
+                # cannot tell which job did it, so every running job is retried
+                # once in a fresh pool; a job that breaks the pool twice fails.
+                retry = []
+                for job in running.values():
+                    job["attempts"] = job.get("attempts", 1) + 1
+                    if job["attempts"] <= MAX_ATTEMPTS:
+                        retry.append(job)
+                    else:
+                        _finish(results, job, {"status": "failed", "error": "worker process died (out of memory?)"},
+                                len(jobs), manifest_path)
+                queue = retry + queue
+                running.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        pool.shutdown()
+
+    if manifest_path:
+        write_manifest(manifest_path, results)
+    return results
+
+def _finish(results, job, result, total, manifest_path):
+    result = dict(job, **result)
+    result["wall_time"] = time.perf_counter() - result.pop("start")
+    results.append(result)
+    print(f"  [{len(results)}/{total}] {job['input']}: {result['status']} ({result['wall_time']:.1f} s)")
+    if manifest_path:
+        write_manifest(manifest_path, results)
+
+def write_manifest(path, results):
+    summary = {
+        "total": len(results),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] != "ok" for r in results),
+    }
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "jobs": results}, f, indent=2)
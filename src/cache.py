@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+def cache_key(points, normals, **params):
+    """
+    Content hash of a reconstruction input: the point and normal arrays plus
+    every parameter that changes the result (depth, scale, alpha, backend, ...).
+    normals=None stands for an input without normals.
+    """
+    h = hashlib.sha256()
+    for arr in (points, normals):
+        if arr is None:
+            h.update(b"None")
+            continue
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def file_cache_key(path, **params):
+    """cache_key for an input that is streamed from disk: hashes the file bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            h.update(block)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    On-disk cache of reconstruction results, one compressed .npz per key.
+    Entries are evicted least-recently-used first (by file mtime, which get()
+    refreshes) once the directory exceeds max_size_mb.
+    """
+    def __init__(self, cache_dir, max_size_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Returns a dict of arrays, or None on a miss. Corrupt entries are deleted."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # Truncated or corrupt entry
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process (batch workers share the directory) after we read it
+            pass
+        return arrays
+
+    def put(self, key, **arrays):
+        """Stores arrays under key, then evicts old entries over the size limit."""
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Deletes least-recently-used entries until the cache fits max_size_mb.
+        Entries that another process removes meanwhile are skipped.
+        """
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size_mb * 2**20
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            if path == self._path(keep):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,192 @@
+"""
+NumPy stand-ins for the Open3D geometry types the pipeline uses.
+
+The manual backends return a Mesh and main.py writes it with write_ply, so a
+manual run never imports open3d. PointCloud and Mesh keep their data in plain
+arrays and implement the subset of the open3d.geometry API that the pipeline
+calls (has_normals, the remove_* cleanups, compute_vertex_normals), so the
+post-processing code works on either type. to_open3d converts for the steps
+that only Open3D provides: its normal estimation, Poisson backend,
+decimation and visualization.
+"""
+import numpy as np
+
+class PointCloud:
+    """Points and (optional) normals as (N, 3) float64 arrays."""
+    def __init__(self, points=None, normals=None):
+        self.points = np.zeros((0, 3)) if points is None else np.asarray(points, dtype=np.float64)
+        self.normals = np.zeros((0, 3)) if normals is None else np.asarray(normals, dtype=np.float64)
+
+    def has_points(self):
+        return len(self.points) > 0
+
+    def has_normals(self):
+        return len(self.normals) > 0 and len(self.normals) == len(self.points)
+
+    def to_open3d(self):
+        import open3d as o3d
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(self.points)
+        if self.has_normals():
+            pcd.normals = o3d.utility.Vector3dVector(self.normals)
+        return pcd
+
+class Mesh:
+    """
+    Triangle mesh as arrays: vertices (N, 3) float64, triangles (M, 3) int32
+    and vertex_normals (N, 3) or empty.
+    """
+    def __init__(self, vertices=None, triangles=None, vertex_normals=None):
+        self.vertices = np.zeros((0, 3)) if vertices is None else np.asarray(vertices, dtype=np.float64)
+        self.triangles = (np.zeros((0, 3), dtype=np.int32) if triangles is None
+                          else np.asarray(triangles, dtype=np.int32).reshape(-1, 3))
+        self.vertex_normals = (np.zeros((0, 3)) if vertex_normals is None
+                               else np.asarray(vertex_normals, dtype=np.float64))
+
+    def has_vertex_normals(self):
+        return len(self.vertex_normals) > 0 and len(self.vertex_normals) == len(self.vertices)
+
+    def compute_vertex_normals(self):
+        """Area-weighted sum of the adjacent face normals, normalized."""
+        tri = self.vertices[self.triangles]
+        face_normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        normals = np.zeros_like(self.vertices)
+        for corner in range(3):
+            np.add.at(normals, self.triangles[:, corner], face_normals)
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        self.vertex_normals = normals / np.where(length > 0, length, 1)
+        return self
+
+    def remove_vertices_by_mask(self, mask):
+        """Removes the masked vertices and every triangle that uses one."""
+        self._keep_vertices(~np.asarray(mask, dtype=bool))
+        return self
+
+    def remove_degenerate_triangles(self):
+        """Removes triangles that use a vertex twice."""
+        t = self.triangles
+        self.triangles = t[(t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) & (t[:, 0] != t[:, 2])]
+        return self
+
+    def remove_duplicated_triangles(self):
+        """Keeps the first of the triangles with the same vertex set (any winding)."""
+        if len(self.triangles):
+            order, start = _group_rows(np.sort(self.triangles, axis=1))
+            self.triangles = self.triangles[np.sort(order[start])]
+        return self
+
+    def remove_duplicated_vertices(self):
+        """Merges vertices with identical coordinates into their first occurrence."""
+        if len(self.vertices) == 0:
+            return self
+        order, start = _group_rows(self.vertices)
+        # Groups are numbered in the order of their first vertex, so the original order is kept
+        first = order[start]
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[np.argsort(first)] = np.arange(len(first))
+        inverse = np.empty(len(order), dtype=np.int64)
+        inverse[order] = rank[np.cumsum(start) - 1]
+        keep = np.sort(first)
+        self.triangles = inverse[self.triangles].astype(np.int32)
+        self.vertices = self.vertices[keep]
+        if len(self.vertex_normals):
+            self.vertex_normals = self.vertex_normals[keep]
+        return self
+
+    def remove_non_manifold_edges(self):
+        """
+        Removes triangles until every edge is shared by at most two: on an
+        over-used edge, the two largest triangles are kept.
+        """
+        while len(self.triangles):
+            t = self.triangles
+            edges = np.sort(np.concatenate([t[:, [0, 1]], t[:, [1, 2]], t[:, [2, 0]]]), axis=1).astype(np.int64)
+            _, edge_id, counts = np.unique(edges[:, 0] * len(self.vertices) + edges[:, 1],
+                                           return_inverse=True, return_counts=True)
+            if counts.max() <= 2:
+                break
+            tri = self.vertices[t]
+            area = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1)
+            owner = np.tile(np.arange(len(t)), 3)
+
+            # Rank the triangles on each over-used edge by decreasing area
+            over = counts[edge_id] > 2
+            edge_id, owner = edge_id[over], owner[over]
+            order = np.lexsort((-area[owner], edge_id))
+            edge_id, owner = edge_id[order], owner[order]
+            start = np.r_[True, edge_id[1:] != edge_id[:-1]]
+            first = np.maximum.accumulate(np.where(start, np.arange(len(edge_id)), 0))
+            drop = owner[np.arange(len(edge_id)) - first >= 2]
+
+            keep = np.ones(len(t), dtype=bool)
+            keep[drop] = False
+            self.triangles = t[keep]
+        return self
+
+    def remove_unreferenced_vertices(self):
+        used = np.zeros(len(self.vertices), dtype=bool)
+        used[self.triangles.ravel()] = True
+        self._keep_vertices(used)
+        return self
+
+    def _keep_vertices(self, keep):
+        """Keeps the vertices where keep is True and the triangles among them."""
+        remap = np.cumsum(keep) - 1
+        t = self.triangles
+        self.triangles = remap[t[keep[t].all(axis=1)]].astype(np.int32)
+        self.vertices = self.vertices[keep]
+        if len(self.vertex_normals):
+            self.vertex_normals = self.vertex_normals[keep]
+
+    def to_open3d(self):
+        import open3d as o3d
+        mesh = o3d.geometry.TriangleMesh()
+        mesh.vertices = o3d.utility.Vector3dVector(self.vertices)
+        mesh.triangles = o3d.utility.Vector3iVector(self.triangles)
+        if self.has_vertex_normals():
+            mesh.vertex_normals = o3d.utility.Vector3dVector(self.vertex_normals)
+        return mesh
+
+def _group_rows(rows):
+    """
+    Sorts equal rows next to each other (stable, so the first occurrence
+    leads its group). Returns (order, start): start marks the first row of
+    each group in sorted order.
+    """
+    order = np.lexsort(rows.T[::-1])
+    sorted_rows = rows[order]
+    start = np.r_[True, np.any(sorted_rows[1:] != sorted_rows[:-1], axis=1)]
+    return order, start
+
+def write_ply(path, mesh):
+    """
+    Writes a Mesh as binary little-endian PLY (double positions and normals,
+    like Open3D, and int32 triangle lists), one vectorized write per element.
+    """
+    normals = mesh.has_vertex_normals()
+    fields = ["x", "y", "z"] + (["nx", "ny", "nz"] if normals else [])
+    header = ["ply", "format binary_little_endian 1.0", f"element vertex {len(mesh.vertices)}"]
+    header += [f"property double {name}" for name in fields]
+    header += [f"element face {len(mesh.triangles)}", "property list uchar int vertex_indices", "end_header"]
+
+    vertex_data = mesh.vertices
+    if normals:
+        vertex_data = np.hstack([mesh.vertices, mesh.vertex_normals])
+    faces = np.empty(len(mesh.triangles), dtype=[("count", "u1"), ("indices", "<i4", (3,))])
+    faces["count"] = 3
+    faces["indices"] = mesh.triangles
+
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        f.write(np.ascontiguousarray(vertex_data, dtype="<f8").tobytes())
+        f.write(faces.tobytes())
+
+def write_mesh(path, mesh):
+    """Writes a Mesh to .ply with write_ply; other formats and Open3D meshes go through Open3D."""
+    if isinstance(mesh, Mesh) and path.lower().endswith(".ply"):
+        write_ply(path, mesh)
+        return True
+    import open3d as o3d
+    if isinstance(mesh, Mesh):
+        mesh = mesh.to_open3d()
+    return o3d.io.write_triangle_mesh(path, mesh)
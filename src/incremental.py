@@ -0,0 +1,303 @@
+"""
+Incremental dense reconstruction for scans that arrive in passes.
+
+An IncrementalSession keeps the splatted field V (and its weights W,
+block-summed for the vertex densities), the RHS b, the screening matrix and
+the last solution x. Each new pass is splatted on its own, and b is updated
+only at the nodes next to the new samples. The correction to x is solved in
+a window around those nodes, warm-started from the previous x. Marching cubes
+then runs again only in the bricks that the window overlaps, and vertex
+densities are resampled only in the bricks next to the new samples, so a
+local pass does no work over the whole grid.
+"""
+import time
+import numpy as np
+from scipy.sparse.linalg import LinearOperator, cg
+
+from .pysr.formulation import splat_delta_dense, divergence_delta_dense, apply_laplacian_dense, idx_to_coord
+from .pysr.formulation import build_screening_dense, screening_weight, density_blocks, sample_density_blocks
+from .pysr.multigrid import Multigrid
+from .pysr.solver import run_solver, SCREENING
+from .pysr.iso import march_dense_brick, weld_bricks
+from .reconstruction import _normalization, _to_mesh
+from .metrics import stage
+
+# Windows larger than this fraction of the grid are solved globally instead
+MAX_WINDOW_FRACTION = 0.5
+
+class IncrementalSession:
+    """
+    Dense screened Poisson reconstruction that can be extended with more
+    points.
+
+    The reconstruction cube is fixed when the session starts: pass
+    bounds=(bbox_min, bbox_max) of the whole capture if it is known. Without
+    it, the cube is fitted to the first pass (times scale), and later points
+    outside it are clamped to its border.
+
+    The per-sample screening weight (see formulation.screening_weight)
+    depends on the point count, so it changes the system on the whole
+    surface. Each pass recomputes it. The weight in use is kept while the new
+    one is within weight_tol of it, so a pass changes the system only next to
+    its own samples. Past that, the new weight is adopted and the pass is
+    solved globally. A session therefore stays within weight_tol of the
+    from-scratch weight; weight_tol=0 tracks it exactly.
+
+    Args:
+        depth: Grid depth (res = 2^depth).
+        solver: "cg" or "pcg-mg" for global solves (the first pass, large
+            windows, and every pass with margin=None).
+        screening: Must be > 0, so the surface stays at iso-value 0 (the
+            unscreened mean level would move with every pass).
+        margin: Voxels added around the nodes a pass touches to form its
+            solve window. Outside the window x keeps its previous value.
+            None solves every pass globally (warm-started, exact to rtol).
+        brick_size: Marching cubes brick size.
+        change_tol: A brick is re-extracted when x changed there by more than
+            change_tol * max|x|.
+        rtol: Residual tolerance of each solve, relative to |b|.
+        weight_tol: Allowed relative drift of the screening weight before it
+            is updated (with a global solve).
+    """
+    def __init__(self, depth=6, bounds=None, scale=1.1, alpha=1e-5, solver="cg", screening=SCREENING, margin=16,
+                 brick_size=16, change_tol=1e-4, rtol=1e-6, weight_tol=0.05):
+        if solver not in ("cg", "pcg-mg"):
+            raise ValueError(f"Unknown solver '{solver}' for incremental updates, expected cg or pcg-mg")
+        if screening <= 0:
+            raise ValueError("Incremental reconstruction needs screening > 0")
+
+        self.resolution = 2 ** depth
+        self.scale = scale
+        self.alpha = alpha
+        self.solver = solver
+        self.screening = screening
+        self.margin = margin
+        self.brick_size = brick_size
+        self.change_tol = change_tol
+        self.rtol = rtol
+        self.weight_tol = weight_tol
+
+        self.center = self.max_dim = None
+        if bounds is not None:
+            self.center, self.max_dim = _normalization(np.asarray(bounds[0]), np.asarray(bounds[1]), scale)
+
+        num_voxels = self.resolution ** 3
+        self.V = np.zeros((num_voxels, 3))
+        self.b = np.zeros(num_voxels)
+        self.x = np.zeros(num_voxels)
+        self.S = None
+        self.weight = None
+        self.num_points = 0
+        self.solved = False
+        # Upper bound of max|x|: exact after a global solve, a running maximum over local ones
+        self.x_max = 0.0
+
+        # W block-summed like formulation.support_density, updated with every pass
+        n, self.density_reduction = density_blocks(self.resolution)
+        self.W_blocks = np.zeros((n, n, n))
+
+        # Marching cubes result and vertex densities per brick origin (None: no
+        # surface), and their welded mesh (verts, faces, densities)
+        self.bricks = {}
+        self.brick_densities = {}
+        self.mesh = None
+        self.last_update = {}
+
+    def add_points(self, points, normals):
+        """
+        Adds a pass of samples (world coordinates) and updates the surface.
+        Returns (mesh, densities) like run_poisson_manual; details of the
+        update are in self.last_update.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        normals = np.asarray(normals, dtype=np.float64)
+        res = self.resolution
+        start = time.perf_counter()
+
+        if self.center is None:
+            self.center, self.max_dim = _normalization(points.min(axis=0), points.max(axis=0), self.scale)
+        normalized = (points - self.center) / self.max_dim + 0.5
+        clamped = np.count_nonzero(np.any((normalized < 0.05) | (normalized > 0.95), axis=1))
+        if clamped:
+            print(f"  Warning: {clamped} points lie outside the session's box and are clamped to it")
+        normalized = np.clip(normalized, 0.05, 0.95)
+
+        print(f"  [1/4] Splatting {len(points)} new points...")
+        with stage("splat", points=len(points), incremental=True) as s:
+            nodes, dV, dW = splat_delta_dense(normalized, normals, res)
+            self.V[nodes] += dV
+            blocks = np.minimum(np.stack(idx_to_coord(nodes, res), axis=1) // self.density_reduction,
+                                len(self.W_blocks) - 1)
+            np.add.at(self.W_blocks, tuple(blocks.T), dW)
+            targets, db = divergence_delta_dense(nodes, dV, res)
+            self.b[targets] += db
+            s["nodes"] = len(targets)
+
+        with stage("screening", incremental=True) as s:
+            S_new = build_screening_dense(normalized, res)
+            self.S = S_new if self.S is None else (self.S + S_new).tocsr()
+            self.num_points += len(points)
+            weight = screening_weight(self.S, self.num_points, self.screening)
+            reweighted = self.weight is None or abs(weight / self.weight - 1) > self.weight_tol
+            if reweighted:
+                self.weight = weight
+            S = self.weight * self.S
+            s["nonzeros"] = S.nnz
+            s["reweighted"] = reweighted
+
+        # Window around every node whose row of the system changed
+        coords = np.stack(idx_to_coord(targets, res), axis=1)
+        margin = res if self.margin is None else self.margin
+        lo = np.maximum(coords.min(axis=0) - margin, 0)
+        hi = np.minimum(coords.max(axis=0) + margin + 1, res)
+        local = np.prod(hi - lo) <= MAX_WINDOW_FRACTION * res ** 3 and self.solved and not reweighted
+        if reweighted and self.solved:
+            print(f"    Screening weight changed to {self.weight:.4g}, solving globally")
+
+        if local:
+            print(f"  [2/4] Solving the correction in a {'x'.join(str(n) for n in hi - lo)} window...")
+            with stage("solve", unknowns=int(np.prod(hi - lo)), solver="cg", incremental=True, local=True) as s:
+                e, info, iterations = self._solve_window(S, lo, hi)
+                s["iterations"] = iterations
+                s["converged"] = info == 0
+            box = tuple(slice(a, b) for a, b in zip(lo, hi))
+            self.x_max = max(self.x_max, float(np.abs(self.x.reshape((res, res, res))[box]).max()))
+            used_solver = "cg"
+        else:
+            lo, hi = np.zeros(3, dtype=int), np.full(3, res)
+            print(f"  [2/4] Solving ({res ** 3} unknowns, warm start from the previous pass)...")
+            with stage("solve", unknowns=res ** 3, solver=self.solver, incremental=True, local=False) as s:
+                def matvec(v):
+                    v = np.asarray(v, dtype=np.float64).ravel()
+                    return apply_laplacian_dense(v, res, self.alpha) + S @ v
+
+                A = LinearOperator((res ** 3, res ** 3), matvec=matvec, rmatvec=matvec, dtype=np.float64)
+                mg = Multigrid(res, self.alpha, screening=S) if self.solver == "pcg-mg" else None
+                x, info, iterations = run_solver(A, self.b, self.x, self.solver, mg, self.rtol)
+                s["iterations"] = iterations
+                s["converged"] = info == 0
+            e = (x - self.x).reshape((res, res, res))
+            self.x = x
+            self.x_max = float(np.abs(x).max())
+            used_solver = self.solver
+        self.solved = True
+        if info != 0:
+            print(f"    Warning: {used_solver} returned info={info} after {iterations} iterations")
+        else:
+            print(f"    Solver converged in {iterations} iterations.")
+
+        print("  [3/4] Re-extracting changed bricks...")
+        with stage("marching_cubes", incremental=True) as s:
+            remarched = self._update_bricks(np.abs(e), lo, hi)
+            # Densities change where the bricks were re-extracted, and within the
+            # trilinear reach of the blocks this pass added weight to
+            reduction = self.density_reduction
+            d_lo = np.maximum((blocks.min(axis=0) - 1) * reduction, 0)
+            d_hi = np.minimum((blocks.max(axis=0) + 3) * reduction, res)
+            resampled = self._update_densities(remarched, d_lo, d_hi)
+            if remarched or resampled or self.mesh is None:
+                origins = list(self.bricks)
+                self.mesh = weld_bricks([self.bricks[o] for o in origins], [self.brick_densities[o] for o in origins])
+            verts, faces, densities = self.mesh
+            s["bricks"] = len(remarched)
+            s["vertices"] = len(verts)
+
+        self.last_update = {
+            "points": len(points),
+            "total_points": self.num_points,
+            "touched_nodes": len(targets),
+            "window": [int(n) for n in hi - lo],
+            "local": bool(local),
+            "weight": self.weight,
+            "reweighted": bool(reweighted),
+            "iterations": iterations,
+            "bricks_remarched": len(remarched),
+            "bricks_resampled": resampled,
+            "bricks_total": self._num_bricks() ** 3,
+            "time": time.perf_counter() - start,
+        }
+        print(f"  [4/4] {len(remarched)} of {self._num_bricks() ** 3} bricks re-extracted, {len(verts)} vertices")
+
+        if len(verts) == 0:
+            return _to_mesh(np.empty((0, 3)), np.empty((0, 3), dtype=np.int64), self.center, self.max_dim), []
+        return _to_mesh(verts / (res - 1), faces, self.center, self.max_dim), densities
+
+    def _solve_window(self, S, lo, hi):
+        """
+        Solves A e = b - A x for the correction e inside the box [lo, hi), with
+        e = 0 outside it (Dirichlet), and adds it to x in place. Returns (e
+        shaped like the box, info, iterations). Only the window (plus a
+        one-voxel halo of x) is touched.
+        """
+        res = self.resolution
+        shape = tuple(int(n) for n in hi - lo)
+        axes = [np.arange(lo[d], hi[d]) for d in range(3)]
+        window = ((axes[0][:, None, None] * res + axes[1][None, :, None]) * res + axes[2][None, None, :]).ravel()
+
+        # Residual of the previous x on the window: the stencil needs a halo
+        h_lo, h_hi = np.maximum(lo - 1, 0), np.minimum(hi + 1, res)
+        x3 = self.x.reshape((res, res, res))
+        halo = np.ascontiguousarray(x3[h_lo[0]:h_hi[0], h_lo[1]:h_hi[1], h_lo[2]:h_hi[2]])
+        Ax = apply_laplacian_dense(halo.ravel(), tuple(int(n) for n in h_hi - h_lo), self.alpha)
+        Ax = Ax.reshape(halo.shape)[tuple(slice(a, a + n) for a, n in zip(lo - h_lo, shape))]
+        S_rows = S[window]
+        r = self.b[window] - Ax.ravel() - S_rows @ self.x
+
+        S_window = S_rows[:, window]
+        def matvec(v):
+            v = np.asarray(v, dtype=np.float64).ravel()
+            return apply_laplacian_dense(v, shape, self.alpha) + S_window @ v
+
+        A = LinearOperator((len(window), len(window)), matvec=matvec, rmatvec=matvec, dtype=np.float64)
+        iterations = 0
+        def count(xk):
+            nonlocal iterations
+            iterations += 1
+        e, info = cg(A, r, rtol=0.0, atol=self.rtol * np.linalg.norm(self.b), maxiter=1000, callback=count)
+
+        self.x[window] += e
+        return e.reshape(shape), info, iterations
+
+    def _num_bricks(self):
+        return (self.resolution - 2) // self.brick_size + 1
+
+    def _brick_origins(self, lo, hi):
+        """Origins of the bricks overlapping the box [lo, hi) of grid nodes."""
+        res, size = self.resolution, self.brick_size
+        # Brick origins are multiples of size; brick o spans nodes o .. o + size
+        first = np.maximum((lo - 1) // size, 0) * size
+        for ox in range(first[0], min(hi[0], res - 1), size):
+            for oy in range(first[1], min(hi[1], res - 1), size):
+                for oz in range(first[2], min(hi[2], res - 1), size):
+                    yield ox, oy, oz
+
+    def _update_bricks(self, change, lo, hi):
+        """
+        Re-runs marching cubes in the bricks overlapping the box [lo, hi)
+        where x moved by more than change_tol * max|x|. change holds |dx| on
+        the box (dx is 0 outside it). Returns the re-extracted origins.
+        """
+        res, size = self.resolution, self.brick_size
+        volume = self.x.reshape((res, res, res))
+        threshold = self.change_tol * self.x_max
+
+        remarched = []
+        for origin in self._brick_origins(lo, hi):
+            block = change[tuple(slice(max(o - l, 0), max(o + size + 1 - l, 0)) for o, l in zip(origin, lo))]
+            if origin in self.bricks and (block.size == 0 or block.max() <= threshold):
+                continue
+            self.bricks[origin] = march_dense_brick(volume, origin, size, 0.0)
+            remarched.append(origin)
+        return remarched
+
+    def _update_densities(self, remarched, lo, hi):
+        """
+        Resamples the vertex densities of the re-extracted bricks and of the
+        bricks overlapping the box [lo, hi) where W changed. Returns the count.
+        """
+        stale = set(remarched) | {o for o in self._brick_origins(lo, hi) if o in self.bricks}
+        for origin in stale:
+            result = self.bricks[origin]
+            self.brick_densities[origin] = None if result is None else \
+                sample_density_blocks(self.W_blocks, self.resolution, result[1] / (self.resolution - 1))
+        return len(stale)
@@ -0,0 +1,160 @@
+"""
+NumPy-native streaming point cloud reader.
+
+Binary PLY vertex blocks are memory-mapped and ASCII files (PLY, XYZ/XYZN)
+are parsed in chunks, so a cloud is never held in memory as a whole: the
+reconstruction makes one pass for the bounding box and one pass per solve
+that splats normalized chunks directly into the grid.
+"""
+import itertools
+import os
+import numpy as np
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+class PointStream:
+    """
+    Chunked reader for .ply (binary little/big endian or ASCII), .xyz,
+    .xyzn and .xyzrgb files.
+
+    Iterating yields (points, normals) chunks of at most chunk_size rows in the
+    file's own dtype; normals is None when the file has none. The stream can
+    be iterated any number of times.
+    """
+    def __init__(self, path, chunk_size=1_000_000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.num_points = None
+        ext = os.path.splitext(path)[1].lower()
+
+        if ext == ".ply":
+            self._read_ply_header()
+        elif ext in (".xyz", ".xyzn", ".xyzrgb"):
+            self.format = "ascii"
+            self.header_lines = 0
+            # open3d's conventions: only .xyzn carries normals
+            self.columns = {"x": 0, "y": 1, "z": 2}
+            if ext == ".xyzn":
+                self.columns.update(nx=3, ny=4, nz=5)
+        else:
+            raise ValueError(f"Unsupported point cloud format for streaming: {path}")
+
+        self.has_normals = all(n in self.columns for n in ("nx", "ny", "nz"))
+
+    def _read_ply_header(self):
+        with open(self.path, "rb") as f:
+            if f.readline().strip() != b"ply":
+                raise ValueError(f"{self.path} is not a PLY file")
+
+            fmt = None
+            element = None
+            vertex_props = []
+            elements_before_vertex = False
+            lines = 1
+            while True:
+                line = f.readline()
+                if not line:
+                    raise ValueError(f"{self.path}: PLY header has no end_header")
+                lines += 1
+                tokens = line.decode("ascii").split()
+                if not tokens or tokens[0] in ("comment", "obj_info"):
+                    continue
+                if tokens[0] == "end_header":
+                    break
+                if tokens[0] == "format":
+                    fmt = tokens[1]
+                elif tokens[0] == "element":
+                    element = tokens[1]
+                    if element == "vertex":
+                        self.num_points = int(tokens[2])
+                    elif self.num_points is None and int(tokens[2]) > 0:
+                        elements_before_vertex = True
+                elif tokens[0] == "property" and element == "vertex":
+                    if tokens[1] == "list":
+                        raise ValueError(f"{self.path}: list properties on vertices are not supported")
+                    vertex_props.append((tokens[2], PLY_TYPES[tokens[1]]))
+            data_offset = f.tell()
+
+        if self.num_points is None:
+            raise ValueError(f"{self.path}: PLY file has no vertex element")
+        if elements_before_vertex:
+            raise ValueError(f"{self.path}: the vertex element must come first for streaming")
+
+        names = [name for name, _ in vertex_props]
+        if fmt == "ascii":
+            self.format = "ascii"
+            self.header_lines = lines
+            self.columns = {name: i for i, name in enumerate(names)}
+        elif fmt in ("binary_little_endian", "binary_big_endian"):
+            self.format = "binary"
+            order = "<" if fmt == "binary_little_endian" else ">"
+            self.dtype = np.dtype([(name, order + t) for name, t in vertex_props])
+            self.data_offset = data_offset
+            self.columns = {name: name for name in names}
+        else:
+            raise ValueError(f"{self.path}: unknown PLY format '{fmt}'")
+
+        missing = [name for name in ("x", "y", "z") if name not in self.columns]
+        if missing:
+            raise ValueError(f"{self.path}: PLY vertex element has no {'/'.join(missing)} property")
+
+    def __iter__(self):
+        if self.format == "binary":
+            return self._iter_binary()
+        return self._iter_ascii()
+
+    def _iter_binary(self):
+        if self.num_points == 0:
+            return
+        vertices = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.data_offset, shape=(self.num_points,))
+        for start in range(0, self.num_points, self.chunk_size):
+            block = vertices[start:start + self.chunk_size]
+            points = np.stack([block["x"], block["y"], block["z"]], axis=1)
+            normals = np.stack([block["nx"], block["ny"], block["nz"]], axis=1) if self.has_normals else None
+            yield points, normals
+
+    def _iter_ascii(self):
+        cols = [self.columns[c] for c in ("x", "y", "z")]
+        if self.has_normals:
+            cols += [self.columns[c] for c in ("nx", "ny", "nz")]
+
+        with open(self.path) as f:
+            lines = itertools.islice(f, self.header_lines, None)
+            if self.num_points is not None:
+                lines = itertools.islice(lines, self.num_points)
+            while True:
+                chunk = list(itertools.islice(lines, self.chunk_size))
+                if not chunk:
+                    break
+                data = np.loadtxt(chunk, usecols=cols, ndmin=2)
+                if len(data) == 0:
+                    continue
+                yield data[:, :3], (data[:, 3:6] if self.has_normals else None)
+
+    def bounding_box(self):
+        """(min, max) corners in one streaming pass. Also sets num_points."""
+        lo = np.full(3, np.inf)
+        hi = np.full(3, -np.inf)
+        count = 0
+        for points, _ in self:
+            lo = np.minimum(lo, points.min(axis=0))
+            hi = np.maximum(hi, points.max(axis=0))
+            count += len(points)
+        if count == 0:
+            raise ValueError(f"No points in {self.path}")
+        self.num_points = count
+        return lo, hi
+
+def normalized_chunks(stream, center, max_dim):
+    """
+    Yields (points, normals) chunks mapped into [0.05, 0.95]^3 like
+    reconstruction._normalize_points, one chunk at a time.
+    """
+    for points, normals in stream:
+        normalized = (points - center) / max_dim + 0.5
+        yield np.clip(normalized, 0.05, 0.95), normals
@@ -0,0 +1,162 @@
+"""
+Lightweight stage instrumentation.
+
+Pipeline code wraps each stage in `with stage("name") as s:` and attaches
+counters with `s["vertices"] = n`. Every finished stage records its wall time,
+the process peak RSS and (optionally) the tracemalloc peak inside the stage,
+and is passed to the registered listeners. A record's nesting level (0 for
+a top-level stage) is stored under "level". Fields may not use the record's
+own keys (RESERVED_FIELDS); stage() and s[...] raise ValueError for them.
+
+While nothing is enabled and no listener is registered, `stage()` returns a
+shared no-op object, so instrumented code pays one function call per stage.
+"""
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+# Keys of every record, set by the stage itself
+RESERVED_FIELDS = frozenset(("stage", "wall_time", "peak_rss_mb", "peak_traced_mb", "level", "error"))
+
+_enabled = False
+_trace_memory = False
+_listeners = []
+_records = []
+_stack = []
+
+def enable(trace_memory=False):
+    """Starts recording stages. trace_memory adds tracemalloc peaks (slower)."""
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+def is_enabled():
+    return _enabled or bool(_listeners)
+
+def add_listener(callback):
+    """
+    Registers callback(event) for stage events. event is a dict with
+    "event" ("stage_start" or "stage_end"), "stage" (slash-separated path)
+    and, on stage_end, the recorded metrics.
+    """
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+def get_records():
+    """Finished stage records, in completion order."""
+    return list(_records)
+
+def reset():
+    _records.clear()
+
+def write_json(path):
+    with open(path, "w") as f:
+        json.dump({"stages": _records}, f, indent=2)
+
+def print_summary():
+    """Prints one line per recorded stage."""
+    traced = any("peak_traced_mb" in rec for rec in _records)
+    header = f"{'stage':<40} {'time [s]':>9} {'peak RSS [MB]':>14}"
+    print(header + (f" {'traced [MB]':>12}" if traced else "") + "  counters")
+    for rec in _records:
+        counters = {k: v for k, v in rec.items() if k not in RESERVED_FIELDS}
+        extra = ", ".join(f"{k}={v}" for k, v in counters.items())
+        line = f"{'  ' * rec['level'] + rec['stage'].rsplit('/', 1)[-1]:<40} {rec['wall_time']:>9.3f} {rec['peak_rss_mb']:>14.1f}"
+        if traced:
+            line += f" {rec.get('peak_traced_mb', 0.0):>12.1f}"
+        print(line + "  " + extra)
+
+def stage(name, **fields):
+    """Context manager for one pipeline stage; see module docstring."""
+    _check_fields(fields)
+    if not (_enabled or _listeners):
+        return _NULL_STAGE
+    return _Stage(name, fields)
+
+def _check_fields(fields):
+    reserved = RESERVED_FIELDS.intersection(fields)
+    if reserved:
+        raise ValueError(f"Stage fields {sorted(reserved)} are reserved for the record itself")
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+def _emit(event):
+    for callback in _listeners:
+        callback(event)
+
+class _Stage:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+        self.path = None
+        self.start = None
+        self.child_peak = 0
+
+    def __setitem__(self, key, value):
+        _check_fields((key,))
+        self.fields[key] = value
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __enter__(self):
+        self.path = "/".join([s.name for s in _stack] + [self.name])
+        if _trace_memory:
+            # Fold the parent's peak so far before resetting for this stage
+            if _stack:
+                _stack[-1].child_peak = max(_stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        _stack.append(self)
+        _emit({"event": "stage_start", "stage": self.path})
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _stack.pop()
+
+        rec = {"stage": self.path, "wall_time": elapsed, "peak_rss_mb": _peak_rss_mb()}
+        if _trace_memory:
+            peak = max(self.child_peak, tracemalloc.get_traced_memory()[1])
+            rec["peak_traced_mb"] = peak / 2**20
+            if _stack:
+                _stack[-1].child_peak = max(_stack[-1].child_peak, peak)
+        if exc_type is not None:
+            rec["error"] = repr(exc)
+        rec.update(self.fields)
+        rec["level"] = len(_stack)
+
+        if _enabled:
+            _records.append(rec)
+        _emit(dict(rec, event="stage_end"))
+        return False
+
+class _NullStage:
+    """Shared no-op stage used while instrumentation is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setitem__(self, key, value):
+        # Reserved keys fail here too, not only once metrics are enabled
+        _check_fields((key,))
+
+_NULL_STAGE = _NullStage()
@@ -1,14 +1,16 @@
-import open3d as o3d
 import numpy as np
-import matplotlib.pyplot as plt
+from .metrics import stage
 
 def clean_mesh(mesh):
     """Removes degenerate triangles, duplicated vertices, etc."""
     print("Cleaning mesh...")
-    mesh.remove_degenerate_triangles()
-    mesh.remove_duplicated_triangles()
-    mesh.remove_duplicated_vertices()
-    mesh.remove_non_manifold_edges()
+    with stage("clean") as s:
+        mesh.remove_degenerate_triangles()
+        mesh.remove_duplicated_triangles()
+        mesh.remove_duplicated_vertices()
+        mesh.remove_non_manifold_edges()
+        s["vertices"] = len(mesh.vertices)
+        s["triangles"] = len(mesh.triangles)
     print(f"Cleaned mesh has {len(mesh.vertices)} vertices and {len(mesh.triangles)} triangles.")
     return mesh
 
@@ -27,9 +29,12 @@ def filter_by_density(mesh, densities, quantile=0.01):
         print("No densities provided, skipping density filter.")
         return mesh
 
-    density_threshold = np.quantile(densities, quantile)
-    vertices_to_remove = densities < density_threshold
-    
-    mesh.remove_vertices_by_mask(vertices_to_remove)
+    with stage("density_filter", quantile=quantile) as s:
+        density_threshold = np.quantile(densities, quantile)
+        vertices_to_remove = densities < density_threshold
+        
+        mesh.remove_vertices_by_mask(vertices_to_remove)
+        s["vertices"] = len(mesh.vertices)
+        s["triangles"] = len(mesh.triangles)
     print(f"Filtered mesh has {len(mesh.vertices)} vertices and {len(mesh.triangles)} triangles.")
     return mesh
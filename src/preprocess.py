@@ -1,22 +1,208 @@
-import open3d as o3d
 import numpy as np
+from .metrics import stage
+from .loader import PointStream
+from .geometry import PointCloud
+
+# scipy is imported in the functions that use it, so main.py can take the
+# choice lists below for its argument parser without loading it
+
+# Normal estimation and orientation methods of estimate_normals
+NORMAL_METHODS = ("open3d", "pca")
+ORIENTATIONS = ("tangent-plane", "propagate", "centroid", "viewpoint", "none")
 
 def load_point_cloud(path):
-    """Loads a point cloud from a file."""
+    """
+    Loads a point cloud from a file. PLY/XYZ/XYZN are read with the NumPy
+    PointStream into a geometry.PointCloud; other formats (or PLY files it
+    does not handle) go through Open3D.
+    """
     print(f"Loading point cloud from {path}...")
-    pcd = o3d.io.read_point_cloud(path)
+    with stage("load") as s:
+        # Files the NumPy reader cannot parse (header or body) fall back to Open3D
+        try:
+            stream = PointStream(path)
+            chunks = list(stream)
+        except (ValueError, KeyError):
+            stream = None
+        if stream is not None:
+            points = np.concatenate([p for p, _ in chunks]) if chunks else np.zeros((0, 3))
+            normals = np.concatenate([n for _, n in chunks]) if chunks and stream.has_normals else None
+            pcd = PointCloud(points, normals)
+        else:
+            import open3d as o3d
+            pcd = o3d.io.read_point_cloud(path)
+        s["points"] = len(pcd.points)
     if not pcd.has_points():
         raise ValueError(f"Could not load point cloud from {path}")
     print(f"Loaded {len(pcd.points)} points.")
     return pcd
 
-def estimate_normals(pcd, k_nn=30):
-    """Estimates normals if they are missing."""
-    if not pcd.has_normals():
-        print("Estimating normals...")
-        pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=k_nn))
-        # Orient the normals to a consistent direction (MST usually good for single view or closed shapes)
-        pcd.orient_normals_consistent_tangent_plane(k_nn)
-    else:
+# Neighbourhood radius as a fraction of the bounding box diagonal
+# (0.1 for the unit-radius test sphere)
+RADIUS_FRACTION = 0.03
+
+# Points per batch of kNN queries / covariance solves
+NORMAL_BATCH = 200_000
+
+def estimate_normals(pcd, k_nn=30, method="open3d", orient="tangent-plane", viewpoint=None, workers=-1):
+    """
+    Estimates normals if they are missing.
+
+    Args:
+        k_nn: Neighbours per point.
+        method: "open3d" (KDTreeSearchParamHybrid) or "pca" (batched PCA over
+            one scipy cKDTree, see pca_normals).
+        orient: "tangent-plane" (Open3D's global MST, slow on large clouds),
+            "propagate" (MST over the kNN graph in scipy, see orient_normals),
+            "centroid" (point away from the centroid, closed shapes),
+            "viewpoint" (point towards `viewpoint`, single scans) or "none".
+        workers: Threads for the kNN queries (-1 = all cores).
+    The neighbourhood radius is RADIUS_FRACTION of the bounding box diagonal.
+    A geometry.PointCloud is converted to Open3D only for the "open3d"
+    method or the "tangent-plane" orientation.
+    """
+    if pcd.has_normals():
         print("Point cloud already has normals.")
+        return pcd
+    if isinstance(pcd, PointCloud) and (method == "open3d" or orient == "tangent-plane"):
+        result = estimate_normals(pcd.to_open3d(), k_nn, method, orient, viewpoint, workers)
+        pcd.normals = np.asarray(result.normals)
+        return pcd
+
+    points = np.asarray(pcd.points)
+    radius = RADIUS_FRACTION * np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+    print(f"Estimating normals (method={method}, orient={orient}, radius={radius:.4g}, k={k_nn})...")
+
+    neighbors = None
+    with stage("normals", points=len(points), method=method):
+        if method == "open3d":
+            import open3d as o3d
+            pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=radius, max_nn=k_nn))
+            normals = np.asarray(pcd.normals)
+        else:
+            normals, neighbors = pca_normals(points, k_nn, radius, workers)
+
+    with stage("orient", method=orient):
+        if orient == "tangent-plane":
+            import open3d as o3d
+            if method != "open3d":
+                pcd.normals = o3d.utility.Vector3dVector(normals)
+            # Orient the normals to a consistent direction (MST usually good for single view or closed shapes)
+            pcd.orient_normals_consistent_tangent_plane(k_nn)
+            return pcd
+        normals = orient_normals(points, normals, orient, viewpoint=viewpoint, neighbors=neighbors, workers=workers)
+
+    if isinstance(pcd, PointCloud):
+        pcd.normals = normals
+    else:
+        import open3d as o3d
+        pcd.normals = o3d.utility.Vector3dVector(normals)
     return pcd
+
+def pca_normals(points, k_nn=30, radius=None, workers=-1, orient_k=8):
+    """
+    Normals as the smallest-eigenvalue eigenvector of each point's
+    neighbourhood covariance, computed in batches over one cKDTree.
+    Neighbours farther than radius are dropped (the 3 nearest are always kept).
+    Returns: (normals (N, 3), neighbors (N, orient_k) kNN indices for
+    orient_normals).
+    """
+    from scipy.spatial import cKDTree
+    tree = cKDTree(points)
+    k = min(k_nn, len(points))
+    normals = np.empty((len(points), 3))
+    neighbors = np.empty((len(points), min(orient_k, k)), dtype=np.int64)
+
+    for start in range(0, len(points), NORMAL_BATCH):
+        batch = points[start:start + NORMAL_BATCH]
+        dist, idx = tree.query(batch, k=k, workers=workers)
+        dist, idx = dist.reshape(len(batch), k), idx.reshape(len(batch), k)
+        neighbors[start:start + len(batch)] = idx[:, :neighbors.shape[1]]
+
+        valid = np.ones_like(dist, dtype=bool) if radius is None else dist <= radius
+        valid[:, :3] = True
+        w = valid[:, :, None].astype(np.float64)
+        count = w.sum(axis=1)
+
+        nbrs = points[idx]
+        mean = (nbrs * w).sum(axis=1) / count
+        centered = (nbrs - mean[:, None, :]) * w
+        cov = centered.transpose(0, 2, 1) @ centered
+        _, vecs = np.linalg.eigh(cov)
+        normals[start:start + len(batch)] = vecs[:, :, 0]
+
+    return normals, neighbors
+
+def orient_normals(points, normals, method="propagate", viewpoint=None, neighbors=None, workers=-1, k=8):
+    """
+    Flips normals to a consistent side.
+
+    "centroid" and "viewpoint" are per-point tests. "propagate" builds the
+    minimum spanning tree of the kNN graph weighted by 1 - |n_i . n_j| (so
+    orientation travels across flat regions first), orients the point
+    farthest from the centroid of each connected component outwards and
+    propagates along the tree. The propagation is vectorized: the flip of a
+    node is the parity of the sign changes on its tree path, computed by
+    pointer jumping.
+    """
+    normals = np.array(normals, dtype=np.float64)
+    if method == "none":
+        return normals
+    if method == "centroid":
+        flip = np.einsum("ij,ij->i", normals, points - points.mean(axis=0)) < 0
+    elif method == "viewpoint":
+        if viewpoint is None:
+            raise ValueError("orient='viewpoint' needs a viewpoint")
+        flip = np.einsum("ij,ij->i", normals, np.asarray(viewpoint) - points) < 0
+    elif method == "propagate":
+        flip = _propagate_flips(points, normals, neighbors, workers, k)
+    else:
+        raise ValueError(f"Unknown orientation '{method}', expected one of {ORIENTATIONS}")
+
+    normals[flip] *= -1
+    return normals
+
+def _propagate_flips(points, normals, neighbors, workers, k):
+    """Flip mask from orientation propagation over the kNN minimum spanning tree."""
+    from scipy import sparse
+    from scipy.sparse.csgraph import minimum_spanning_tree, connected_components, breadth_first_order
+    from scipy.spatial import cKDTree
+    n = len(points)
+    if neighbors is None:
+        _, neighbors = cKDTree(points).query(points, k=min(k + 1, n), workers=workers)
+        neighbors = neighbors.reshape(n, -1)
+
+    rows = np.repeat(np.arange(n), neighbors.shape[1])
+    cols = neighbors.ravel()
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+    # Small offset so parallel neighbours still count as edges (0 = no edge)
+    weight = 1.0 - np.abs(np.einsum("ij,ij->i", normals[rows], normals[cols])) + 1e-6
+    graph = sparse.coo_matrix((weight, (rows, cols)), shape=(n, n)).tocsr()
+    tree = minimum_spanning_tree(graph.maximum(graph.T))
+
+    # One seed per connected component: the point farthest from the centroid
+    _, labels = connected_components(tree, directed=False)
+    radial = points - points.mean(axis=0)
+    dist = np.einsum("ij,ij->i", radial, radial)
+    order = np.lexsort((-dist, labels))
+    seeds = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+
+    # A virtual root (node n) joins the components into one tree
+    root_edges = sparse.coo_matrix((np.ones(len(seeds)), (seeds, np.full(len(seeds), n))), shape=(n + 1, n + 1))
+    tree = sparse.bmat([[tree, None], [None, sparse.csr_matrix((1, 1))]]) + root_edges
+    _, pred = breadth_first_order(tree, n, directed=False, return_predecessors=True)
+
+    # Sign change between each node and its parent; seeds compare to "outwards"
+    parent = pred[:n]
+    flip = np.einsum("ij,ij->i", normals, radial) < 0
+    inner = parent != n
+    flip[inner] = np.einsum("ij,ij->i", normals[inner], normals[parent[inner]]) < 0
+
+    # Pointer jumping: flip[i] becomes the parity of the sign changes up to the root
+    anc = np.append(parent, n)
+    parity = np.append(flip, False)
+    while np.any(anc[:n] != n):
+        parity = parity ^ parity[anc]
+        anc = anc[anc]
+    return parity[:n]
@@ -1,46 +1,39 @@
+import functools
 import numpy as np
 
-def b_spline_generic(t, degree):
+# Half-width of the support of the centered B-spline of each degree
+SUPPORT = {1: 1.0, 2: 1.5}
+
+def b_spline(t, degree):
     """
-    Evaluates B-Spline of given degree at t.
-    Currently implements Degree 2 (Quadratic) which is standard for Poisson Reconstruction.
+    Evaluates the centered B-spline of the given degree (1 = hat, 2 =
+    quadratic) at every entry of t. Returns an array shaped like t.
     """
+    t = np.asarray(t, dtype=np.float64)
+    a = np.abs(t)
     if degree == 1:
-        # Linear B-Spline (Hat function)
-        # Support [-1, 1] centered at 0.5?
-        # Standard def: centered at 0. [-1, 1]
-        # |t| < 1 ? 1 - |t| : 0
-        pass
-    
+        return np.maximum(1.0 - a, 0.0)
     if degree == 2:
-        # Quadratic B-Spline
-        # Support [-1.5, 1.5]. 
-        # But we usually map this to discrete stencil.
-        t_abs = abs(t)
-        if t_abs <= 0.5:
-             return 0.75 - t_abs**2
-        elif t_abs <= 1.5:
-             return 0.5 * (1.5 - t_abs)**2
-        else:
-             return 0.0
-             
-    raise NotImplementedError("Only degree 2 implemented for simplicity")
+        return np.where(a <= 0.5, 0.75 - a ** 2, np.where(a <= 1.5, 0.5 * (1.5 - a) ** 2, 0.0))
+    raise NotImplementedError(f"B-splines of degree {degree} are not implemented (1 or 2)")
 
-def b_spline_derivative_generic(t, degree):
+def b_spline_derivative(t, degree):
+    """Derivative of b_spline with respect to t, elementwise."""
+    t = np.asarray(t, dtype=np.float64)
+    a = np.abs(t)
+    if degree == 1:
+        return np.where(a < 1.0, -np.sign(t), 0.0)
     if degree == 2:
-        # Derivative of Quadratic B-Spline
-        # If |t| <= 0.5: -2t
-        # If 0.5 < t <= 1.5: -(1.5 - t) = t - 1.5
-        # If -1.5 <= t < -0.5: (1.5 + t)
-        if abs(t) <= 0.5:
-            return -2 * t
-        elif 0.5 < t <= 1.5:
-            return t - 1.5
-        elif -1.5 <= t < -0.5:
-            return t + 1.5
-        else:
-            return 0.0
-    return 0.0
+        return np.where(a <= 0.5, -2.0 * t, np.where(a <= 1.5, -np.sign(t) * (1.5 - a), 0.0))
+    raise NotImplementedError(f"B-splines of degree {degree} are not implemented (1 or 2)")
+
+def b_spline_generic(t, degree):
+    """Scalar version of b_spline."""
+    return float(b_spline(t, degree))
+
+def b_spline_derivative_generic(t, degree):
+    """Scalar version of b_spline_derivative."""
+    return float(b_spline_derivative(t, degree))
 
 # Precomputed stencils for grid discrete convolution
 # For checking value at node i from a function centered at node j, 
@@ -48,8 +41,121 @@ def b_spline_derivative_generic(t, degree):
 # A quadratic B-spline spans 3 nodes effectively (radius 1.5).
 # Stencil offsets: -1, 0, 1
 STENCIL_VALS_DEG2 = [0.125, 0.75, 0.125] # B(0)=0.75, B(1)=0.125
-STENCIL_DERIV_DEG2 = [0.5, 0.0, -0.5]    # Approximated Central Diff? 
-# Actually, precise derivative of B-spline at integer offsets?
-# B'(0) = 0.
-# B'(1) = -0.5 (from formula t-1.5 at t=1 -> -0.5)
-# B'(-1) = 0.5 (from formula t+1.5 at t=-1 -> 0.5)
+STENCIL_DERIV_DEG2 = [0.5, 0.0, -0.5]    # B'(-1), B'(0), B'(1)
+
+@functools.lru_cache(maxsize=None)
+def integral_tables(degree, depth=None):
+    """
+    1D inner products of the B-spline at node 0 with its neighbour at node k,
+    for offsets k = -degree .. degree:
+        mass[k]      = int B(t) B(t - k) dt
+        stiffness[k] = int B'(t) B'(t - k) dt
+        gradient[k]  = int B(t) B'(t - k) dt
+    The 3D FEM operators are tensor products of these (see
+    formulation.apply_fem_dense). With depth=None the tables are in grid
+    units (node spacing 1, like the 7-point stencil); for a depth they are
+    scaled to the node spacing h = 1 / (2^depth - 1) of the unit cube
+    (mass * h, stiffness / h). Cached per (degree, depth).
+    Returns a dict of read-only arrays of length 2*degree + 1.
+    """
+    if degree not in SUPPORT:
+        raise NotImplementedError(f"B-splines of degree {degree} are not implemented (1 or 2)")
+
+    # The integrands are piecewise polynomials of degree <= 4 between
+    # half-integers, so 3-point Gauss-Legendre per half-unit is exact.
+    nodes, weights = np.polynomial.legendre.leggauss(3)
+    s = SUPPORT[degree]
+    edges = np.arange(-s, s, 0.5)
+    t = (edges[:, None] + 0.25 * (nodes + 1)).ravel()
+    w = np.tile(0.25 * weights, len(edges))
+
+    offsets = np.arange(-degree, degree + 1)
+    b0, d0 = b_spline(t, degree), b_spline_derivative(t, degree)
+    bk = b_spline(t[None, :] - offsets[:, None], degree)
+    dk = b_spline_derivative(t[None, :] - offsets[:, None], degree)
+
+    tables = {
+        "mass": (bk * b0) @ w,
+        "stiffness": (dk * d0) @ w,
+        "gradient": (dk * b0) @ w,
+    }
+    if depth is not None:
+        h = 1.0 / (2 ** depth - 1)
+        tables["mass"] *= h
+        tables["stiffness"] /= h
+    for arr in tables.values():
+        arr.setflags(write=False)
+    return tables
+
+def bspline_upsample_matrix(res_coarse, res_fine):
+    """
+    1D interpolation matrix (res_fine x res_coarse) that evaluates the coarse
+    quadratic B-spline field at the fine grid nodes.
+    Node i of a grid with resolution r sits at i / (r - 1) in [0, 1]; at nodes
+    that coincide with coarse nodes the weights are STENCIL_VALS_DEG2.
+    Coefficients outside the grid are zero, matching the Dirichlet boundary.
+    """
+    from scipy import sparse
+
+    t = np.arange(res_fine) * (res_coarse - 1) / (res_fine - 1)
+    center = np.floor(t + 0.5).astype(int)
+
+    rows, cols, vals = [], [], []
+    for offset in (-1, 0, 1):
+        j = center + offset
+        valid = (j >= 0) & (j < res_coarse)
+        w = b_spline((t - j)[valid], 2)
+        rows.append(np.nonzero(valid)[0])
+        cols.append(j[valid])
+        vals.append(w)
+
+    return sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(res_fine, res_coarse)
+    )
+
+def upsample_dense(x, res_coarse, res_fine):
+    """
+    Upsamples a flattened dense field from res_coarse^3 to res_fine^3 by
+    evaluating it as a quadratic B-spline (separable, one axis at a time).
+    """
+    U = bspline_upsample_matrix(res_coarse, res_fine)
+    f = x.reshape((res_coarse, res_coarse, res_coarse))
+    for axis in range(3):
+        g = np.moveaxis(f, axis, 0)
+        shape = (res_fine,) + g.shape[1:]
+        g = (U @ g.reshape(g.shape[0], -1)).reshape(shape)
+        f = np.moveaxis(g, 0, axis)
+    return f.ravel()
+
+def node_values_dense(coeffs, resolution, degree):
+    """
+    Values at the grid nodes of a dense field of B-spline coefficients, for
+    marching cubes. Degree 1 (hat) coefficients are already the node values;
+    degree 2 is convolved with STENCIL_VALS_DEG2 along each axis.
+    """
+    if degree == 1:
+        return coeffs
+    return upsample_dense(coeffs, resolution, resolution)
+
+def coefficients_dense(values, resolution, degree):
+    """
+    Inverse of node_values_dense: B-spline coefficients whose field takes
+    the given values at the grid nodes. Degree 2 solves the tridiagonal
+    STENCIL_VALS_DEG2 system along each axis.
+    """
+    if degree == 1:
+        return values
+    from scipy.linalg import solve_banded
+
+    lo, mid, hi = STENCIL_VALS_DEG2
+    bands = np.zeros((3, resolution))
+    bands[0, 1:] = hi
+    bands[1] = mid
+    bands[2, :-1] = lo
+    f = values.reshape((resolution, resolution, resolution))
+    for axis in range(3):
+        g = np.moveaxis(f, axis, 0)
+        g = solve_banded((1, 1), bands, g.reshape(resolution, -1)).reshape(g.shape)
+        f = np.moveaxis(g, 0, axis)
+    return f.ravel()
@@ -1,5 +1,11 @@
 import numpy as np
 from scipy import sparse
+from scipy.sparse.linalg import LinearOperator
+from .basis import b_spline
+
+# Per-vertex densities block-sum the splat weights over DENSITY_REDUCTION^3
+# voxels (the density of a grid 2 depths coarser)
+DENSITY_REDUCTION = 4
 
 def get_trilinear_weights(rel_pos):
     """Trilinear weights for 8 neighbors."""
@@ -31,101 +37,516 @@ def idx_to_coord(idx, res):
     z = remainder % res
     return (x, y, z)
 
-def splat_normals_dense(points, normals, resolution):
+def trilinear_stencil(points, resolution):
+    """
+    Trilinear splat stencil for a batch of normalized points [0, 1].
+    Returns: idx (N, 8) linear voxel indices and w (N, 8) weights, ordered like
+    the offsets of get_trilinear_weights.
+    """
+    scaled_points = points * (resolution - 1)
+
+    base = np.floor(scaled_points).astype(int)
+    base = np.clip(base, 0, resolution - 2)
+    rel = scaled_points - base
+
+    wx = [1 - rel[:, 0], rel[:, 0]]
+    wy = [1 - rel[:, 1], rel[:, 1]]
+    wz = [1 - rel[:, 2], rel[:, 2]]
+
+    idx = np.empty((len(points), 8), dtype=np.int64)
+    w = np.empty((len(points), 8), dtype=np.float64)
+
+    c = 0
+    for k in range(2):
+        for j in range(2):
+            for i in range(2):
+                w[:, c] = wx[i] * wy[j] * wz[k]
+                idx[:, c] = coord_to_idx((base[:, 0] + i, base[:, 1] + j, base[:, 2] + k), resolution)
+                c += 1
+
+    return idx, w
+
+def bspline_stencil(points, resolution, degree=1):
+    """
+    B-spline splat stencil of the given degree for a batch of normalized
+    points: the (degree + 1)^3 nodes whose basis functions overlap each point.
+    Degree 1 is trilinear_stencil. For degree 2 the stencil is the 3x3x3
+    block around the nearest node; nodes outside the grid get weight 0.
+    Returns: idx (N, K) linear voxel indices and w (N, K) weights.
+    """
+    if degree == 1:
+        return trilinear_stencil(points, resolution)
+    if degree != 2:
+        raise NotImplementedError(f"B-splines of degree {degree} are not implemented (1 or 2)")
+
+    scaled_points = points * (resolution - 1)
+    center = np.floor(scaled_points + 0.5).astype(int)
+
+    # Per-axis node coordinates and 1D weights for the offsets -1, 0, 1
+    nodes = [center + o for o in (-1, 0, 1)]
+    axis_w = [b_spline(scaled_points - n, 2) * ((n >= 0) & (n < resolution)) for n in nodes]
+    nodes = [np.clip(n, 0, resolution - 1) for n in nodes]
+
+    idx = np.empty((len(points), 27), dtype=np.int64)
+    w = np.empty((len(points), 27), dtype=np.float64)
+
+    c = 0
+    for k in range(3):
+        for j in range(3):
+            for i in range(3):
+                w[:, c] = axis_w[i][:, 0] * axis_w[j][:, 1] * axis_w[k][:, 2]
+                idx[:, c] = coord_to_idx((nodes[i][:, 0], nodes[j][:, 1], nodes[k][:, 2]), resolution)
+                c += 1
+
+    return idx, w
+
+def splat_normals_dense(points, normals, resolution, dtype=np.float64, return_weights=False, degree=1):
     """
     Distributes normal vectors to a DENSE grid.
-    Returns: V (res^3, 3) vector field.
+    All points are scattered at once; contributions are accumulated in point
+    order (in float64), so the result matches the per-point loop exactly.
+    Returns: V (res^3, 3) vector field of the given dtype, and with
+    return_weights=True also W (res^3,), the summed splat weights (sample
+    density) from the same stencil. degree selects the B-spline stencil
+    (1 = trilinear, 2 = quadratic, see bspline_stencil).
     """
     num_voxels = resolution ** 3
-    V = np.zeros((num_voxels, 3), dtype=np.float64)
-    
-    scaled_points = points * (resolution - 1)
-    
-    for i in range(len(points)):
-        p = scaled_points[i]
-        n = normals[i]
-        
-        base = np.floor(p).astype(int)
-        base = np.clip(base, 0, resolution - 2)
-        rel = p - base
-        
-        weights, offsets = get_trilinear_weights(rel)
-        
-        for w, off in zip(weights, offsets):
-            neighbor = (base[0] + off[0], base[1] + off[1], base[2] + off[2])
-            if all(0 <= neighbor[d] < resolution for d in range(3)):
-                idx = coord_to_idx(neighbor, resolution)
-                V[idx] += n * w
-                
+    V = np.zeros((num_voxels, 3), dtype=dtype)
+
+    idx, w = bspline_stencil(points, resolution, degree)
+    idx = idx.ravel()
+
+    for d in range(3):
+        contrib = normals[:, d][:, None] * w
+        V[:, d] = np.bincount(idx, weights=contrib.ravel(), minlength=num_voxels)
+
+    if return_weights:
+        W = np.bincount(idx, weights=w.ravel(), minlength=num_voxels).astype(dtype, copy=False)
+        return V, W
     return V
 
+def splat_normals_chunks(chunks, resolution, dtype=np.float64, return_weights=False, degree=1):
+    """
+    splat_normals_dense over an iterable of (points, normals) chunks, so the
+    full point cloud never has to be in memory. Chunks are accumulated in
+    order into V (and W).
+    """
+    num_voxels = resolution ** 3
+    V = np.zeros((num_voxels, 3), dtype=dtype)
+    W = np.zeros(num_voxels, dtype=dtype) if return_weights else None
+
+    for points, normals in chunks:
+        idx, w = bspline_stencil(points, resolution, degree)
+        idx = idx.ravel()
+        for d in range(3):
+            contrib = normals[:, d][:, None] * w
+            V[:, d] += np.bincount(idx, weights=contrib.ravel(), minlength=num_voxels)
+        if return_weights:
+            W += np.bincount(idx, weights=w.ravel(), minlength=num_voxels)
+
+    if return_weights:
+        return V, W
+    return V
+
+def splat_delta_dense(points, normals, resolution):
+    """
+    The splat of a batch of new points, without touching the rest of the
+    grid: cost scales with the batch, not with res^3.
+    Returns: nodes (K,) sorted unique voxel indices, dV (K, 3) and dW (K,),
+    the increments of V and W from splat_normals_dense at those nodes.
+    """
+    idx, w = trilinear_stencil(points, resolution)
+    nodes, inverse = np.unique(idx.ravel(), return_inverse=True)
+    dV = np.stack([np.bincount(inverse, weights=(normals[:, d][:, None] * w).ravel(), minlength=len(nodes))
+                   for d in range(3)], axis=1)
+    dW = np.bincount(inverse, weights=w.ravel(), minlength=len(nodes))
+    return nodes, dV, dW
+
+def divergence_delta_dense(nodes, dV, resolution):
+    """
+    compute_divergence_dense of a field that is dV at `nodes` and zero
+    elsewhere: each node adds +dV/2 to its lower and -dV/2 to its upper
+    neighbour along every axis (interior rows only).
+    Returns: (nodes, db), sorted unique voxel indices and increments of b.
+    """
+    coords = idx_to_coord(nodes, resolution)
+    strides = (resolution * resolution, resolution, 1)
+    targets, values = [], []
+    for d in range(3):
+        for step, sign in ((-1, 0.5), (1, -0.5)):
+            c = coords[d] + step
+            valid = (c >= 1) & (c <= resolution - 2)
+            targets.append(nodes[valid] + step * strides[d])
+            values.append(sign * dV[valid, d])
+    targets, inverse = np.unique(np.concatenate(targets), return_inverse=True)
+    return targets, np.bincount(inverse, weights=np.concatenate(values), minlength=len(targets))
+
+def sample_trilinear_dense(field, resolution, points):
+    """
+    Trilinearly interpolates a flattened dense field at normalized points
+    [0, 1], all points at once. Returns: (N,) values.
+    """
+    idx, w = trilinear_stencil(points, resolution)
+    return (np.asarray(field)[idx] * w).sum(axis=1)
+
+def density_blocks(resolution, reduction=DENSITY_REDUCTION):
+    """
+    Block grid of support_density: returns (n, reduction), where coarse node
+    j sums the fine nodes reduction*j .. reduction*(j+1) - 1 (the last one
+    also takes the remainder).
+    """
+    n = max(resolution // reduction, 2)
+    return n, resolution // n
+
+def support_density(coords, weights, resolution, points, reduction=DENSITY_REDUCTION):
+    """
+    Smooth sample-support density at normalized points [0, 1].
+    The splat weights are block-summed over reduction^3 voxels, as if the
+    samples were splatted on a grid log2(reduction) depths coarser (like
+    Open3D's octree-depth density), and that coarse grid is sampled
+    trilinearly. A raw lookup of the fine weights is zero anywhere that is
+    more than one voxel from a sample, which includes most of a well-sampled
+    surface at higher depths.
+    coords: (M, 3) grid coordinates of the nodes with weight; weights: (M,).
+    Returns: (N,) densities.
+    """
+    n, reduction = density_blocks(resolution, reduction)
+    coarse = np.minimum(np.asarray(coords) // reduction, n - 1)
+    keys, inverse = np.unique(coord_to_idx(coarse.T, n), return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+
+    def lookup(key):
+        pos = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+        return np.where(keys[pos] == key, sums[pos], 0.0)
+
+    return _sample_blocks(lookup, n, reduction, resolution, points)
+
+def sample_density_blocks(blocks, resolution, points):
+    """
+    support_density from a dense (n, n, n) array of block-summed weights
+    (see density_blocks), e.g. one that is kept up to date as points arrive.
+    """
+    n = blocks.shape[0]
+    flat = blocks.ravel()
+    return _sample_blocks(lambda key: flat[key], n, resolution // n, resolution, points)
+
+def _sample_blocks(lookup, n, reduction, resolution, points):
+    """Trilinear sample of the block grid at normalized points; lookup maps linear block indices to sums."""
+    c = (points * (resolution - 1) - (reduction - 1) / 2) / reduction
+    base = np.clip(np.floor(c).astype(np.int64), 0, n - 2)
+    rel = np.clip(c - base, 0.0, 1.0)
+
+    density = np.zeros(len(points))
+    for i in range(2):
+        for j in range(2):
+            for k in range(2):
+                w = ((rel[:, 0] if i else 1 - rel[:, 0]) * (rel[:, 1] if j else 1 - rel[:, 1])
+                     * (rel[:, 2] if k else 1 - rel[:, 2]))
+                key = coord_to_idx((base[:, 0] + i, base[:, 1] + j, base[:, 2] + k), n)
+                density += w * lookup(key)
+    return density
+
+def support_density_dense(W, resolution, points, reduction=DENSITY_REDUCTION):
+    """support_density of a flattened dense weight field W."""
+    nodes = np.flatnonzero(np.asarray(W))
+    if len(nodes) == 0:
+        return np.zeros(len(points))
+    coords = np.stack(idx_to_coord(nodes, resolution), axis=1)
+    return support_density(coords, np.asarray(W)[nodes], resolution, points, reduction)
+
+def support_density_sparse(grid, W, points, reduction=DENSITY_REDUCTION):
+    """support_density of weights W on the active nodes of a SparseGrid."""
+    return support_density(grid.coords, np.asarray(W), grid.resolution, points, reduction)
+
 def compute_divergence_dense(V, resolution):
     """
     Computes divergence of vector field V on a DENSE grid.
-    Uses central differences.
+    Uses central differences (zero on the boundary planes of each axis).
+    The result has the dtype of V.
     """
     num_voxels = resolution ** 3
-    div = np.zeros(num_voxels, dtype=np.float64)
-    
-    for idx in range(num_voxels):
-        coord = idx_to_coord(idx, resolution)
-        x, y, z = coord
-        
-        # dVx/dx
-        if x > 0 and x < resolution - 1:
-            idx_xm = coord_to_idx((x-1, y, z), resolution)
-            idx_xp = coord_to_idx((x+1, y, z), resolution)
-            div[idx] += (V[idx_xp, 0] - V[idx_xm, 0]) / 2.0
-            
-        # dVy/dy
-        if y > 0 and y < resolution - 1:
-            idx_ym = coord_to_idx((x, y-1, z), resolution)
-            idx_yp = coord_to_idx((x, y+1, z), resolution)
-            div[idx] += (V[idx_yp, 1] - V[idx_ym, 1]) / 2.0
-            
-        # dVz/dz
-        if z > 0 and z < resolution - 1:
-            idx_zm = coord_to_idx((x, y, z-1), resolution)
-            idx_zp = coord_to_idx((x, y, z+1), resolution)
-            div[idx] += (V[idx_zp, 2] - V[idx_zm, 2]) / 2.0
-            
+    div = np.zeros(num_voxels, dtype=V.dtype)
+
+    V3 = V.reshape((resolution, resolution, resolution, 3))
+    div3 = div.reshape((resolution, resolution, resolution))
+
+    # dVx/dx, dVy/dy, dVz/dz
+    div3[1:-1, :, :] += (V3[2:, :, :, 0] - V3[:-2, :, :, 0]) / 2.0
+    div3[:, 1:-1, :] += (V3[:, 2:, :, 1] - V3[:, :-2, :, 1]) / 2.0
+    div3[:, :, 1:-1] += (V3[:, :, 2:, 2] - V3[:, :, :-2, 2]) / 2.0
+
     return div
 
-def build_laplacian_dense(resolution, alpha=1e-5):
+def build_laplacian_dense(resolution, alpha=1e-5, dtype=np.float64):
     """
     Builds 7-point Laplacian on a DENSE grid.
+    Assembled directly from its 7 diagonals (neighbours across the grid
+    boundary are masked out).
     Returns sparse matrix A = (L + alpha*I).
     """
     num_voxels = resolution ** 3
-    
-    rows = []
-    cols = []
-    data = []
-    
-    for idx in range(num_voxels):
-        coord = idx_to_coord(idx, resolution)
-        x, y, z = coord
-        
-        diag_val = 6.0 + alpha
-        
-        # Add diagonal
-        rows.append(idx)
-        cols.append(idx)
-        data.append(diag_val)
-        
-        # Add off-diagonals for each neighbor
-        neighbors = [
-            (x-1, y, z), (x+1, y, z),
-            (x, y-1, z), (x, y+1, z),
-            (x, y, z-1), (x, y, z+1)
-        ]
-        
-        for n_coord in neighbors:
-            if all(0 <= n_coord[d] < resolution for d in range(3)):
-                n_idx = coord_to_idx(n_coord, resolution)
-                rows.append(idx)
-                cols.append(n_idx)
-                data.append(-1.0)
-                
-    A = sparse.coo_matrix((data, (rows, cols)), shape=(num_voxels, num_voxels))
-    return A.tocsr()
+    idx = np.arange(num_voxels - 1)
+
+    main = np.full(num_voxels, 6.0 + alpha)
+
+    # +-1 in z: invalid where the row sits on the last z plane
+    off_z = np.where(idx % resolution != resolution - 1, -1.0, 0.0)
+
+    # +-res in y: invalid where the row sits on the last y plane
+    idx_y = np.arange(num_voxels - resolution)
+    off_y = np.where((idx_y // resolution) % resolution != resolution - 1, -1.0, 0.0)
+
+    # +-res^2 in x: always valid inside the diagonal's range
+    off_x = np.full(num_voxels - resolution * resolution, -1.0)
+
+    A = sparse.diags(
+        [off_x, off_y, off_z, main, off_z, off_y, off_x],
+        [-resolution * resolution, -resolution, -1, 0, 1, resolution, resolution * resolution],
+        shape=(num_voxels, num_voxels), format="csr", dtype=dtype
+    )
+    A.eliminate_zeros()
+    return A
+
+def build_screening_dense(points, resolution, batch_size=100_000, degree=1):
+    """
+    Point-evaluation Gram matrix S = P^T P of the screening term, where row p
+    of P holds the 8 trilinear weights of sample p (the interpolation used by
+    marching cubes), or its B-spline weights of the given degree.
+    Assembled in batches of points, one sparse product each.
+    Returns: (res^3, res^3) CSR matrix, non-zero only around the samples.
+    """
+    num_voxels = resolution ** 3
+    S = sparse.csr_matrix((num_voxels, num_voxels))
+    for start in range(0, len(points), batch_size):
+        idx, w = bspline_stencil(points[start:start + batch_size], resolution, degree)
+        rows = np.repeat(np.arange(len(idx)), idx.shape[1])
+        P = sparse.csr_matrix((w.ravel(), (rows, idx.ravel())), shape=(len(idx), num_voxels))
+        S = S + (P.T @ P).tocsr()
+    return S
+
+def screening_weight(S, num_points, screening):
+    """
+    Scales the screening strength by the point count: the per-sample weight is
+    screening * (occupied nodes) / N, so the diagonal S adds on the surface
+    is about `screening` whatever the sampling density.
+    """
+    occupied = np.count_nonzero(S.diagonal())
+    return screening * occupied / max(num_points, 1)
+
+def apply_laplacian_dense(x, resolution, alpha=1e-5):
+    """
+    Applies the 7-point stencil (L + alpha*I) to a flattened dense field.
+    Same operator as build_laplacian_dense, without storing the matrix.
+    resolution may also be an (nx, ny, nz) shape, for a box of the grid with
+    zero (Dirichlet) values outside it. Computes in the dtype of x.
+    """
+    shape = tuple(resolution) if isinstance(resolution, tuple) else (resolution,) * 3
+    x3 = x.reshape(shape)
+    y3 = x3 * x3.dtype.type(6.0 + alpha)
+
+    y3[1:, :, :] -= x3[:-1, :, :]
+    y3[:-1, :, :] -= x3[1:, :, :]
+    y3[:, 1:, :] -= x3[:, :-1, :]
+    y3[:, :-1, :] -= x3[:, 1:, :]
+    y3[:, :, 1:] -= x3[:, :, :-1]
+    y3[:, :, :-1] -= x3[:, :, 1:]
+
+    return y3.ravel()
+
+def laplacian_operator_dense(resolution, alpha=1e-5, dtype=np.float64, screening=None):
+    """
+    Matrix-free version of build_laplacian_dense.
+    Returns a LinearOperator applying A = (L + alpha*I) as a stencil, plus the
+    (weighted, sparse) screening matrix if given.
+    """
+    num_voxels = resolution ** 3
+
+    def matvec(x):
+        x = np.asarray(x, dtype=dtype).ravel()
+        y = apply_laplacian_dense(x, resolution, alpha)
+        if screening is not None:
+            y += screening @ x
+        return y
+
+    return LinearOperator((num_voxels, num_voxels), matvec=matvec, rmatvec=matvec, dtype=dtype)
+
+def _apply_axis(f, table, axis):
+    """
+    1D convolution of a 3D array with a B-spline integral table along one
+    axis: y[i] = sum_k table[k] f[i + k], nodes outside the grid are zero.
+    """
+    d = len(table) // 2
+    n = f.shape[axis]
+    t = [f.dtype.type(v) for v in table]
+
+    def cut(start, stop):
+        sl = [slice(None)] * 3
+        sl[axis] = slice(start, stop)
+        return tuple(sl)
+
+    y = f * t[d]
+    for k in range(1, d + 1):
+        y[cut(0, n - k)] += t[d + k] * f[cut(k, n)]
+        y[cut(k, n)] += t[d - k] * f[cut(0, n - k)]
+    return y
+
+def apply_fem_dense(x, resolution, tables, alpha=1e-5):
+    """
+    Applies the Galerkin FEM stiffness operator (K + alpha*I) of a tensor
+    B-spline basis to a flattened dense field of coefficients, where
+        K = S (x) M (x) M + M (x) S (x) M + M (x) M (x) S
+    with the 1D stiffness S and mass M from basis.integral_tables. The
+    shared 1D passes are reused (6 axis convolutions). Computes in the dtype
+    of x.
+    """
+    M, S = tables["mass"], tables["stiffness"]
+    x3 = x.reshape((resolution, resolution, resolution))
+
+    mz = _apply_axis(x3, M, 2)
+    sz = _apply_axis(x3, S, 2)
+    my_mz = _apply_axis(mz, M, 1)
+    rest = _apply_axis(sz, M, 1) + _apply_axis(mz, S, 1)
+    y3 = _apply_axis(my_mz, S, 0) + _apply_axis(rest, M, 0)
+    y3 += x3 * x3.dtype.type(alpha)
+
+    return y3.ravel()
+
+def build_fem_dense(resolution, tables, alpha=1e-5, dtype=np.float64):
+    """
+    Assembles the operator of apply_fem_dense as a CSR matrix from Kronecker
+    products of the 1D banded tables: 27 entries per row for degree 1, 125
+    for degree 2.
+    """
+    offsets = np.arange(len(tables["mass"])) - len(tables["mass"]) // 2
+    M, S = (sparse.diags(list(tables[name]), offsets, shape=(resolution, resolution), format="csr")
+            for name in ("mass", "stiffness"))
+    A = (sparse.kron(S, sparse.kron(M, M)) + sparse.kron(M, sparse.kron(S, M))
+         + sparse.kron(M, sparse.kron(M, S)))
+    A = A + alpha * sparse.identity(resolution ** 3)
+    return A.tocsr().astype(dtype)
+
+def fem_operator_dense(resolution, tables, alpha=1e-5, dtype=np.float64, screening=None):
+    """Matrix-free version of build_fem_dense, like laplacian_operator_dense."""
+    num_voxels = resolution ** 3
+
+    def matvec(x):
+        x = np.asarray(x, dtype=dtype).ravel()
+        y = apply_fem_dense(x, resolution, tables, alpha)
+        if screening is not None:
+            y += screening @ x
+        return y
+
+    return LinearOperator((num_voxels, num_voxels), matvec=matvec, rmatvec=matvec, dtype=dtype)
+
+def compute_divergence_fem(V, resolution, tables):
+    """
+    Weak divergence of a splatted B-spline vector field:
+        b_i = sum_j V_j . int B_i grad B_j
+    i.e. G (x) M (x) M applied to V_x, and likewise for y and z, with the 1D
+    gradient and mass tables. For degree 1 at interior nodes this is the
+    central difference of compute_divergence_dense, smoothed by the mass
+    matrix across the other two axes. The result has the dtype of V.
+    """
+    M, G = tables["mass"], tables["gradient"]
+    div = np.zeros((resolution, resolution, resolution), dtype=V.dtype)
+    for d in range(3):
+        f = np.ascontiguousarray(V[:, d]).reshape((resolution, resolution, resolution))
+        for axis in range(3):
+            f = _apply_axis(f, G if axis == d else M, axis)
+        div += f
+    return div.ravel()
+
+def activate_stencil_nodes(grid, points):
+    """Activates the 8 trilinear stencil nodes of every point."""
+    idx, _ = trilinear_stencil(points, grid.resolution)
+    coords = np.stack(idx_to_coord(np.unique(idx), grid.resolution), axis=1)
+    grid.add_coords(coords)
+
+def splat_normals_sparse(grid, points, normals, return_weights=False):
+    """
+    Distributes normal vectors onto the active nodes of a SparseGrid.
+    Uses the same trilinear stencil as splat_normals_dense; every stencil
+    node must already be active (see activate_stencil_nodes).
+    Returns: V (num_nodes, 3) vector field (and W (num_nodes,) splat weights
+    with return_weights=True).
+    """
+    resolution = grid.resolution
+    num_nodes = grid.get_num_nodes()
+    V = np.zeros((num_nodes, 3), dtype=np.float64)
+
+    idx, w = trilinear_stencil(points, resolution)
+    node_idx = grid.lookup(np.stack(idx_to_coord(idx.ravel(), resolution), axis=1))
+    if np.any(node_idx < 0):
+        raise ValueError("Splat stencil touches inactive nodes; activate them first.")
+
+    for d in range(3):
+        contrib = normals[:, d][:, None] * w
+        V[:, d] = np.bincount(node_idx, weights=contrib.ravel(), minlength=num_nodes)
+
+    if return_weights:
+        return V, np.bincount(node_idx, weights=w.ravel(), minlength=num_nodes)
+    return V
+
+def sample_trilinear_sparse(grid, field, points):
+    """
+    sample_trilinear_dense for a field on the active nodes of a SparseGrid;
+    inactive nodes count as zero.
+    """
+    idx, w = trilinear_stencil(points, grid.resolution)
+    node_idx = grid.lookup(np.stack(idx_to_coord(idx.ravel(), grid.resolution), axis=1)).reshape(idx.shape)
+    values = np.append(np.asarray(field), 0.0)[node_idx]  # index -1 -> zero
+    return (values * w).sum(axis=1)
+
+def build_screening_sparse(grid, points):
+    """
+    build_screening_dense on the active nodes of a SparseGrid.
+    Returns: (num_nodes, num_nodes) CSR matrix S = P^T P.
+    """
+    num_nodes = grid.get_num_nodes()
+    idx, w = trilinear_stencil(points, grid.resolution)
+    node_idx = grid.lookup(np.stack(idx_to_coord(idx.ravel(), grid.resolution), axis=1))
+    if np.any(node_idx < 0):
+        raise ValueError("Screening stencil touches inactive nodes; activate them first.")
+    rows = np.repeat(np.arange(len(points)), 8)
+    P = sparse.csr_matrix((w.ravel(), (rows, node_idx)), shape=(len(points), num_nodes))
+    return (P.T @ P).tocsr()
+
+def compute_divergence_sparse(grid, V):
+    """
+    Computes divergence of V on the active nodes of a SparseGrid.
+    Central differences as in compute_divergence_dense; inactive neighbours
+    carry no splatted normals, so they contribute zero.
+    """
+    resolution = grid.resolution
+    coords = grid.coords
+    nb = grid.neighbors()
+    div = np.zeros(len(coords), dtype=np.float64)
+
+    V_pad = np.vstack([V, np.zeros((1, 3))])  # index -1 -> zero row
+    for d in range(3):
+        interior = (coords[:, d] > 0) & (coords[:, d] < resolution - 1)
+        minus = nb[:, 2 * d]
+        plus = nb[:, 2 * d + 1]
+        div += np.where(interior, (V_pad[plus, d] - V_pad[minus, d]) / 2.0, 0.0)
+
+    return div
+
+def build_laplacian_sparse(grid, alpha=1e-5):
+    """
+    Builds the 7-point Laplacian restricted to the active nodes of a SparseGrid.
+    Inactive neighbours are Dirichlet zero (they only drop out of the row).
+    Returns sparse matrix A = (L + alpha*I).
+    """
+    num_nodes = grid.get_num_nodes()
+    nb = grid.neighbors()
+
+    rows = np.repeat(np.arange(num_nodes), nb.shape[1])
+    cols = nb.ravel()
+    valid = cols >= 0
+
+    diag = sparse.identity(num_nodes, format="csr") * (6.0 + alpha)
+    off = sparse.csr_matrix(
+        (np.full(valid.sum(), -1.0), (rows[valid], cols[valid])),
+        shape=(num_nodes, num_nodes)
+    )
+    return (diag + off).tocsr()
@@ -1,30 +1,212 @@
 import numpy as np
 import skimage.measure
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from ..metrics import stage
 
-def extract_isosurface_dense(grid, x, density_threshold=0.0):
+def extract_isosurface_dense(grid, x, density_threshold=0.0, brick_size=64, workers=1):
     """
-    Extracts mesh using Marching Cubes on a densified grid.
+    Extracts mesh using Marching Cubes on the active band of a SparseGrid.
+    Each brick is densified on its own from the nodes that fall inside it, so
+    the full res^3 volume is never allocated.
     """
     res = grid.resolution
-    
-    # Limit resolution for densification to avoid OOM
-    if res > 512:
-        print("Warning: Resolution {res} too high for naive dense MC. Crashing imminent if not careful.")
-    
-    volume = np.zeros((res, res, res), dtype=np.float32)
-    
-    # Fill sparse values
-    for coord, idx in grid.iter_nodes():
-        if idx < len(x):
-            volume[coord] = x[idx]
-            
+
     # Theoretical iso-value for Poisson reconstruction is 0.
     level = 0.0
-        
-    print(f"Running Marching Cubes at level={level:.4f}...")
-    verts, faces, normals, values = skimage.measure.marching_cubes(volume, level=level)
-    
+
+    print(f"Running Marching Cubes at level={level:.4f} (bricks of {brick_size}, workers={workers})...")
+    with stage("marching_cubes", iso_value=level, workers=workers) as s:
+        verts, faces = march_bricks(_sparse_bricks(grid, x, level, brick_size), level, workers)
+        s["vertices"] = len(verts)
+        s["triangles"] = len(faces)
+    if len(verts) == 0:
+        return None, None
+
     # Transform vertices to unit box [0, 1]
     verts = verts / (res - 1)
-    
+
     return verts, faces
+
+def extract_isosurface_bricks(volume, level, brick_size=64, workers=1):
+    """
+    Marching cubes over a dense (possibly memory-mapped) volume, one brick at
+    a time. Returns (verts, faces) in grid coordinates, like a single
+    skimage.measure.marching_cubes call over the whole volume.
+    """
+    return march_bricks(_dense_bricks(volume, level, brick_size), level, workers)
+
+def march_bricks(bricks, level, workers=1):
+    """
+    Runs marching cubes on overlapping bricks and welds the result.
+
+    Args:
+        bricks: Iterable of (origin, sub_volume, mask or None). Neighbouring
+            bricks share one plane of nodes.
+        level: Iso-value.
+        workers: Number of processes; 1 runs in-process.
+
+    Vertices on the shared planes are generated by both bricks; they are
+    welded by their global grid-edge index.
+    """
+    results = []
+    if workers == 1:
+        for brick in bricks:
+            results.append(_march_brick(brick, level))
+    else:
+        # Bounded submission so only a few bricks are in flight at a time
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for brick in bricks:
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(f.result() for f in done)
+                pending.add(pool.submit(_march_brick, brick, level))
+            results.extend(f.result() for f in pending)
+
+    return weld_bricks(results)
+
+def weld_bricks(results, values=None):
+    """
+    Concatenates per-brick marching cubes results (see _march_brick; None
+    entries are skipped) and welds shared vertices by their grid-edge key.
+    values optionally holds a per-vertex array for each result (e.g. cached
+    densities), welded along with the vertices.
+    Returns (verts, faces) in grid coordinates, or (verts, faces, values).
+    """
+    with_values = values is not None
+    pairs = [(r, v) for r, v in zip(results, values if with_values else [None] * len(results)) if r is not None]
+    if not pairs:
+        empty = (np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int64))
+        return empty + (np.empty(0),) if with_values else empty
+
+    # Deterministic output regardless of completion order
+    pairs.sort(key=lambda p: p[0][0])
+
+    all_verts = []
+    all_keys = []
+    all_faces = []
+    offset = 0
+    for (_, verts, faces, keys), _ in pairs:
+        all_verts.append(verts)
+        all_keys.append(keys)
+        all_faces.append(faces + offset)
+        offset += len(verts)
+
+    keys = np.concatenate(all_keys)
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    verts = np.concatenate(all_verts)[first]
+    faces = inverse.ravel()[np.concatenate(all_faces)]
+
+    if not with_values:
+        return verts, faces
+    return verts, faces, np.concatenate([v for _, v in pairs])[first]
+
+def _march_brick(brick, level):
+    """Marching cubes on one brick. Returns (origin, verts, faces, edge keys) or None."""
+    origin, sub, mask = brick
+    try:
+        verts, faces, _, _ = skimage.measure.marching_cubes(sub, level=level, mask=mask)
+    except (ValueError, RuntimeError):
+        # No surface in this brick
+        return None
+
+    # Each vertex lies on a grid edge (or a node): key = global base node and axis
+    base = np.floor(verts).astype(np.int64)
+    axis = np.argmax(verts - base, axis=1)
+    base += np.asarray(origin, dtype=np.int64)
+
+    return tuple(origin), verts + np.asarray(origin, dtype=verts.dtype), faces, edge_keys(base, axis)
+
+def edge_keys(base, axis):
+    """
+    Key of the grid edge from node base (N, 3) along axis (0-2), one per
+    vertex. Vertices on a node use axis 0. Node indices must be below 2^20.
+    """
+    return (base[:, 0] << 42) | (base[:, 1] << 22) | (base[:, 2] << 2) | axis
+
+def march_dense_brick(volume, origin, brick_size, level):
+    """
+    Marching cubes on the single brick of a dense volume starting at origin
+    (for re-extracting only the bricks whose values changed).
+    Returns the per-brick result for weld_bricks, or None without a sign change.
+    """
+    ox, oy, oz = origin
+    sub = np.asarray(volume[ox:ox + brick_size + 1, oy:oy + brick_size + 1, oz:oz + brick_size + 1])
+    if not (sub.min() < level < sub.max()):
+        return None
+    return _march_brick((tuple(origin), np.ascontiguousarray(sub, dtype=np.float32), None), level)
+
+def _dense_bricks(volume, level, brick_size):
+    """Yields bricks of a dense volume that contain a sign change."""
+    res = volume.shape
+    for ox in range(0, res[0] - 1, brick_size):
+        for oy in range(0, res[1] - 1, brick_size):
+            for oz in range(0, res[2] - 1, brick_size):
+                sub = np.asarray(volume[ox:ox + brick_size + 1, oy:oy + brick_size + 1, oz:oz + brick_size + 1])
+                if not (sub.min() < level < sub.max()):
+                    continue
+                yield (ox, oy, oz), np.ascontiguousarray(sub, dtype=np.float32), None
+
+def _sparse_bricks(grid, x, level, brick_size):
+    """
+    Yields bricks densified from the active nodes of a SparseGrid.
+    Nodes on a brick's upper planes are shared with the neighbouring bricks.
+    """
+    res = grid.resolution
+    coords = grid.coords
+    values = np.asarray(x, dtype=np.float32)
+
+    # Bucket nodes by the brick they start in
+    n_bricks = (res - 2) // brick_size + 1
+    primary = np.minimum(coords // brick_size, n_bricks - 1)
+    brick_id = (primary[:, 0] * n_bricks + primary[:, 1]) * n_bricks + primary[:, 2]
+    order = np.argsort(brick_id, kind="stable")
+    brick_id = brick_id[order]
+    bounds = np.searchsorted(brick_id, np.arange(n_bricks ** 3 + 1))
+
+    for b in np.unique(brick_id):
+        bx, by, bz = b // (n_bricks * n_bricks), (b // n_bricks) % n_bricks, b % n_bricks
+        origin = np.array([bx, by, bz]) * brick_size
+
+        # Gather this bucket plus the buckets that own the shared upper planes
+        members = []
+        for dx in range(2):
+            for dy in range(2):
+                for dz in range(2):
+                    nx, ny, nz = bx + dx, by + dy, bz + dz
+                    if nx >= n_bricks or ny >= n_bricks or nz >= n_bricks:
+                        continue
+                    nb = (nx * n_bricks + ny) * n_bricks + nz
+                    members.append(order[bounds[nb]:bounds[nb + 1]])
+        members = np.concatenate(members)
+
+        local = coords[members] - origin
+        inside = np.all(local <= brick_size, axis=1)
+        local = local[inside]
+        vals = values[members[inside]]
+        if not (vals.min() < level < vals.max()):
+            continue
+
+        shape = tuple(np.minimum(brick_size + 1, res - origin))
+        sub = np.zeros(shape, dtype=np.float32)
+        active = np.zeros(shape, dtype=bool)
+        sub[tuple(local.T)] = vals
+        active[tuple(local.T)] = True
+
+        yield tuple(int(o) for o in origin), sub, cell_mask(active)
+
+def cell_mask(active):
+    """
+    Converts a per-node activity mask into a marching_cubes `mask`.
+    skimage gates the cube with origin (x, y, z) by mask[x+1, y+1, z+1], so the
+    result is True there only if all 8 corners of that cube are active.
+    """
+    cells = active[:-1, :-1, :-1].copy()
+    for dx in range(2):
+        for dy in range(2):
+            for dz in range(2):
+                cells &= active[dx:dx + cells.shape[0], dy:dy + cells.shape[1], dz:dz + cells.shape[2]]
+
+    mask = np.zeros_like(active)
+    mask[1:, 1:, 1:] = cells
+    return mask
@@ -0,0 +1,338 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, splu
+from .formulation import apply_laplacian_dense
+
+def prolong_dense(xc, res_c):
+    """
+    Prolongs a flattened coarse field (res_c^3) to the fine grid (2*res_c)^3.
+    Cell-centered linear interpolation: weights 3/4, 1/4 per axis, zero
+    outside the grid.
+    """
+    f = xc.reshape((res_c, res_c, res_c))
+    for axis in range(3):
+        f = _prolong_axis(f, axis)
+    return f.ravel()
+
+def restrict_dense(xf, res_f):
+    """
+    Restricts a flattened fine field to the coarse grid (res_f/2)^3.
+    Full weighting, the transpose of prolong_dense scaled by 1/8.
+    """
+    f = xf.reshape((res_f, res_f, res_f))
+    for axis in range(3):
+        f = _restrict_axis(f, axis)
+    return f.ravel()
+
+def _prolong_axis(c, axis):
+    c = np.moveaxis(c, axis, 0)
+    f = np.empty((2 * c.shape[0],) + c.shape[1:], dtype=c.dtype)
+    f[0::2] = 0.75 * c
+    f[1::2] = 0.75 * c
+    f[2::2] += 0.25 * c[:-1]
+    f[1:-1:2] += 0.25 * c[1:]
+    return np.moveaxis(f, 0, axis)
+
+def _restrict_axis(f, axis):
+    f = np.moveaxis(f, axis, 0)
+    c = 0.75 * (f[0::2] + f[1::2])
+    c[1:] += 0.25 * f[1:-1:2]
+    c[:-1] += 0.25 * f[2::2]
+    return np.moveaxis(0.5 * c, 0, axis)
+
+def _prolongation_1d(m):
+    """1D prolongation matrix (2m x m) matching _prolong_axis."""
+    rows = np.arange(2 * m)
+    parent = rows // 2
+    side = np.where(rows % 2 == 0, -1, 1)
+    neighbor = parent + side
+    valid = (neighbor >= 0) & (neighbor < m)
+
+    r = np.concatenate([rows, rows[valid]])
+    c = np.concatenate([parent, neighbor[valid]])
+    w = np.concatenate([np.full(2 * m, 0.75), np.full(valid.sum(), 0.25)])
+    return sparse.csr_matrix((w, (r, c)), shape=(2 * m, m))
+
+def _prolongation_rows(rows, m):
+    """
+    Rows of the 3D prolongation (2m)^3 x m^3, the Kronecker cube of
+    _prolongation_1d, for the given fine indices only.
+    """
+    fine = np.unravel_index(rows, (2 * m,) * 3)
+    # Per axis: the parent (weight 3/4) and the neighbor on the same side (1/4)
+    parents, weights = [], []
+    for i in fine:
+        neighbor = i // 2 + np.where(i % 2 == 0, -1, 1)
+        valid = (neighbor >= 0) & (neighbor < m)
+        parents.append((i // 2, np.clip(neighbor, 0, m - 1)))
+        weights.append((np.full(len(i), 0.75), np.where(valid, 0.25, 0.0)))
+
+    cols, vals = [], []
+    for a in range(2):
+        for b in range(2):
+            for c in range(2):
+                cols.append((parents[0][a] * m + parents[1][b]) * m + parents[2][c])
+                vals.append(weights[0][a] * weights[1][b] * weights[2][c])
+    r = np.tile(np.arange(len(rows)), 8)
+    return sparse.csr_matrix((np.concatenate(vals), (r, np.concatenate(cols))), shape=(len(rows), m ** 3))
+
+def _restrict_matrix(S, res):
+    """Galerkin coarse matrix P^T S P of a sparse fine-level matrix S (res^3 x res^3)."""
+    S = S.tocsr()
+    rows = np.union1d(np.flatnonzero(np.diff(S.indptr)), S.indices)
+    P = _prolongation_rows(rows, res // 2)
+    S_sub = S[rows][:, rows]
+    return (P.T @ S_sub @ P).tocsr()
+
+def _apply_axis(mat, f, axis):
+    """Applies a 1D (m x m) matrix along one axis of a 3D array."""
+    g = np.moveaxis(f, axis, 0)
+    shape = g.shape
+    g = (mat @ g.reshape(shape[0], -1)).reshape(shape)
+    return np.moveaxis(g, 0, axis)
+
+def _band_laplacian(rows, res, alpha):
+    """The 7-point (L + alpha*I) restricted to the sorted fine indices rows."""
+    coords = np.stack(np.unravel_index(rows, (res,) * 3), axis=1)
+    r = [np.arange(len(rows))]
+    c = [np.arange(len(rows))]
+    v = [np.full(len(rows), 6.0 + alpha)]
+    for axis in range(3):
+        for step in (-1, 1):
+            nb = coords.copy()
+            nb[:, axis] += step
+            inside = (nb[:, axis] >= 0) & (nb[:, axis] < res)
+            idx = np.ravel_multi_index(tuple(nb[inside].T), (res,) * 3)
+            pos = np.minimum(np.searchsorted(rows, idx), len(rows) - 1)
+            hit = rows[pos] == idx
+            r.append(np.flatnonzero(inside)[hit])
+            c.append(pos[hit])
+            v.append(np.full(hit.sum(), -1.0))
+    n = len(rows)
+    return sparse.csr_matrix((np.concatenate(v), (np.concatenate(r), np.concatenate(c))), shape=(n, n))
+
+def _power_iteration(apply, inv_diag, n, dtype, iterations=30):
+    """
+    Largest eigenvalue of D^-1 A (size n), padded by 25%: power iteration
+    approaches it from below, and Chebyshev amplifies any mode above lam.
+    """
+    v = np.random.default_rng(0).random(n).astype(dtype)
+    v /= np.linalg.norm(v)
+    lam = 1.0
+    for _ in range(iterations):
+        # Keep v unit length so float32 cannot overflow
+        w = apply(v) * inv_diag
+        lam = float(np.linalg.norm(w))
+        v = w / dtype.type(lam)
+    return 1.25 * lam
+
+def _chebyshev(apply, inv_diag, b, x, lam, ratio, steps):
+    """
+    steps Chebyshev iterations for A x = b, preconditioned with D^-1 =
+    inv_diag (an array or a scalar), damping the spectrum of D^-1 A over
+    [lam / ratio, lam]. x=None starts from zero. For a fixed x0 the result is
+    a fixed polynomial in D^-1 A, so it can be used in a symmetric V-cycle.
+    """
+    scalar = b.dtype.type
+    lo = lam / ratio
+    theta, delta = (lam + lo) / 2, (lam - lo) / 2
+    sigma = theta / delta
+    rho = 1 / sigma
+
+    # r is the preconditioned residual D^-1 (b - A x)
+    r = (b if x is None else b - apply(x)) * inv_diag
+    d = r * scalar(1 / theta)
+    x = d.copy() if x is None else x + d
+    for _ in range(steps - 1):
+        r -= apply(d) * inv_diag
+        rho_next = 1 / (2 * sigma - rho)
+        d *= scalar(rho_next * rho)
+        d += scalar(2 * rho_next / delta) * r
+        rho = rho_next
+        x += d
+    return x
+
+class Multigrid:
+    """
+    Geometric multigrid V-cycle for the dense operator (L + alpha*I).
+
+    L is the Kronecker sum of the 1D operator T = tridiag(-1, 2, -1), so the
+    Galerkin coarse operators P^T A P stay separable:
+        A_c = T_c x M_c x M_c + M_c x T_c x M_c + M_c x M_c x T_c + alpha * M_c x M_c x M_c
+    with T_c = P^T T P and M_c = P^T M P built from small 1D matrices. Coarse
+    levels are therefore applied matrix-free as well, and handle the grid
+    boundary exactly. The coarsest level is factorized once (in float64) and
+    solved directly; all other levels work in `dtype`.
+
+    An optional (weighted) screening matrix S is not separable, so every
+    level carries it as a sparse matrix: S on the fine level and the Galerkin
+    S_c = P^T S P below it, assembled only over the rows S touches (the
+    band around the samples).
+
+    Pre/post smoothing is a Chebyshev polynomial of degree smooth_steps in
+    D^-1 A, damping its spectrum over [lam / chebyshev_ratio, lam], with lam
+    estimated per level by power iteration, so it adapts to any screening
+    weight (damped Jacobi with a fixed omega diverges once lam exceeds
+    2 / omega). A strong screening weight also leaves slow modes inside the
+    band, where S dominates the diagonal: on the fine level, band_steps more
+    Chebyshev steps over [lam / band_ratio, lam] are run on the band rows
+    only, which is cheap since the band holds O(res^2) of the res^3 nodes.
+    Post-smoothing runs the two in reverse order, so the cycle stays
+    symmetric and can be used as a CG preconditioner.
+    """
+    def __init__(self, resolution, alpha=1e-5, coarse_resolution=8, smooth_steps=4, chebyshev_ratio=30.0,
+                 band_steps=16, band_ratio=1000.0, dtype=np.float64, screening=None):
+        self.resolution = resolution
+        self.alpha = alpha
+        self.dtype = np.dtype(dtype)
+        self.smooth_steps = smooth_steps
+        self.chebyshev_ratio = chebyshev_ratio
+        self.band_steps = band_steps
+        self.band_ratio = band_ratio
+
+        # (resolution, T, M, inverse diagonal) per level, finest first
+        T = sparse.diags([-1.0, 2.0, -1.0], [-1, 0, 1], shape=(resolution, resolution), format="csr")
+        M = sparse.identity(resolution, format="csr")
+        # Screening matrix per level (None without screening)
+        S = None if screening is None else screening.tocsr()
+        self.coarse_screening = [None]
+        if S is not None:
+            inv_diag = (1.0 / (6.0 + alpha + S.diagonal())).astype(self.dtype)
+        else:
+            inv_diag = self.dtype.type(1.0 / (6.0 + alpha))
+        self.levels = [(resolution, T, M, inv_diag)]
+        while self.levels[-1][0] > coarse_resolution and self.levels[-1][0] % 2 == 0:
+            res, T, M, _ = self.levels[-1]
+            P = _prolongation_1d(res // 2)
+            T = (P.T @ T @ P).tocsr()
+            M = (P.T @ M @ P).tocsr()
+            diag = self._diagonal(T, M)
+            if S is not None:
+                S = _restrict_matrix(S, res)
+                diag = diag + S.diagonal()
+            self.levels.append((res // 2, T, M, (1.0 / diag).astype(self.dtype)))
+            self.coarse_screening.append(None if S is None else S.astype(self.dtype))
+
+        res_c, T, M, _ = self.levels[-1]
+        A_c = self._assemble(T, M)
+        if S is not None:
+            A_c = A_c + S
+        self.coarse_lu = splu(A_c.tocsc())
+
+        # Level operators in the working precision
+        self.levels = [(res, T.astype(self.dtype), M.astype(self.dtype), inv_diag)
+                       for res, T, M, inv_diag in self.levels]
+
+        # Fine-level screening as its band block: band rows, S_bb and L_bb
+        self.band = None
+        if screening is not None:
+            screening = screening.tocsr()
+            self.band = np.flatnonzero(np.diff(screening.indptr))
+            self.band_screening = screening[self.band][:, self.band].astype(self.dtype)
+            self.band_laplacian = _band_laplacian(self.band, resolution, alpha).astype(self.dtype)
+            self.band_inv_diag = self.levels[0][3][self.band]
+            self.band_lam = _power_iteration(self._apply_band, self.band_inv_diag, len(self.band), self.dtype)
+
+        # Largest eigenvalue of D^-1 A per smoothed level
+        self.lam = [_power_iteration(lambda x, level=level: self._apply(x, level), inv_diag, res ** 3, self.dtype)
+                    for level, (res, _, _, inv_diag) in enumerate(self.levels[:-1])]
+
+    def _diagonal(self, T, M):
+        t = T.diagonal()
+        m = M.diagonal()
+        outer = lambda a, b, c: np.einsum("i,j,k->ijk", a, b, c).ravel()
+        return outer(t, m, m) + outer(m, t, m) + outer(m, m, t) + self.alpha * outer(m, m, m)
+
+    def _assemble(self, T, M):
+        kron3 = lambda a, b, c: sparse.kron(sparse.kron(a, b), c)
+        return kron3(T, M, M) + kron3(M, T, M) + kron3(M, M, T) + self.alpha * kron3(M, M, M)
+
+    def _apply(self, x, level):
+        res, T, M, _ = self.levels[level]
+        if level == 0:
+            y = apply_laplacian_dense(x, res, self.alpha)
+            if self.band is not None:
+                y[self.band] += self.band_screening @ x[self.band]
+            return y
+
+        f = x.reshape((res, res, res))
+        # T_x M_y M_z + M_x T_y M_z + M_x M_y T_z + alpha M_x M_y M_z
+        mx = _apply_axis(M, f, 0)
+        mxy = _apply_axis(M, mx, 1)
+        mxz = _apply_axis(M, mx, 2)
+        myz = _apply_axis(M, _apply_axis(M, f, 1), 2)
+
+        y = _apply_axis(T, myz, 0)
+        y += _apply_axis(T, mxz, 1)
+        y += _apply_axis(T, mxy, 2)
+        y += self.dtype.type(self.alpha) * _apply_axis(M, mxy, 2)
+        y = y.ravel()
+        if self.coarse_screening[level] is not None:
+            y += self.coarse_screening[level] @ x
+        return y
+
+    def _apply_band(self, x):
+        """The fine operator restricted to the band rows (L_bb + S_bb)."""
+        return self.band_laplacian @ x + self.band_screening @ x
+
+    def _smooth(self, b, x, level):
+        _, _, _, inv_diag = self.levels[level]
+        apply = lambda v: self._apply(v, level)
+        return _chebyshev(apply, inv_diag, b, x, self.lam[level], self.chebyshev_ratio, self.smooth_steps)
+
+    def _smooth_band(self, b, x):
+        """Band smoothing: the correction solves the band rows with the rest of x fixed."""
+        r = (b - self._apply(x, 0))[self.band]
+        x = x.copy()
+        x[self.band] += _chebyshev(self._apply_band, self.band_inv_diag, r, None, self.band_lam, self.band_ratio,
+                                   self.band_steps)
+        return x
+
+    def vcycle(self, b, x=None, level=0):
+        """One V-cycle for A x = b on the given level."""
+        res = self.levels[level][0]
+
+        if level == len(self.levels) - 1:
+            return self.coarse_lu.solve(b.astype(np.float64)).astype(self.dtype)
+
+        band = level == 0 and self.band is not None
+        x = self._smooth(b, x, level)
+        if band:
+            x = self._smooth_band(b, x)
+
+        # Galerkin coarse RHS: P^T r = 8 * restrict(r)
+        r = b - self._apply(x, level)
+        e = self.vcycle(restrict_dense(r, res) * self.dtype.type(8.0), level=level + 1)
+        x = x + prolong_dense(e, res // 2)
+
+        if band:
+            x = self._smooth_band(b, x)
+        return self._smooth(b, x, level)
+
+    def solve(self, b, x0=None, rtol=1e-6, maxiter=50):
+        """
+        Standalone multigrid solve: repeated V-cycles until
+        ||b - A x|| <= rtol * ||b||.
+        Returns: x, info (0 = converged), number of V-cycles.
+        """
+        x = np.zeros_like(b) if x0 is None else x0.copy()
+        b_norm = np.linalg.norm(b)
+        if b_norm == 0:
+            return x, 0, 0
+
+        for it in range(1, maxiter + 1):
+            x = self.vcycle(b, x)
+            r_norm = np.linalg.norm(b - self._apply(x, 0))
+            if r_norm <= rtol * b_norm:
+                return x, 0, it
+
+        return x, maxiter, maxiter
+
+    def as_preconditioner(self):
+        """Returns a LinearOperator applying one V-cycle (from zero) as M ~ A^-1."""
+        n = self.resolution ** 3
+
+        def matvec(r):
+            return self.vcycle(np.asarray(r, dtype=self.dtype).ravel())
+
+        return LinearOperator((n, n), matvec=matvec, rmatvec=matvec, dtype=self.dtype)
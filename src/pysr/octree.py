@@ -1,69 +1,152 @@
 import numpy as np
 
+# 21 bits per axis fit in a 64-bit Morton key (depth <= 21)
+MAX_DEPTH = 21
+
+def _spread_bits(v):
+    """Inserts two zero bits between each of the low 21 bits of v (uint64)."""
+    v = v & np.uint64(0x1fffff)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+def _compact_bits(v):
+    """Inverse of _spread_bits."""
+    v = v & np.uint64(0x1249249249249249)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x100f00f00f00f00f)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x1f0000ff0000ff)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x1f00000000ffff)
+    v = (v | (v >> np.uint64(32))) & np.uint64(0x1fffff)
+    return v
+
+def morton_encode(coords):
+    """(N, 3) non-negative integer coords -> (N,) uint64 Morton keys."""
+    c = np.asarray(coords).astype(np.uint64)
+    return (_spread_bits(c[:, 0]) << np.uint64(2)) | (_spread_bits(c[:, 1]) << np.uint64(1)) | _spread_bits(c[:, 2])
+
+def morton_decode(keys):
+    """(N,) uint64 Morton keys -> (N, 3) int64 coords."""
+    keys = np.asarray(keys, dtype=np.uint64)
+    return np.stack([
+        _compact_bits(keys >> np.uint64(2)),
+        _compact_bits(keys >> np.uint64(1)),
+        _compact_bits(keys),
+    ], axis=1).astype(np.int64)
+
+# Face neighbours (7-point stencil) and the full 26-neighbourhood
+FACE_OFFSETS = np.array([
+    (-1, 0, 0), (1, 0, 0),
+    (0, -1, 0), (0, 1, 0),
+    (0, 0, -1), (0, 0, 1)
+], dtype=np.int64)
+BOX_OFFSETS = np.array([
+    (dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) != (0, 0, 0)
+], dtype=np.int64)
+
 class SparseGrid:
     """
-    A simple sparse grid structure to manage active voxels.
-    Uses a dictionary to store indices mapping to a linearized state vector.
+    A sparse grid structure to manage active voxels.
+    Active voxels are stored as a sorted array of 64-bit Morton keys; the
+    position of a key in that array is the node's index in the global state
+    vector. Lookups are O(log n) binary searches.
     """
     def __init__(self, depth):
+        if depth > MAX_DEPTH:
+            raise ValueError(f"depth {depth} exceeds the Morton key limit ({MAX_DEPTH})")
         self.depth = depth
         self.resolution = 2 ** depth
-        # Map (x, y, z) -> index in the global state vector
-        self.active_nodes = {} 
-        self.reverse_map = [] # index -> (x, y, z)
-        
+        self.keys = np.empty(0, dtype=np.uint64)
+        self._coords = None
+
     def add_points(self, points):
         """
         Identify active voxels from a set of normalized points [0, 1].
-        
+
         Args:
             points: (N, 3) numpy array of points in range [0, 1].
         """
         # Scale points to grid coordinates
         grid_coords = (points * self.resolution).astype(np.int32)
-        
+
         # Clip to ensure valid range
         grid_coords = np.clip(grid_coords, 0, self.resolution - 1)
-        
-        for coord in grid_coords:
-            tuple_coord = tuple(coord)
-            if tuple_coord not in self.active_nodes:
-                self.add_node(tuple_coord)
-                
+
+        self.add_coords(grid_coords)
+
+    def add_coords(self, coords):
+        """Activates a batch of (N, 3) integer voxel coords (must be in range)."""
+        if len(coords) == 0:
+            return
+        self._set_keys(np.union1d(self.keys, morton_encode(coords)))
+
     def add_node(self, coord):
-        if coord not in self.active_nodes:
-            idx = len(self.active_nodes)
-            self.active_nodes[coord] = idx
-            self.reverse_map.append(coord)
-            
+        self.add_coords(np.asarray([coord]))
+
     def expand_buffer(self, steps=1):
         """Expands the set of active nodes by adding neighbors (padding)."""
-        directions = [
-            (-1, 0, 0), (1, 0, 0),
-            (0, -1, 0), (0, 1, 0),
-            (0, 0, -1), (0, 0, 1)
-        ]
-        
         for _ in range(steps):
-            current_nodes = list(self.active_nodes.keys())
-            for node in current_nodes:
-                x, y, z = node
-                # 26-connectivity to ensure spline support coverage
-                for dx in [-1, 0, 1]:
-                    for dy in [-1, 0, 1]:
-                        for dz in [-1, 0, 1]:
-                            if dx == 0 and dy == 0 and dz == 0:
-                                continue
-                            neighbor = (x + dx, y + dy, z + dz)
-                            # Check boundary
-                            if (0 <= neighbor[0] < self.resolution and
-                                0 <= neighbor[1] < self.resolution and
-                                0 <= neighbor[2] < self.resolution):
-                                if neighbor not in self.active_nodes:
-                                    self.add_node(neighbor)
+            coords = self.coords
+            # 26-connectivity to ensure spline support coverage
+            candidates = [self.keys]
+            for off in BOX_OFFSETS:
+                neighbor = coords + off
+                # Check boundary
+                inside = np.all((neighbor >= 0) & (neighbor < self.resolution), axis=1)
+                candidates.append(morton_encode(neighbor[inside]))
+            self._set_keys(np.unique(np.concatenate(candidates)))
+
+    def _set_keys(self, keys):
+        self.keys = keys
+        self._coords = None
+
+    @property
+    def coords(self):
+        """(num_nodes, 3) int64 coords, ordered like the state vector."""
+        if self._coords is None:
+            self._coords = morton_decode(self.keys)
+        return self._coords
+
+    def lookup(self, coords):
+        """
+        Bulk index lookup.
+        Returns: (N,) int64 state-vector indices, -1 where the voxel is not
+        active or lies outside the grid.
+        """
+        coords = np.asarray(coords, dtype=np.int64)
+        inside = np.all((coords >= 0) & (coords < self.resolution), axis=1)
+
+        idx = np.full(len(coords), -1, dtype=np.int64)
+        if len(self.keys) == 0:
+            return idx
+
+        keys = morton_encode(coords[inside])
+        pos = np.searchsorted(self.keys, keys)
+        pos_clipped = np.minimum(pos, len(self.keys) - 1)
+        found = self.keys[pos_clipped] == keys
+        idx[np.nonzero(inside)[0][found]] = pos_clipped[found]
+        return idx
+
+    def neighbors(self, offsets=FACE_OFFSETS):
+        """
+        Bulk neighbour query for all active nodes.
+        Returns: (num_nodes, len(offsets)) int64 indices, -1 for inactive.
+        """
+        coords = self.coords
+        out = np.empty((len(coords), len(offsets)), dtype=np.int64)
+        for k, off in enumerate(np.asarray(offsets, dtype=np.int64)):
+            out[:, k] = self.lookup(coords + off)
+        return out
 
     def get_num_nodes(self):
-        return len(self.active_nodes)
-        
+        return len(self.keys)
+
     def iter_nodes(self):
-        return self.active_nodes.items()
+        """Yields ((x, y, z), index) for every active node."""
+        for idx, coord in enumerate(self.coords):
+            yield tuple(int(c) for c in coord), idx
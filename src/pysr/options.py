@@ -0,0 +1,16 @@
+"""
+Choice lists and defaults shared by the command line and the
+implementation. This module imports nothing, so main.py can build its
+argument parser (and answer --help) without loading numpy, scipy or the
+solver stack.
+"""
+SOLVERS = ("cg", "mg", "pcg-mg")
+PRECISIONS = ("float64", "float32", "mixed")
+
+# Discretizations of the dense solve: finite differences (7-point stencil,
+# trilinear splat) or Galerkin FEM with tensor B-splines of degree 1 or 2
+FEM_DEGREES = (1, 2)
+
+# Default strength of the point-interpolation (screening) term; see
+# formulation.screening_weight. 0 disables it.
+SCREENING = 2.0
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from .formulation import trilinear_stencil
+
+def scratch_array(scratch_dir, name, shape, dtype=np.float64):
+    """Creates a zero-filled numpy.memmap backed by <scratch_dir>/<name>.dat."""
+    path = os.path.join(scratch_dir, f"{name}.dat")
+    return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+
+def slab_planes(resolution, working_set_mb, dtype=np.float64):
+    """
+    Number of leading-axis planes processed per slab so that one slab of the
+    splat/divergence stages (V, its halo and the output, 7 values per voxel)
+    stays within working_set_mb.
+    """
+    bytes_per_plane = 7 * np.dtype(dtype).itemsize * resolution * resolution
+    return int(max(1, min(resolution, working_set_mb * 2**20 // bytes_per_plane)))
+
+def splat_normals_slabs(points, normals, resolution, out, planes, accumulate=False, weights_out=None):
+    """
+    splat_normals_dense into a preallocated (res^3, 3) array (e.g. a memmap),
+    one slab of `planes` leading-axis planes at a time.
+    Points are bucketed by the first plane of their stencil, so each slab
+    only scatters the points that touch it. With accumulate=True the splat is
+    added to `out` (for streaming the points in chunks). If weights_out
+    (res^3,) is given, the splat weights are written to it the same way.
+    """
+    plane = resolution * resolution
+
+    base = np.clip(np.floor(points[:, 0] * (resolution - 1)).astype(int), 0, resolution - 2)
+    order = np.argsort(base, kind="stable")
+    base = base[order]
+
+    for x0 in range(0, resolution, planes):
+        x1 = min(x0 + planes, resolution)
+        # Stencils span planes base and base + 1
+        lo, hi = np.searchsorted(base, [x0 - 1, x1], side="left")
+        # Original point order keeps the accumulation identical to the in-core splat
+        sel = np.sort(order[lo:hi])
+
+        slab = np.zeros(((x1 - x0) * plane, 3), dtype=out.dtype)
+        # Weight buffer only when the weights are requested
+        slab_w = np.zeros((x1 - x0) * plane, dtype=out.dtype) if weights_out is not None else None
+        if len(sel):
+            idx, w = trilinear_stencil(points[sel], resolution)
+            local = idx.ravel() - x0 * plane
+            keep = (local >= 0) & (local < len(slab))
+            for d in range(3):
+                contrib = (normals[sel, d][:, None] * w).ravel()
+                slab[:, d] = np.bincount(local[keep], weights=contrib[keep], minlength=len(slab))
+            if weights_out is not None:
+                slab_w[:] = np.bincount(local[keep], weights=w.ravel()[keep], minlength=len(slab))
+
+        if accumulate:
+            out[x0 * plane:x1 * plane] += slab
+            if weights_out is not None:
+                weights_out[x0 * plane:x1 * plane] += slab_w
+        else:
+            out[x0 * plane:x1 * plane] = slab
+            if weights_out is not None:
+                weights_out[x0 * plane:x1 * plane] = slab_w
+
+    return out
+
+def compute_divergence_slabs(V, resolution, out, planes):
+    """
+    compute_divergence_dense into a preallocated res^3 array, one slab at a
+    time with a one-plane halo on each side.
+    """
+    plane = resolution * resolution
+
+    for x0 in range(0, resolution, planes):
+        x1 = min(x0 + planes, resolution)
+        lo, hi = max(x0 - 1, 0), min(x1 + 1, resolution)
+        V3 = np.asarray(V[lo * plane:hi * plane]).reshape((hi - lo, resolution, resolution, 3))
+
+        div3 = np.zeros((x1 - x0, resolution, resolution), dtype=out.dtype)
+
+        # dVx/dx on the interior planes of this slab
+        p0, p1 = max(x0, 1), min(x1, resolution - 1)
+        if p1 > p0:
+            div3[p0 - x0:p1 - x0] += (V3[p0 + 1 - lo:p1 + 1 - lo, :, :, 0] - V3[p0 - 1 - lo:p1 - 1 - lo, :, :, 0]) / 2.0
+
+        # dVy/dy, dVz/dz stay inside the slab
+        Vs = V3[x0 - lo:x1 - lo]
+        div3[:, 1:-1, :] += (Vs[:, 2:, :, 1] - Vs[:, :-2, :, 1]) / 2.0
+        div3[:, :, 1:-1] += (Vs[:, :, 2:, 2] - Vs[:, :, :-2, 2]) / 2.0
+
+        out[x0 * plane:x1 * plane] = div3.ravel()
+
+    return out
@@ -0,0 +1,109 @@
+"""
+Loop-based reference implementations of the dense grid assembly.
+
+These are the original per-point / per-voxel versions of the functions in
+formulation.py. They are kept only to validate the vectorized versions and to
+time them against each other (see benchmarks/bench_assembly.py).
+"""
+import numpy as np
+from scipy import sparse
+from .formulation import get_trilinear_weights, coord_to_idx, idx_to_coord
+
+def splat_normals_dense_reference(points, normals, resolution):
+    """
+    Distributes normal vectors to a DENSE grid.
+    Returns: V (res^3, 3) vector field.
+    """
+    num_voxels = resolution ** 3
+    V = np.zeros((num_voxels, 3), dtype=np.float64)
+    
+    scaled_points = points * (resolution - 1)
+    
+    for i in range(len(points)):
+        p = scaled_points[i]
+        n = normals[i]
+        
+        base = np.floor(p).astype(int)
+        base = np.clip(base, 0, resolution - 2)
+        rel = p - base
+        
+        weights, offsets = get_trilinear_weights(rel)
+        
+        for w, off in zip(weights, offsets):
+            neighbor = (base[0] + off[0], base[1] + off[1], base[2] + off[2])
+            if all(0 <= neighbor[d] < resolution for d in range(3)):
+                idx = coord_to_idx(neighbor, resolution)
+                V[idx] += n * w
+                
+    return V
+
+def compute_divergence_dense_reference(V, resolution):
+    """
+    Computes divergence of vector field V on a DENSE grid.
+    Uses central differences.
+    """
+    num_voxels = resolution ** 3
+    div = np.zeros(num_voxels, dtype=np.float64)
+    
+    for idx in range(num_voxels):
+        coord = idx_to_coord(idx, resolution)
+        x, y, z = coord
+        
+        # dVx/dx
+        if x > 0 and x < resolution - 1:
+            idx_xm = coord_to_idx((x-1, y, z), resolution)
+            idx_xp = coord_to_idx((x+1, y, z), resolution)
+            div[idx] += (V[idx_xp, 0] - V[idx_xm, 0]) / 2.0
+            
+        # dVy/dy
+        if y > 0 and y < resolution - 1:
+            idx_ym = coord_to_idx((x, y-1, z), resolution)
+            idx_yp = coord_to_idx((x, y+1, z), resolution)
+            div[idx] += (V[idx_yp, 1] - V[idx_ym, 1]) / 2.0
+            
+        # dVz/dz
+        if z > 0 and z < resolution - 1:
+            idx_zm = coord_to_idx((x, y, z-1), resolution)
+            idx_zp = coord_to_idx((x, y, z+1), resolution)
+            div[idx] += (V[idx_zp, 2] - V[idx_zm, 2]) / 2.0
+            
+    return div
+
+def build_laplacian_dense_reference(resolution, alpha=1e-5):
+    """
+    Builds 7-point Laplacian on a DENSE grid.
+    Returns sparse matrix A = (L + alpha*I).
+    """
+    num_voxels = resolution ** 3
+    
+    rows = []
+    cols = []
+    data = []
+    
+    for idx in range(num_voxels):
+        coord = idx_to_coord(idx, resolution)
+        x, y, z = coord
+        
+        diag_val = 6.0 + alpha
+        
+        # Add diagonal
+        rows.append(idx)
+        cols.append(idx)
+        data.append(diag_val)
+        
+        # Add off-diagonals for each neighbor
+        neighbors = [
+            (x-1, y, z), (x+1, y, z),
+            (x, y-1, z), (x, y+1, z),
+            (x, y, z-1), (x, y, z+1)
+        ]
+        
+        for n_coord in neighbors:
+            if all(0 <= n_coord[d] < resolution for d in range(3)):
+                n_idx = coord_to_idx(n_coord, resolution)
+                rows.append(idx)
+                cols.append(n_idx)
+                data.append(-1.0)
+                
+    A = sparse.coo_matrix((data, (rows, cols)), shape=(num_voxels, num_voxels))
+    return A.tocsr()
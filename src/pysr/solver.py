@@ -1,49 +1,375 @@
 import numpy as np
 from scipy.sparse.linalg import cg
-import skimage.measure
-from .formulation import splat_normals_dense, compute_divergence_dense, build_laplacian_dense
+from .formulation import splat_normals_dense, splat_normals_chunks, compute_divergence_dense, build_laplacian_dense, laplacian_operator_dense
+from .formulation import apply_laplacian_dense, build_screening_dense, screening_weight
+from .formulation import activate_stencil_nodes, splat_normals_sparse, compute_divergence_sparse, build_laplacian_sparse
+from .formulation import build_screening_sparse, apply_fem_dense, build_fem_dense, fem_operator_dense, compute_divergence_fem
+from .basis import integral_tables
+from .multigrid import Multigrid
+from .outofcore import scratch_array, slab_planes, splat_normals_slabs, compute_divergence_slabs
+from .octree import SparseGrid
+from .iso import extract_isosurface_bricks
+from ..metrics import stage, is_enabled
+from .options import SOLVERS, PRECISIONS, FEM_DEGREES, SCREENING
 
-def solve_poisson_dense(points, normals, resolution, alpha=1e-5):
+# Mixed precision: each float32 inner solve reduces the float64 residual by
+# this factor, for at most MAX_REFINEMENTS correction steps
+INNER_RTOL = 1e-3
+MAX_REFINEMENTS = 10
+
+# Smallest relative residual a pure float32 solve can reliably reach
+FLOAT32_RTOL = 1e-5
+
+def solve_poisson_dense(points, normals, resolution, alpha=1e-5, matrix_free=False, solver="cg", x0=None,
+                        scratch_dir=None, working_set_mb=512, precision="float64", rtol=1e-6, chunks=None,
+                        return_density=False, screening=SCREENING, fem_degree=None):
     """
-    Solves Screened Poisson on a DENSE grid.
+    Solves Screened Poisson on a DENSE grid:
+        (L + alpha*I + w * P^T P) x = div V
+    where P evaluates x at the samples (trilinear weights) and w is
+    `screening` scaled by the point count. The screening term pulls x to 0
+    at the samples, so the surface is the 0 level set.
+
+    Args:
+        points, normals: Normalized samples and their normals. Pass None for
+            both when using `chunks`.
+        matrix_free: Apply the Laplacian as a stencil (LinearOperator) instead
+            of assembling a CSR matrix with ~7*res^3 entries.
+        solver: "cg" (plain CG), "mg" (multigrid V-cycles) or "pcg-mg"
+            (CG preconditioned with one multigrid V-cycle).
+        x0: Optional initial guess (e.g. an upsampled coarser solution).
+        scratch_dir: If set, V, b and the returned x are numpy.memmap files in
+            this directory, and splat/divergence sweep them in slabs of at
+            most working_set_mb. Implies matrix_free. Only assembly is
+            bounded: the solver's work vectors are full arrays in RAM.
+        precision: "float64", "float32" (V, b, the Laplacian and the solver
+            iterate all in float32; rtol is floored at FLOAT32_RTOL), or
+            "mixed" (float32 assembly and inner solves, corrected against the
+            float64 residual; x is float64).
+        rtol: Relative residual tolerance.
+        chunks: Optional iterable of normalized (points, normals) chunks (see
+            loader.PointStream) splatted one at a time instead of points/normals.
+        return_density: Also return W (res^3,), the splat weights of the
+            samples (accumulated with V at no extra pass), for per-vertex
+            density (see support_density_dense).
+        screening: Screening strength (0 = plain Poisson; the surface is then
+            at the mean of x instead of 0).
+        fem_degree: None for the finite-difference system. 1 or 2 assembles
+            the Galerkin system of tensor B-splines of that degree from
+            basis.integral_tables: B-spline splat and screening weights, weak
+            divergence, and the 27/125-point stiffness operator. x then holds
+            B-spline coefficients (see basis.node_values_dense). Not
+            available out-of-core; "mg" is not available and "pcg-mg"
+            preconditions with the finite-difference multigrid.
+    Returns: x, or (x, W) with return_density.
     """
-    print(f"  [1/4] Splatting normals to dense grid ({resolution}^3)...")
-    V = splat_normals_dense(points, normals, resolution)
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {SOLVERS}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if fem_degree is not None:
+        if fem_degree not in FEM_DEGREES:
+            raise ValueError(f"Unknown FEM degree {fem_degree}, expected one of {FEM_DEGREES}")
+        if solver == "mg" or scratch_dir is not None:
+            raise ValueError("The FEM discretization supports the in-memory cg and pcg-mg solvers only")
+        tables = integral_tables(fem_degree)
+    degree = fem_degree or 1
+
+    dtype = np.float64 if precision == "float64" else np.float32
+    x_dtype = np.float32 if precision == "float32" else np.float64
+
+    num_voxels = resolution ** 3
+    if scratch_dir is not None:
+        planes = slab_planes(resolution, working_set_mb, dtype)
+        matrix_free = True
+        print(f"  Out-of-core mode: memmaps in {scratch_dir}, slabs of {planes} planes")
+
+    # Streamed chunks are consumed once: build the screening matrix on the way
+    screen_parts = {"S": None, "points": 0}
+    if chunks is not None and screening > 0:
+        chunks = _collect_screening(chunks, resolution, screen_parts, degree)
+
+    print(f"  [1/4] Splatting normals to dense grid ({resolution}^3, {precision})...")
+    with stage("splat", resolution=resolution, streamed=chunks is not None) as s:
+        W = None
+        if scratch_dir is not None:
+            V = scratch_array(scratch_dir, f"V_{resolution}", (num_voxels, 3), dtype)
+            if return_density:
+                W = scratch_array(scratch_dir, f"W_{resolution}", (num_voxels,), dtype)
+            if chunks is not None:
+                for chunk_points, chunk_normals in chunks:
+                    splat_normals_slabs(chunk_points, chunk_normals, resolution, V, planes, accumulate=True, weights_out=W)
+            else:
+                splat_normals_slabs(points, normals, resolution, V, planes, weights_out=W)
+        else:
+            if chunks is not None:
+                splat = splat_normals_chunks(chunks, resolution, dtype=dtype, return_weights=return_density,
+                                             degree=degree)
+            else:
+                splat = splat_normals_dense(points, normals, resolution, dtype=dtype, return_weights=return_density,
+                                            degree=degree)
+            V, W = splat if return_density else (splat, None)
+        if points is not None:
+            s["points"] = len(points)
+
+    S = None
+    if screening > 0:
+        with stage("screening", screening=screening) as s:
+            if chunks is not None:
+                S, num_points = screen_parts["S"], screen_parts["points"]
+            else:
+                S, num_points = build_screening_dense(points, resolution, degree=degree), len(points)
+            S = screening_weight(S, num_points, screening) * S
+            s["nonzeros"] = S.nnz
+    S_dtype = None if S is None else S.astype(dtype)
     
     print("  [2/4] Computing divergence...")
-    b = compute_divergence_dense(V, resolution)
+    with stage("divergence"):
+        if scratch_dir is not None:
+            b = scratch_array(scratch_dir, f"b_{resolution}", (num_voxels,), dtype)
+            compute_divergence_slabs(V, resolution, b, planes)
+            V.flush()
+            del V
+        elif fem_degree is not None:
+            b = compute_divergence_fem(V, resolution, tables)
+        else:
+            b = compute_divergence_dense(V, resolution)
     
-    print("  [3/4] Building Laplacian...")
-    A = build_laplacian_dense(resolution, alpha)
+    with stage("laplacian", matrix_free=matrix_free or solver == "mg", fem_degree=fem_degree):
+        if fem_degree is not None:
+            if matrix_free:
+                print(f"  [3/4] Using matrix-free FEM operator (degree {fem_degree} B-splines)...")
+                A = fem_operator_dense(resolution, tables, alpha, dtype=dtype, screening=S_dtype)
+            else:
+                print(f"  [3/4] Building FEM stiffness matrix (degree {fem_degree} B-splines)...")
+                A = build_fem_dense(resolution, tables, alpha, dtype=dtype)
+                if S is not None:
+                    A = (A + S_dtype).tocsr()
+                matrix_mb = (A.data.nbytes + A.indices.nbytes + A.indptr.nbytes) / 2**20
+                print(f"    Stiffness matrix: {A.nnz} entries, {matrix_mb:.1f} MB")
+        elif solver == "mg":
+            # The V-cycle applies every level as a stencil, no global matrix needed
+            print("  [3/4] Building multigrid hierarchy...")
+            A = None
+        elif matrix_free:
+            print("  [3/4] Using matrix-free Laplacian operator (no matrix stored)...")
+            A = laplacian_operator_dense(resolution, alpha, dtype=dtype, screening=S_dtype)
+        else:
+            print("  [3/4] Building Laplacian...")
+            A = build_laplacian_dense(resolution, alpha, dtype=dtype)
+            if S is not None:
+                A = (A + S_dtype).tocsr()
+            matrix_mb = (A.data.nbytes + A.indices.nbytes + A.indptr.nbytes) / 2**20
+            print(f"    Laplacian matrix: {A.nnz} entries, {matrix_mb:.1f} MB")
+
+        mg = Multigrid(resolution, alpha, dtype=dtype, screening=S) if solver in ("mg", "pcg-mg") else None
+
+    def apply_fine(x64):
+        """The float64 operator, for residuals."""
+        if fem_degree is not None:
+            y = apply_fem_dense(x64, resolution, tables, alpha)
+        else:
+            y = apply_laplacian_dense(x64, resolution, alpha)
+        if S is not None:
+            y += S @ x64
+        return y
     
-    print(f"  [4/4] Solving ({A.shape[0]} unknowns)...")
-    x, info = cg(A, b, rtol=1e-6, maxiter=1000)
+    print(f"  [4/4] Solving ({num_voxels} unknowns, solver={solver})...")
+    with stage("solve", unknowns=num_voxels, solver=solver, precision=precision) as s:
+        if precision == "mixed":
+            x, info, iterations = _refine_mixed(A, b, x0, apply_fine, solver, mg, rtol)
+        else:
+            if precision == "float32":
+                rtol = max(rtol, FLOAT32_RTOL)
+            x0 = None if x0 is None else np.asarray(x0, dtype=dtype)
+            x, info, iterations = run_solver(A, b, x0, solver, mg, rtol)
+
+        s["iterations"] = iterations
+        s["converged"] = info == 0
+        if is_enabled():
+            b64 = np.asarray(b, dtype=np.float64)
+            r = b64 - apply_fine(np.asarray(x, dtype=np.float64))
+            s["residual"] = float(np.linalg.norm(r) / max(np.linalg.norm(b64), 1e-300))
     
     if info != 0:
-        print(f"    Warning: CG returned info={info}")
+        print(f"    Warning: {solver} returned info={info} after {iterations} iterations")
     else:
-        print("    Solver converged.")
+        print(f"    Solver converged in {iterations} iterations.")
+
+    if scratch_dir is not None:
+        x_mm = scratch_array(scratch_dir, f"x_{resolution}", (num_voxels,), x_dtype)
+        x_mm[:] = x
+        del x
+        return (x_mm, W) if return_density else x_mm
         
-    return x
+    x = x.astype(x_dtype, copy=False)
+    return (x, W) if return_density else x
+
+def run_solver(A, b, x0, solver, mg, rtol):
+    """
+    Runs solver ("cg", "mg" or "pcg-mg"; mg is the Multigrid for the last
+    two) on A x = b from x0. Returns (x, info, iterations).
+    """
+    if solver == "mg":
+        return mg.solve(b, x0=x0, rtol=rtol)
+
+    iterations = 0
+    def count(xk):
+        nonlocal iterations
+        iterations += 1
+    M = mg.as_preconditioner() if mg is not None else None
+    x, info = cg(A, b, x0=x0, rtol=rtol, maxiter=1000, M=M, callback=count)
+    return x, info, iterations
+
+def _collect_screening(chunks, resolution, out, degree=1):
+    """Passes chunks through while summing their screening matrices into out["S"]."""
+    for points, normals in chunks:
+        S = build_screening_dense(points, resolution, degree=degree)
+        out["S"] = S if out["S"] is None else out["S"] + S
+        out["points"] += len(points)
+        yield points, normals
 
-def extract_isosurface_from_dense(x, resolution):
+def _refine_mixed(A, b, x0, apply_fine, solver, mg, rtol):
+    """
+    Mixed-precision iterative refinement: the residual and the solution are
+    float64 (apply_fine, matrix-free), each correction is a float32 solve.
+    Returns (x, info, total inner iterations).
+    """
+    b64 = np.asarray(b, dtype=np.float64)
+    b_norm = np.linalg.norm(b64)
+    x = np.zeros_like(b64) if x0 is None else np.array(x0, dtype=np.float64)
+
+    iterations = 0
+    for step in range(1, MAX_REFINEMENTS + 1):
+        r = b64 - apply_fine(x)
+        r_norm = np.linalg.norm(r)
+        if r_norm <= rtol * b_norm:
+            print(f"    Mixed precision: {step - 1} refinement steps")
+            return x, 0, iterations
+
+        # Scale the correction problem to O(1) so float32 keeps its digits
+        d, _, its = run_solver(A, (r / r_norm).astype(np.float32), None, solver, mg, INNER_RTOL)
+        x += r_norm * d.astype(np.float64)
+        iterations += its
+
+    return x, MAX_REFINEMENTS, iterations
+
+def solve_poisson_sparse(points, normals, depth, alpha=1e-5, padding=2, return_density=False, screening=SCREENING):
+    """
+    Solves Screened Poisson only on a band of voxels around the samples.
+    The band is the trilinear stencil nodes of the points, dilated by
+    `padding` voxels; everything outside it is Dirichlet zero. Unknowns (and
+    memory) scale with the surface area instead of res^3. The screening term
+    is the same as in solve_poisson_dense.
+    Returns: (grid, x) where x[i] is the value at grid node i, or
+    (grid, x, W) with return_density (W[i] = splat weight at node i).
+    """
+    resolution = 2 ** depth
+
+    print(f"  [1/5] Building sparse band ({resolution}^3 grid, padding={padding})...")
+    with stage("band", resolution=resolution, padding=padding) as s:
+        grid = SparseGrid(depth)
+        activate_stencil_nodes(grid, points)
+        grid.expand_buffer(padding)
+        num_nodes = grid.get_num_nodes()
+        s["nodes"] = num_nodes
+    print(f"    {num_nodes} active nodes ({100.0 * num_nodes / resolution ** 3:.2f}% of the dense grid)")
+
+    print("  [2/5] Splatting normals to sparse grid...")
+    with stage("splat", points=len(points)):
+        splat = splat_normals_sparse(grid, points, normals, return_weights=return_density)
+        V, W = splat if return_density else (splat, None)
+
+    print("  [3/5] Computing divergence...")
+    with stage("divergence"):
+        b = compute_divergence_sparse(grid, V)
+
+    print("  [4/5] Building Laplacian...")
+    with stage("laplacian", screening=screening):
+        A = build_laplacian_sparse(grid, alpha)
+        if screening > 0:
+            S = build_screening_sparse(grid, points)
+            A = (A + screening_weight(S, len(points), screening) * S).tocsr()
+
+    print(f"  [5/5] Solving ({num_nodes} unknowns)...")
+    with stage("solve", unknowns=num_nodes, solver="cg") as s:
+        iterations = 0
+        def count(xk):
+            nonlocal iterations
+            iterations += 1
+        x, info = cg(A, b, rtol=1e-6, maxiter=1000, callback=count)
+
+        s["iterations"] = iterations
+        s["converged"] = info == 0
+        if is_enabled():
+            s["residual"] = float(np.linalg.norm(b - A @ x) / max(np.linalg.norm(b), 1e-300))
+
+    if info != 0:
+        print(f"    Warning: CG returned info={info} after {iterations} iterations")
+    else:
+        print(f"    Solver converged in {iterations} iterations.")
+
+    if return_density:
+        return grid, x, W
+    return grid, x
+
+def extract_isosurface_from_dense(x, resolution, brick_size=64, workers=1, level=None):
     """
     Extracts isosurface from the solved dense field.
+    Marching cubes runs per brick (in `workers` processes when > 1); bricks
+    without a sign change are skipped and seam vertices are welded.
+    level: Iso-value; 0 for a screened solve. None uses the mean of x (for
+    the unscreened solve, whose level set at the samples is not 0).
     """
     # Reshape to 3D volume
     volume = x.reshape((resolution, resolution, resolution))
     
-    # Iso-value = mean of field (theoretical=0, but bias can shift it)
-    iso_val = np.mean(volume)
-    print(f"  Iso-value: {iso_val:.6f}, range: [{volume.min():.4f}, {volume.max():.4f}]")
+    if level is None:
+        # Iso-value = mean of field (theoretical=0, but bias can shift it)
+        iso_val = np.mean(volume)
+        print(f"  Iso-value: {iso_val:.6f}, range: [{volume.min():.4f}, {volume.max():.4f}]")
+    else:
+        iso_val = level
+        print(f"  Iso-value: {iso_val:.6f}")
     
-    try:
-        verts, faces, normals, values = skimage.measure.marching_cubes(volume, level=iso_val)
-    except ValueError as e:
-        print(f"  Marching Cubes error: {e}")
+    with stage("marching_cubes", iso_value=float(iso_val), workers=workers) as s:
+        verts, faces = extract_isosurface_bricks(volume, iso_val, brick_size=brick_size, workers=workers)
+        s["vertices"] = len(verts)
+        s["triangles"] = len(faces)
+    if len(verts) == 0:
+        print("  Marching Cubes error: no surface found at the iso-value")
         return None, None
         
     # Normalize to [0, 1]
     verts = verts / (resolution - 1)
     
     return verts, faces
+
+def extract_lod_from_dense(x, resolution, lods, brick_size=64, workers=1, level=None):
+    """
+    Extracts coarser levels of detail from the same solved dense field: level
+    k runs marching cubes on the field block-averaged 2x per axis k times
+    (resolution / 2^k), so no further solve is needed.
+    level: Iso-value as in extract_isosurface_from_dense (None: the mean of
+        x, which block averaging preserves).
+    Returns a list of (verts, faces) for k = 1 .. lods, with verts in the
+    [0, 1] coordinates of the fine grid: a coarse node averages 2^k fine
+    nodes per axis, so coarse node j sits at fine node 2^k j + (2^k - 1) / 2.
+    """
+    volume = x.reshape((resolution, resolution, resolution))
+    iso_val = float(np.mean(volume)) if level is None else level
+
+    results = []
+    for k in range(1, lods + 1):
+        n = volume.shape[0] // 2
+        with stage(f"lod_{k}", resolution=n) as s:
+            volume = volume.reshape((n, 2, n, 2, n, 2)).mean(axis=(1, 3, 5))
+            verts, faces = extract_isosurface_bricks(volume, iso_val, brick_size=brick_size, workers=workers)
+            s["vertices"] = len(verts)
+            s["triangles"] = len(faces)
+        print(f"  LOD {k}: {n}^3 grid, {len(verts)} vertices")
+
+        factor = 2 ** k
+        verts = (verts * factor + (factor - 1) / 2) / (resolution - 1)
+        results.append((verts, faces))
+    return results
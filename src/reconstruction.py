@@ -1,66 +1,216 @@
-import open3d as o3d
+import contextlib
+import os
+import tempfile
+import time
 import numpy as np
-from .pysr.solver import solve_poisson_dense, extract_isosurface_from_dense
+from .pysr.solver import solve_poisson_dense, solve_poisson_sparse, extract_isosurface_from_dense, extract_lod_from_dense
+from .pysr.solver import SCREENING
+from .pysr.iso import extract_isosurface_dense
+from .pysr.formulation import support_density_dense, support_density_sparse, DENSITY_REDUCTION
+from .pysr.basis import upsample_dense, node_values_dense, coefficients_dense
+from .metrics import stage
+from .loader import PointStream, normalized_chunks
+from .geometry import Mesh, PointCloud
 
 def run_poisson(pcd, depth=8, width=0, scale=1.1, linear_fit=False):
     """
     Runs Open3D's Screened Poisson Surface Reconstruction.
     """
+    import open3d as o3d
+    if isinstance(pcd, PointCloud):
+        pcd = pcd.to_open3d()
     print(f"Running Poisson reconstruction (depth={depth}, scale={scale})...")
-    mesh, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(
-        pcd, depth=depth, width=width, scale=scale, linear_fit=linear_fit
-    )
+    with stage("open3d_poisson", octree_depth=depth) as s:
+        mesh, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(
+            pcd, depth=depth, width=width, scale=scale, linear_fit=linear_fit
+        )
+        s["vertices"] = len(mesh.vertices)
+        s["triangles"] = len(mesh.triangles)
     print(f"Reconstruction complete. Generated {len(mesh.vertices)} vertices and {len(mesh.triangles)} triangles.")
     return mesh, densities
 
-def run_poisson_manual(pcd, depth=6, scale=1.1, alpha=1e-5):
+def run_poisson_manual(pcd, depth=6, scale=1.1, alpha=1e-5, matrix_free=False, solver="cg", cascade=0, workers=1,
+                       scratch_dir=None, working_set_mb=512, precision="float64", screening=SCREENING,
+                       fem_degree=None, bounds=None, lod=0):
     """
     Runs Manual Screened Poisson Surface Reconstruction using DENSE grid.
-    NOTE: depth > 6 can be slow/memory intensive. depth=6 -> 64^3 = 262k voxels.
+    NOTE: depth > 8 is memory intensive. depth=8 -> 256^3 = 16.7M voxels.
+    Use matrix_free=True to avoid storing the Laplacian matrix, and
+    solver="mg"/"pcg-mg" for multigrid (iteration count independent of depth).
+    With cascade=k, depths depth-k .. depth are solved coarse-to-fine, each
+    warm-started from the B-spline upsampled solution of the previous depth
+    (converted back to coefficients for fem_degree=2).
+    Marching cubes runs per brick in `workers` processes.
+    With scratch_dir set, V, b and x live in memory-mapped files there and
+    assembly sweeps them in slabs of at most working_set_mb (the solver's
+    work vectors stay in RAM).
+    precision selects "float64", "float32" or "mixed" arithmetic for the solve.
+    screening is the strength of the point-interpolation term (0 = plain
+    Poisson, extracted at the field mean instead of 0).
+    fem_degree=1 or 2 solves the Galerkin B-spline system instead of the
+    finite-difference one (see solve_poisson_dense).
+    bounds=(center, max_dim) fixes the reconstructed cube instead of fitting
+    it to the points (scale is then unused); tiling uses it to put the tile
+    grids on one lattice.
+    pcd may also be a loader.PointStream (file with normals): the bounding box
+    is then computed in one streaming pass and every solve splats normalized
+    chunks, so the cloud is never loaded as a whole.
+    Returns (mesh, densities): the sample support at each vertex, from the
+    splat weights of the finest solve (see formulation.support_density).
+    With lod=N, also extracts N coarser meshes from the same field (see
+    extract_lod_from_dense) and returns (mesh, densities, lods), where lods
+    is a list of (mesh, densities) from 2x to 2^N x coarser.
     """
     print(f"Running MANUAL Poisson reconstruction (depth={depth}, scale={scale})...")
     
     resolution = 2 ** depth
-    if resolution > 128:
-        print(f"  WARNING: Resolution {resolution}^3 may be slow. Consider depth <= 7.")
+    if resolution > 256:
+        print(f"  WARNING: Resolution {resolution}^3 may be slow. Consider depth <= 8.")
     
     # 1. Normalize Points to [0.05, 0.95]
-    points = np.asarray(pcd.points)
-    normals = np.asarray(pcd.normals)
+    streamed = isinstance(pcd, PointStream)
+    if streamed:
+        if not pcd.has_normals:
+            raise ValueError(f"Streaming {pcd.path} requires per-vertex normals (nx, ny, nz)")
+        with stage("bounding_box") as s:
+            bbox_min, bbox_max = pcd.bounding_box()
+            s["points"] = pcd.num_points
+        center, max_dim = bounds or _normalization(bbox_min, bbox_max, scale)
+        normalized_points = normals = None
+        print(f"  Streaming {pcd.num_points} points from {pcd.path} in chunks of {pcd.chunk_size}")
+    else:
+        normals = np.asarray(pcd.normals)
+        normalized_points, center, max_dim = _normalize_points(np.asarray(pcd.points), scale, bounds)
+        
+    # Out-of-core mode keeps V, b and x in memmaps under a per-run directory
+    if scratch_dir:
+        os.makedirs(scratch_dir, exist_ok=True)
+    scratch = tempfile.TemporaryDirectory(dir=scratch_dir) if scratch_dir else contextlib.nullcontext()
+    with scratch as run_dir:
+        # 2. Solve on dense grid (coarse-to-fine when cascading)
+        x = None
+        for level_depth in range(max(depth - cascade, 1), depth + 1):
+            level_res = 2 ** level_depth
+            x0 = None
+            if x is not None:
+                # In grid units the field amplitude scales with h^2 (splat mass per
+                # voxel and the unscaled stencil), so rescale the upsampled guess.
+                coarse_res = level_res // 2
+                x0 = upsample_dense(x, coarse_res, level_res) * ((coarse_res - 1) / (level_res - 1)) ** 2
+                if fem_degree == 2:
+                    # x holds quadratic B-spline coefficients, so upsample_dense gives the
+                    # coarse field's values at the fine nodes; the fine unknowns are
+                    # coefficients as well
+                    x0 = coefficients_dense(x0, level_res, fem_degree)
+            if cascade:
+                print(f"  Cascade level depth={level_depth} ({level_res}^3), warm start={x0 is not None}")
+            start = time.perf_counter()
+            with stage(f"depth_{level_depth}"):
+                chunks = normalized_chunks(pcd, center, max_dim) if streamed else None
+                # The finest level also keeps its splat weights for the vertex densities
+                x = solve_poisson_dense(normalized_points, normals, level_res, alpha,
+                                        matrix_free=matrix_free, solver=solver, x0=x0,
+                                        scratch_dir=run_dir, working_set_mb=working_set_mb,
+                                        precision=precision, chunks=chunks,
+                                        return_density=level_depth == depth, screening=screening,
+                                        fem_degree=fem_degree)
+            if level_depth == depth:
+                x, weights = x
+            if cascade:
+                print(f"  Cascade level depth={level_depth} done in {time.perf_counter() - start:.2f}s")
+        
+        # 3. Extract Isosurface
+        level = 0.0 if screening > 0 else None
+        if fem_degree is not None:
+            x = node_values_dense(x, resolution, fem_degree)
+        verts, faces = extract_isosurface_from_dense(x, resolution, workers=workers, level=level)
+        lod_meshes = []
+        if lod:
+            lods = extract_lod_from_dense(x, resolution, lod, workers=workers, level=level)
+            for k, (lod_verts, lod_faces) in enumerate(lods, 1):
+                if len(lod_verts) == 0:
+                    lod_meshes.append((Mesh(), []))
+                    continue
+                # W block-summed by 2^k like the field, then the usual density of that grid
+                lod_densities = support_density_dense(weights, resolution, lod_verts,
+                                                      reduction=DENSITY_REDUCTION * 2 ** k)
+                lod_meshes.append((_to_mesh(lod_verts, lod_faces, center, max_dim), lod_densities))
+        del x
+
+        # 4. Sample density per vertex from the splat weights
+        if verts is not None and len(verts) > 0:
+            densities = support_density_dense(weights, resolution, verts)
+        del weights
     
-    bbox_min = points.min(axis=0)
-    bbox_max = points.max(axis=0)
-    center = (bbox_min + bbox_max) / 2
-    extent = (bbox_max - bbox_min).max()
+    if verts is None or len(verts) == 0:
+        print("  Extraction failed.")
+        mesh, densities = Mesh(), []
+    else:
+        mesh = _to_mesh(verts, faces, center, max_dim)
+        print(f"Manual Reconstruction complete. Generated {len(mesh.vertices)} vertices.")
+
+    if lod:
+        return mesh, densities, lod_meshes
+    return mesh, densities
+
+def run_poisson_sparse(pcd, depth=8, scale=1.1, alpha=1e-5, padding=2, workers=1, screening=SCREENING, bounds=None):
+    """
+    Runs Manual Screened Poisson Surface Reconstruction on a SPARSE band.
+    Only the voxels around the samples (plus `padding` voxels) are unknowns,
+    so memory scales with the surface area and depth 9-10 is feasible.
+    bounds is as in run_poisson_manual.
+    Returns (mesh, densities) like run_poisson_manual.
+    """
+    print(f"Running SPARSE Poisson reconstruction (depth={depth}, scale={scale}, padding={padding})...")
     
-    max_dim = extent * scale
-    normalized_points = (points - center) / max_dim + 0.5
-    normalized_points = np.clip(normalized_points, 0.05, 0.95)
-        
-    # 2. Solve on dense grid
-    x = solve_poisson_dense(normalized_points, normals, resolution, alpha)
+    # 1. Normalize Points to [0.05, 0.95]
+    normals = np.asarray(pcd.normals)
+    normalized_points, center, max_dim = _normalize_points(np.asarray(pcd.points), scale, bounds)
     
-    # 3. Extract Isosurface
-    verts, faces = extract_isosurface_from_dense(x, resolution)
+    # 2. Solve on the active band
+    grid, x, weights = solve_poisson_sparse(normalized_points, normals, depth, alpha, padding=padding, return_density=True,
+                                         screening=screening)
+    
+    # 3. Extract Isosurface (level 0, band only)
+    verts, faces = extract_isosurface_dense(grid, x, workers=workers)
     
     if verts is None or len(verts) == 0:
         print("  Extraction failed.")
-        return o3d.geometry.TriangleMesh(), []
-        
-    # 4. Denormalize Vertices
-    verts_world = (verts - 0.5) * max_dim + center
+        return Mesh(), []
     
-    # Create Open3D mesh
-    mesh = o3d.geometry.TriangleMesh()
-    mesh.vertices = o3d.utility.Vector3dVector(verts_world)
+    mesh = _to_mesh(verts, faces, center, max_dim)
+
+    # 4. Sample density per vertex from the splat weights
+    densities = support_density_sparse(grid, weights, verts)
+    
+    print(f"Sparse Reconstruction complete. Generated {len(mesh.vertices)} vertices.")
+    return mesh, densities
+
+def _normalization(bbox_min, bbox_max, scale):
+    """Center and size of the normalized box for a bounding box. Returns (center, max_dim)."""
+    center = (bbox_min + bbox_max) / 2
+    extent = (bbox_max - bbox_min).max()
+    return center, extent * scale
+
+def _normalize_points(points, scale, bounds=None):
+    """
+    Maps points into [0.05, 0.95]^3, using the (center, max_dim) of bounds
+    if given. Returns (normalized, center, max_dim).
+    """
+    center, max_dim = bounds or _normalization(points.min(axis=0), points.max(axis=0), scale)
+    normalized_points = (points - center) / max_dim + 0.5
+    normalized_points = np.clip(normalized_points, 0.05, 0.95)
+    return normalized_points, center, max_dim
+
+def _to_mesh(verts, faces, center, max_dim):
+    """Denormalizes unit-box marching cubes output into a geometry.Mesh."""
+    verts_world = (verts - 0.5) * max_dim + center
     
     # Flip triangle winding order to fix outward-facing normals
     # Marching Cubes returns faces with inward-pointing normals for our formulation
     faces_flipped = faces[:, ::-1].astype(np.int32)
-    mesh.triangles = o3d.utility.Vector3iVector(faces_flipped)
+    mesh = Mesh(verts_world, faces_flipped)
     
     # Compute vertex normals
     mesh.compute_vertex_normals()
-    
-    print(f"Manual Reconstruction complete. Generated {len(mesh.vertices)} vertices.")
-    return mesh, []
+    return mesh
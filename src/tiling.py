@@ -0,0 +1,333 @@
+"""
+Tiled reconstruction of large scenes.
+
+The scene's bounding box is cut into cubic tile cores of equal size. Each
+tile is reconstructed on its own at the given depth from the samples of its
+core plus an overlap margin, in a pool of worker processes. Every tile job
+receives only its own samples, so worker memory is bounded by the tile
+depth, not by the scene size. The tile grids share one lattice: all tiles
+have the same voxel size, and the core faces lie on lattice planes. Each
+tile mesh is cropped to the triangles whose centroid lies in its core, so
+every marching cubes cell belongs to exactly one tile. The seam vertices,
+computed by both neighbours on the shared lattice edges, are then welded
+by their lattice edge key.
+"""
+import contextlib
+import functools
+import io
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .batch import run_batch, estimate_job_mb
+from .metrics import stage
+from .geometry import Mesh, PointCloud
+from .pysr.iso import edge_keys
+
+# Part of a tile's unit cube that may hold samples: the reconstruction clips
+# normalized points to [0.05, 0.95]
+USABLE_FRACTION = 0.9
+
+# Tiles with fewer samples are skipped (no meaningful surface)
+MIN_TILE_POINTS = 100
+
+# Seam vertices closer than this (in voxels) are welded by proximity: all
+# seam vertices with the Open3D backend, the cracks left by the lattice
+# edge keys otherwise
+WELD_VOXELS = 0.5
+
+# Vertices this close to a lattice node (in voxels, above the float32
+# rounding of the marching cubes output) are keyed by the node
+NODE_VOXELS = 1e-4
+
+def tile_layout(bbox_min, bbox_max, tiles, depth, overlap=0.1):
+    """
+    Lattice-aligned tiling of a bounding box, with `tiles` tile cores along
+    its longest axis. Each tile has a 2^depth grid. The core spans `core`
+    voxels and is padded by `margin` voxels of overlap on every side
+    (`overlap` x the core). Core plus margins fill the usable part of the
+    tile's cube. The core has the parity of res - 1, so core faces fall on
+    grid planes.
+    Returns a dict with the origin of tile (0, 0, 0), the voxel size, the
+    core/margin sizes in voxels, the tile counts per axis and the tiles'
+    (common) max_dim for the reconstruction.
+    """
+    res = 2 ** depth
+    usable = USABLE_FRACTION * (res - 1)
+    core = int(usable / (1 + 2 * overlap))
+    if core % 2 != (res - 1) % 2:
+        core -= 1
+    margin = int(overlap * core)
+    if core < 3:
+        raise ValueError(f"Depth {depth} is too small for tiling")
+
+    extent = np.asarray(bbox_max, dtype=np.float64) - np.asarray(bbox_min, dtype=np.float64)
+    voxel = extent.max() / (tiles * core)
+    tile_size = core * voxel
+    counts = np.maximum(np.ceil(extent / tile_size - 1e-9).astype(int), 1)
+
+    # Center the tiling on the scene
+    origin = (np.asarray(bbox_min) + np.asarray(bbox_max)) / 2 - counts * tile_size / 2
+    return {
+        "origin": origin,
+        "voxel": voxel,
+        "core": core,
+        "margin": margin,
+        "counts": counts,
+        "max_dim": (res - 1) * voxel,
+    }
+
+def tile_bounds(layout, key):
+    """
+    (crop_min, crop_max, center) of tile key = (ix, iy, iz). The crop box is
+    the core, open towards the outside of the scene: samples on the scene's
+    bounding box lie exactly on the outer core faces, so those faces must not cut.
+    """
+    key = np.asarray(key)
+    tile_size = layout["core"] * layout["voxel"]
+    core_min = layout["origin"] + key * tile_size
+    crop_min = np.where(key == 0, -np.inf, core_min)
+    crop_max = np.where(key == layout["counts"] - 1, np.inf, core_min + tile_size)
+    return crop_min, crop_max, core_min + tile_size / 2
+
+def bucket_points(points, layout):
+    """
+    Assigns every sample to the tiles whose core plus margin contains it (up
+    to 2 per axis, since the margin is less than half a core).
+    Returns {tile key: sorted point indices}, for non-empty tiles only.
+    """
+    counts = layout["counts"]
+    u = (points - layout["origin"]) / (layout["core"] * layout["voxel"])
+    m = layout["margin"] / layout["core"]
+    lo = np.clip(np.floor(u - m).astype(int), 0, counts - 1)
+    hi = np.clip(np.floor(u + m).astype(int), 0, counts - 1)
+
+    point_idx, tile_ids = [], []
+    for cx in (lo, hi):
+        for cy in (lo, hi):
+            for cz in (lo, hi):
+                # Take the hi cell of an axis only where it differs from lo
+                keep = np.ones(len(points), dtype=bool)
+                for axis, c in enumerate((cx, cy, cz)):
+                    if c is hi:
+                        keep &= hi[:, axis] != lo[:, axis]
+                ids = (cx[keep, 0] * counts[1] + cy[keep, 1]) * counts[2] + cz[keep, 2]
+                point_idx.append(np.nonzero(keep)[0])
+                tile_ids.append(ids)
+
+    point_idx = np.concatenate(point_idx)
+    tile_ids = np.concatenate(tile_ids)
+    order = np.lexsort((point_idx, tile_ids))
+    point_idx, tile_ids = point_idx[order], tile_ids[order]
+
+    ids, starts = np.unique(tile_ids, return_index=True)
+    buckets = {}
+    for tile_id, part in zip(ids, np.split(point_idx, starts[1:])):
+        key = tuple(int(v) for v in np.unravel_index(tile_id, counts))
+        buckets[key] = part
+    return buckets
+
+def tile_job(job, method, depth, options):
+    """
+    Reconstructs one tile in a worker process and crops it to its core
+    (see tile_bounds).
+    Returns the cropped vertices, triangles and densities as arrays.
+    """
+    from .reconstruction import run_poisson, run_poisson_manual, run_poisson_sparse
+
+    pcd = PointCloud(job["points"], job["normals"])
+    bounds = (job["center"], job["max_dim"])
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if method == "sparse":
+                mesh, densities = run_poisson_sparse(pcd, depth=depth, bounds=bounds, **options)
+            elif method == "manual":
+                mesh, densities = run_poisson_manual(pcd, depth=depth, bounds=bounds, **options)
+            else:
+                # Open3D fits its own grid to the points; its seams are only welded by proximity
+                mesh, densities = run_poisson(pcd, depth=depth, **options)
+    except Exception as e:
+        return {"status": "failed", "error": repr(e)}
+
+    vertices, triangles = crop_to_core(np.asarray(mesh.vertices), np.asarray(mesh.triangles),
+                                       job["crop_min"], job["crop_max"])
+    used = np.unique(triangles)
+    remap = np.full(len(mesh.vertices), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return {
+        "status": "ok",
+        "vertices": vertices[used],
+        "triangles": remap[triangles],
+        "densities": np.asarray(densities, dtype=np.float64)[used],
+    }
+
+def crop_to_core(vertices, triangles, crop_min, crop_max):
+    """
+    Keeps the triangles whose centroid lies in the half-open box
+    [crop_min, crop_max), so each triangle belongs to exactly one tile.
+    Returns (vertices, kept triangles).
+    """
+    if len(triangles) == 0:
+        return vertices, triangles.reshape(0, 3)
+    centroids = vertices[triangles].mean(axis=1)
+    inside = np.all((centroids >= crop_min) & (centroids < crop_max), axis=1)
+    return vertices, triangles[inside]
+
+def lattice_keys(vertices, layout):
+    """
+    Grid-edge keys (pysr.iso.edge_keys) of vertices on the shared lattice.
+    Every marching cubes vertex lies on a lattice edge, so two of its
+    coordinates are whole voxels. The lattice is shifted by one tile grid so
+    the indices of every tile's grid are non-negative.
+    """
+    pad = int(round(layout["max_dim"] / layout["voxel"]))
+    g = (vertices - layout["origin"]) / layout["voxel"] + pad
+    nearest = np.round(g)
+    frac = np.abs(g - nearest)
+    rows = np.arange(len(g))
+    axis = np.argmax(frac, axis=1)
+    on_node = frac[rows, axis] < NODE_VOXELS
+    axis[on_node] = 0
+
+    base = nearest.astype(np.int64)
+    base[rows, axis] = np.where(on_node, base[rows, axis], np.floor(g[rows, axis]))
+    return edge_keys(base, axis)
+
+def weld_seams(vertices, triangles, densities, layout, tol):
+    """
+    Merges the vertices that neighbouring tiles computed on the same lattice
+    edge (see lattice_keys). Where the tiles disagree on the sign of a
+    near-zero seam node, their vertices lie on different edges and leave a
+    crack; only the vertices still on an open edge after the key weld are
+    then merged by proximity (see weld_seams_proximity). Welded vertices take
+    the mean position and density. Triangles that collapse are dropped.
+    Returns (vertices, triangles, densities, number of welded vertices).
+    """
+    _, component = np.unique(lattice_keys(vertices, layout), return_inverse=True)
+    vertices, triangles, densities, welded = _merge_vertices(vertices, triangles, densities, component.ravel())
+
+    pairs = _seam_pairs(vertices, _open_edge_vertices(triangles), layout, tol)
+    vertices, triangles, densities, cracks = _merge_vertices(vertices, triangles, densities,
+                                                             _pair_components(pairs, len(vertices)))
+    return vertices, triangles, densities, welded + cracks
+
+def weld_seams_proximity(vertices, triangles, densities, labels, layout, tol):
+    """
+    weld_seams for tiles that do not share a lattice (Open3D fits its own
+    grid to each tile): merges vertices of different tiles that are closer
+    than tol and lie within tol of an interior tile face.
+    """
+    pairs = _seam_pairs(vertices, np.arange(len(vertices)), layout, tol)
+    pairs = pairs[labels[pairs[:, 0]] != labels[pairs[:, 1]]]
+    return _merge_vertices(vertices, triangles, densities, _pair_components(pairs, len(vertices)))
+
+def _seam_pairs(vertices, candidates, layout, tol):
+    """Pairs of candidate vertices closer than tol and within tol of an interior tile face."""
+    tile_size = layout["core"] * layout["voxel"]
+    u = (vertices[candidates] - layout["origin"]) / tile_size
+    nearest = np.round(u)
+    near_face = (np.abs(u - nearest) * tile_size < tol) & (nearest > 0) & (nearest < layout["counts"])
+    seam = candidates[near_face.any(axis=1)]
+    return seam[cKDTree(vertices[seam]).query_pairs(tol, output_type="ndarray")].reshape(-1, 2)
+
+def _open_edge_vertices(triangles):
+    """Vertices of the edges used by a single triangle."""
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    return np.unique(edges[counts == 1])
+
+def _pair_components(pairs, n):
+    """Connected components (one label per vertex) of the graph of vertex pairs."""
+    graph = sparse.csr_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+def _merge_vertices(vertices, triangles, densities, component):
+    """Merges the vertices of each component (0..num-1) and drops collapsed triangles."""
+    n = len(vertices)
+    num = component.max() + 1 if n else 0
+    size = np.bincount(component, minlength=num)
+    welded = np.stack([np.bincount(component, weights=vertices[:, d], minlength=num) for d in range(3)], axis=1)
+    welded /= size[:, None]
+    welded_densities = np.bincount(component, weights=densities, minlength=num) / size
+
+    triangles = component[triangles]
+    keep = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+            & (triangles[:, 0] != triangles[:, 2]))
+    return welded, triangles[keep], welded_densities, n - num
+
+def run_tiled(pcd, method, depth, options, tiles=2, overlap=0.1, workers=2, budget_mb=8192):
+    """
+    Reconstructs pcd tile by tile with the given backend ("manual",
+    "sparse" or "open3d") and options, and merges the tiles.
+    See tile_layout for tiles/overlap; tile jobs run in `workers` processes
+    under the memory budget of batch.run_batch.
+    Returns (mesh, densities) like the single-grid backends.
+    """
+    points = np.asarray(pcd.points)
+    normals = np.asarray(pcd.normals)
+
+    layout = tile_layout(points.min(axis=0), points.max(axis=0), tiles, depth, overlap)
+    counts = layout["counts"]
+    print(f"Running TILED reconstruction ({method}, {counts[0]}x{counts[1]}x{counts[2]} tiles at depth {depth}, "
+          f"core {layout['core']} + {layout['margin']} voxels overlap)...")
+    print(f"  Effective resolution: {layout['voxel']:.4g} per voxel "
+          f"(~{int(round(counts.max() * layout['core']))} voxels along the longest axis)")
+
+    with stage("bucket", tiles=int(counts.prod())) as s:
+        buckets = bucket_points(points, layout)
+        s["occupied"] = len(buckets)
+
+    matrix_free = options.get("matrix_free", False)
+    precision = options.get("precision", "float64")
+    jobs = []
+    for key, idx in sorted(buckets.items()):
+        if len(idx) < MIN_TILE_POINTS:
+            continue
+        crop_min, crop_max, center = tile_bounds(layout, key)
+        tile_mb = (points[idx].nbytes + normals[idx].nbytes) / 2**20
+        jobs.append({
+            "input": f"tile {key} ({len(idx)} points)",
+            "points": points[idx],
+            "normals": normals[idx],
+            "crop_min": crop_min,
+            "crop_max": crop_max,
+            "center": center,
+            "max_dim": layout["max_dim"],
+            "estimated_mb": estimate_job_mb("", method, depth, matrix_free, precision) + 4 * tile_mb,
+        })
+    print(f"  {len(jobs)} tiles with samples, {workers} workers, {budget_mb} MB budget")
+
+    with stage("tiles", jobs=len(jobs), workers=workers):
+        results = run_batch(functools.partial(tile_job, method=method, depth=depth, options=options),
+                            jobs, workers, budget_mb)
+
+    parts = [r for r in results if r["status"] == "ok" and len(r["triangles"])]
+    for r in results:
+        if r["status"] != "ok":
+            print(f"  Warning: {r['input']} failed ({r['error']}); its region is left empty")
+    if not parts:
+        print("  Extraction failed.")
+        return Mesh(), []
+
+    with stage("merge", tiles=len(parts)) as s:
+        offsets = np.cumsum([0] + [len(r["vertices"]) for r in parts])
+        vertices = np.concatenate([r["vertices"] for r in parts])
+        triangles = np.concatenate([r["triangles"] + off for r, off in zip(parts, offsets)])
+        densities = np.concatenate([r["densities"] for r in parts])
+        labels = np.repeat(np.arange(len(parts)), np.diff(offsets))
+        if method == "open3d":
+            vertices, triangles, densities, welded = weld_seams_proximity(vertices, triangles, densities, labels,
+                                                                          layout, WELD_VOXELS * layout["voxel"])
+        else:
+            vertices, triangles, densities, welded = weld_seams(vertices, triangles, densities, layout,
+                                                                WELD_VOXELS * layout["voxel"])
+        s["welded"] = welded
+        s["vertices"] = len(vertices)
+    print(f"  Merged {len(parts)} tiles, welded {welded} seam vertices")
+
+    mesh = Mesh(vertices, triangles)
+    mesh.compute_vertex_normals()
+    print(f"Tiled Reconstruction complete. Generated {len(mesh.vertices)} vertices.")
+    return mesh, densities
@@ -1,5 +1,5 @@
-import open3d as o3d
 import numpy as np
+from .geometry import Mesh, PointCloud
 
 def generate_sphere_point_cloud(radius=1.0, num_points=2000, noise_std=0.0):
     """Generates a synthetic point cloud of a sphere."""
@@ -19,17 +19,15 @@ def generate_sphere_point_cloud(radius=1.0, num_points=2000, noise_std=0.0):
     if noise_std > 0:
         points += np.random.normal(0, noise_std, points.shape)
         
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(points)
-    
     # Normals (for a sphere at origin, normal is just the normalized position vector)
     # If we want to simulate "estimated" normals, we might not set them here and let preprocess do it.
     # But for a clear ground truth, let's set them.
     normals = points / np.linalg.norm(points, axis=1, keepdims=True)
-    pcd.normals = o3d.utility.Vector3dVector(normals)
     
-    return pcd
+    return PointCloud(points, normals)
 
 def visualize(geometries, window_name="Open3D"):
-    """Visualizes a list of geometries."""
+    """Visualizes a list of geometries (Open3D or geometry.Mesh / PointCloud)."""
+    import open3d as o3d
+    geometries = [g.to_open3d() if isinstance(g, (Mesh, PointCloud)) else g for g in geometries]
     o3d.visualization.draw_geometries(geometries, window_name=window_name)
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pytest
+
+import main
+from src.cache import ResultCache, cache_key
+
+@pytest.fixture
+def cloud():
+    rng = np.random.default_rng(0)
+    return rng.random((100, 3)), rng.normal(size=(100, 3))
+
+def key_for(points, normals, argv):
+    args = main.build_parser().parse_args(argv)
+    params = main.reconstruction_params(args)
+    if normals is None:
+        params.update(main.normal_params(args))
+    return cache_key(points, normals, **params)
+
+def test_key_is_stable(cloud):
+    points, normals = cloud
+    argv = ["--manual", "--depth", "6"]
+    assert key_for(points, normals, argv) == key_for(points.copy(), normals.copy(), argv)
+    # Same values in another dtype or memory layout
+    assert key_for(np.asfortranarray(points), normals, argv) == key_for(points, normals, argv)
+
+def test_key_depends_on_input_and_parameters(cloud):
+    points, normals = cloud
+    base = key_for(points, normals, ["--manual", "--depth", "6"])
+    assert key_for(points, normals, ["--manual", "--depth", "7"]) != base
+    assert key_for(points, normals, ["--manual", "--depth", "6", "--screening", "4"]) != base
+    assert key_for(points, -normals, ["--manual", "--depth", "6"]) != base
+    assert key_for(points, None, ["--manual", "--depth", "6"]) != base
+
+def test_key_separates_normal_estimation_parameters(cloud):
+    points, _ = cloud
+    argv = ["--manual", "--depth", "6", "--normals", "pca"]
+    keys = {
+        key_for(points, None, argv + ["--orient", "centroid"]),
+        key_for(points, None, argv + ["--orient", "propagate"]),
+        key_for(points, None, argv + ["--orient", "viewpoint", "--viewpoint", "0", "0", "5"]),
+        key_for(points, None, argv + ["--orient", "viewpoint", "--viewpoint", "0", "0", "-5"]),
+        key_for(points, None, ["--manual", "--depth", "6", "--normals", "open3d", "--orient", "centroid"]),
+    }
+    assert len(keys) == 5
+
+def test_key_separates_cache_versions(cloud, monkeypatch):
+    points, normals = cloud
+    argv = ["--manual", "--depth", "6"]
+    before = key_for(points, normals, argv)
+    monkeypatch.setattr(main, "CACHE_VERSION", main.CACHE_VERSION + 1)
+    assert key_for(points, normals, argv) != before
+
+def test_put_get_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    assert cache.get("k1") is None
+    cache.put("k1", vertices=np.arange(12.0).reshape(4, 3), triangles=np.array([[0, 1, 2]]))
+    arrays = cache.get("k1")
+    np.testing.assert_array_equal(arrays["vertices"], np.arange(12.0).reshape(4, 3))
+    np.testing.assert_array_equal(arrays["triangles"], [[0, 1, 2]])
+
+def test_put_is_atomic(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put("k1", a=np.zeros(3))
+
+    def failing_save(f, **arrays):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "savez_compressed", failing_save)
+    with pytest.raises(OSError):
+        cache.put("k1", a=np.ones(3))
+    with pytest.raises(OSError):
+        cache.put("k2", a=np.ones(3))
+
+    # The old entry is intact, no partial entry or temporary file is left
+    np.testing.assert_array_equal(cache.get("k1")["a"], np.zeros(3))
+    assert cache.get("k2") is None
+    assert sorted(os.listdir(tmp_path)) == ["k1.npz"]
+
+@pytest.mark.parametrize("fraction", [0.0, 0.001, 0.5])
+def test_truncated_entry_is_a_miss_and_removed(tmp_path, fraction):
+    cache = ResultCache(str(tmp_path))
+    cache.put("k1", a=np.arange(10000.0))
+    path = tmp_path / "k1.npz"
+    data = path.read_bytes()
+    path.write_bytes(data[:int(fraction * len(data))])
+
+    assert cache.get("k1") is None
+    assert not path.exists()
+    cache.put("k1", a=np.arange(3.0))
+    np.testing.assert_array_equal(cache.get("k1")["a"], np.arange(3.0))
+
+def test_garbage_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    (tmp_path / "k1.npz").write_bytes(b"not a zip file at all")
+    assert cache.get("k1") is None
+    assert not (tmp_path / "k1.npz").exists()
+
+def test_evicts_least_recently_used(tmp_path):
+    # Random data does not compress: each entry is a bit over 0.4 MB
+    rng = np.random.default_rng(0)
+    cache = ResultCache(str(tmp_path), max_size_mb=1)
+    cache.put("old", a=rng.random(50_000))
+    cache.put("used", a=rng.random(50_000))
+    os.utime(tmp_path / "old.npz", (1, 1))
+    os.utime(tmp_path / "used.npz", (2, 2))
+    assert cache.get("used") is not None  # refreshes its mtime
+
+    cache.put("new", a=rng.random(50_000))
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.get("new") is not None
+
+def test_keeps_the_entry_just_stored(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_mb=0)
+    cache.put("big", a=np.random.default_rng(0).random(50_000))
+    assert cache.get("big") is not None
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from src.geometry import Mesh, write_ply
+
+# Unit square split into two triangles; vertex 4 repeats vertex 1
+SQUARE = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [1, 0, 0]], dtype=np.float64)
+
+def read_ply(path):
+    """Reads write_ply's output back with NumPy: (vertices, normals or None, triangles)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    end = data.index(b"end_header\n") + len(b"end_header\n")
+    header = data[:end].decode("ascii").splitlines()
+    assert header[1] == "format binary_little_endian 1.0"
+    n_verts = int(header[2].split()[-1])
+    props = [line.split()[-1] for line in header if line.startswith("property double")]
+    n_faces = int(next(line for line in header if line.startswith("element face")).split()[-1])
+
+    verts = np.frombuffer(data, dtype="<f8", count=n_verts * len(props), offset=end).reshape(n_verts, len(props))
+    faces = np.frombuffer(data, dtype=[("count", "u1"), ("indices", "<i4", (3,))], count=n_faces,
+                          offset=end + verts.nbytes)
+    assert end + verts.nbytes + faces.nbytes == len(data)
+    assert np.all(faces["count"] == 3)
+    return verts[:, :3], (verts[:, 3:] if len(props) == 6 else None), faces["indices"]
+
+def positions(mesh):
+    """Triangles as their corner coordinates, independent of vertex numbering."""
+    return mesh.vertices[mesh.triangles]
+
+def test_remove_duplicated_vertices():
+    normals = np.tile([0.0, 0.0, 1.0], (5, 1))
+    normals[4] = [0.0, 0.0, -1.0]
+    mesh = Mesh(SQUARE, [[0, 1, 2], [0, 2, 3], [4, 2, 0]], normals)
+    before = positions(mesh)
+
+    mesh.remove_duplicated_vertices()
+
+    # The first occurrence survives, in the original order, with its normal
+    np.testing.assert_array_equal(mesh.vertices, SQUARE[:4])
+    np.testing.assert_array_equal(mesh.vertex_normals, normals[:4])
+    np.testing.assert_array_equal(mesh.triangles, [[0, 1, 2], [0, 2, 3], [1, 2, 0]])
+    np.testing.assert_array_equal(positions(mesh), before)
+
+def test_duplicated_triangles_after_vertex_merge():
+    # [4, 2, 0] is [0, 1, 2] in another winding once vertex 4 is merged into 1
+    mesh = Mesh(SQUARE, [[0, 1, 2], [0, 2, 3], [4, 2, 0]])
+    mesh.remove_duplicated_vertices().remove_duplicated_triangles()
+    np.testing.assert_array_equal(mesh.triangles, [[0, 1, 2], [0, 2, 3]])
+
+def test_remove_degenerate_triangles():
+    mesh = Mesh(SQUARE[:4], [[0, 1, 1], [0, 1, 2], [2, 2, 2], [3, 0, 3], [0, 2, 3]])
+    mesh.remove_degenerate_triangles()
+    np.testing.assert_array_equal(mesh.triangles, [[0, 1, 2], [0, 2, 3]])
+    assert len(mesh.vertices) == 4
+
+def test_remove_unreferenced_vertices():
+    vertices = np.vstack([[5.0, 5.0, 5.0], SQUARE[:4], [7.0, 7.0, 7.0]])
+    normals = np.arange(18, dtype=np.float64).reshape(6, 3)
+    mesh = Mesh(vertices, [[1, 2, 3], [1, 3, 4]], normals)
+    before = positions(mesh)
+
+    mesh.remove_unreferenced_vertices()
+
+    np.testing.assert_array_equal(mesh.vertices, SQUARE[:4])
+    np.testing.assert_array_equal(mesh.vertex_normals, normals[1:5])
+    np.testing.assert_array_equal(mesh.triangles, [[0, 1, 2], [0, 2, 3]])
+    np.testing.assert_array_equal(positions(mesh), before)
+
+def test_cleanup_on_empty_mesh():
+    mesh = Mesh()
+    mesh.remove_degenerate_triangles().remove_duplicated_triangles()
+    mesh.remove_duplicated_vertices().remove_unreferenced_vertices()
+    assert mesh.vertices.shape == (0, 3) and mesh.triangles.shape == (0, 3)
+
+@pytest.mark.parametrize("with_normals", [True, False])
+def test_write_ply_round_trip(tmp_path, with_normals):
+    rng = np.random.default_rng(0)
+    vertices = rng.normal(size=(50, 3))
+    triangles = rng.integers(0, 50, size=(80, 3))
+    mesh = Mesh(vertices, triangles)
+    if with_normals:
+        mesh.compute_vertex_normals()
+
+    path = tmp_path / "mesh.ply"
+    write_ply(str(path), mesh)
+    verts, normals, faces = read_ply(path)
+
+    np.testing.assert_array_equal(verts, vertices)
+    np.testing.assert_array_equal(faces, triangles)
+    if with_normals:
+        np.testing.assert_array_equal(normals, mesh.vertex_normals)
+    else:
+        assert normals is None
+
+def test_write_ply_empty(tmp_path):
+    path = tmp_path / "empty.ply"
+    write_ply(str(path), Mesh())
+    verts, normals, faces = read_ply(path)
+    assert verts.shape == (0, 3) and faces.shape == (0, 3) and normals is None
@@ -0,0 +1,163 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from src.loader import PointStream, normalized_chunks
+from src.preprocess import load_point_cloud
+
+N = 257
+
+@pytest.fixture
+def cloud():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(N, 3)) * [1.0, 2.0, 0.5] + [3.0, -1.0, 0.0]
+    normals = rng.normal(size=(N, 3))
+    return points.astype(np.float32), normals.astype(np.float32)
+
+def write_ply(path, points, normals=None, fmt="binary_little_endian", extra=True):
+    """PLY with float x y z [nx ny nz] and (extra) a uchar property in between."""
+    props = [("x", "f4"), ("y", "f4"), ("z", "f4")]
+    if extra:
+        props.append(("red", "u1"))
+    if normals is not None:
+        props += [("nx", "f4"), ("ny", "f4"), ("nz", "f4")]
+    names = {"f4": "float", "u1": "uchar"}
+    header = ["ply", f"format {fmt} 1.0", "comment written by the tests", f"element vertex {len(points)}"]
+    header += [f"property {names[t]} {name}" for name, t in props]
+    header += ["element face 0", "property list uchar int vertex_indices", "end_header"]
+
+    columns = {"x": points[:, 0], "y": points[:, 1], "z": points[:, 2], "red": np.full(len(points), 7)}
+    if normals is not None:
+        columns.update(nx=normals[:, 0], ny=normals[:, 1], nz=normals[:, 2])
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        if fmt == "ascii":
+            rows = zip(*(columns[name] for name, _ in props))
+            f.write("".join(" ".join(repr(float(v)) if t == "f4" else str(int(v)) for v, (_, t) in zip(row, props))
+                            + "\n" for row in rows).encode("ascii"))
+        else:
+            order = "<" if fmt == "binary_little_endian" else ">"
+            data = np.empty(len(points), dtype=[(name, order + t) for name, t in props])
+            for name, _ in props:
+                data[name] = columns[name]
+            f.write(data.tobytes())
+
+def read_all(stream):
+    chunks = list(stream)
+    points = np.concatenate([p for p, _ in chunks])
+    normals = np.concatenate([n for _, n in chunks]) if stream.has_normals else None
+    return chunks, points, normals
+
+@pytest.mark.parametrize("fmt", ["binary_little_endian", "binary_big_endian", "ascii"])
+@pytest.mark.parametrize("with_normals", [True, False])
+def test_ply_matches_direct_load(tmp_path, cloud, fmt, with_normals):
+    points, normals = cloud
+    path = tmp_path / "cloud.ply"
+    write_ply(path, points, normals if with_normals else None, fmt)
+
+    stream = PointStream(str(path), chunk_size=50)
+    assert stream.has_normals == with_normals
+    chunks, got_points, got_normals = read_all(stream)
+    assert len(chunks) == -(-N // 50)
+    assert all(len(p) <= 50 for p, _ in chunks)
+    np.testing.assert_allclose(got_points, points, rtol=1e-6)
+    if with_normals:
+        np.testing.assert_allclose(got_normals, normals, rtol=1e-6)
+    else:
+        assert all(n is None for _, n in chunks)
+
+    lo, hi = stream.bounding_box()
+    np.testing.assert_allclose(lo, points.min(axis=0), rtol=1e-6)
+    np.testing.assert_allclose(hi, points.max(axis=0), rtol=1e-6)
+    assert stream.num_points == N
+
+def test_binary_ply_is_memory_mapped(tmp_path, cloud):
+    points, normals = cloud
+    path = tmp_path / "cloud.ply"
+    write_ply(path, points, normals)
+    stream = PointStream(str(path))
+    assert stream.format == "binary"
+    # Iterating twice gives the same data (the stream is re-entrant)
+    np.testing.assert_array_equal(read_all(stream)[1], read_all(stream)[1])
+
+@pytest.mark.parametrize("ext, with_normals", [(".xyz", False), (".xyzn", True)])
+def test_xyz_matches_direct_load(tmp_path, cloud, ext, with_normals):
+    points, normals = cloud
+    data = np.hstack([points, normals]) if with_normals else points
+    path = tmp_path / f"cloud{ext}"
+    np.savetxt(path, data)
+
+    stream = PointStream(str(path), chunk_size=100)
+    assert stream.has_normals == with_normals
+    _, got_points, got_normals = read_all(stream)
+    direct = np.loadtxt(path)
+    np.testing.assert_array_equal(got_points, direct[:, :3])
+    if with_normals:
+        np.testing.assert_array_equal(got_normals, direct[:, 3:6])
+
+def test_normalized_chunks(tmp_path, cloud):
+    points, normals = cloud
+    path = tmp_path / "cloud.xyzn"
+    np.savetxt(path, np.hstack([points, normals]))
+    stream = PointStream(str(path), chunk_size=64)
+    lo, hi = stream.bounding_box()
+    center, max_dim = (lo + hi) / 2, (hi - lo).max() * 1.1
+
+    chunks = list(normalized_chunks(stream, center, max_dim))
+    got = np.concatenate([p for p, _ in chunks])
+    direct = np.loadtxt(path)
+    expected = np.clip((direct[:, :3] - center) / max_dim + 0.5, 0.05, 0.95)
+    np.testing.assert_allclose(got, expected)
+    np.testing.assert_array_equal(np.concatenate([n for _, n in chunks]), direct[:, 3:6])
+    assert got.min() >= 0.05 and got.max() <= 0.95
+
+def test_header_without_coordinates_is_rejected(tmp_path):
+    path = tmp_path / "abc.ply"
+    path.write_text("ply\nformat ascii 1.0\nelement vertex 2\nproperty float a\nproperty float b\n"
+                    "property float c\nend_header\n0 0 0\n1 1 1\n")
+    with pytest.raises(ValueError, match="x/y/z"):
+        PointStream(str(path))
+
+@pytest.fixture
+def fake_open3d(monkeypatch):
+    """Records the paths passed to open3d.io.read_point_cloud (Open3D itself is optional)."""
+    calls = []
+
+    class Cloud:
+        points = np.zeros((3, 3))
+
+        def has_points(self):
+            return True
+
+    def read_point_cloud(path):
+        calls.append(path)
+        return Cloud()
+
+    module = types.SimpleNamespace(io=types.SimpleNamespace(read_point_cloud=read_point_cloud))
+    monkeypatch.setitem(sys.modules, "open3d", module)
+    return calls
+
+def test_malformed_body_falls_back_to_open3d(tmp_path, fake_open3d):
+    path = tmp_path / "bad.ply"
+    path.write_text("ply\nformat ascii 1.0\nelement vertex 2\nproperty float x\nproperty float y\n"
+                    "property float z\nend_header\n0 0 0\n1 oops 1\n")
+    pcd = load_point_cloud(str(path))
+    assert fake_open3d == [str(path)]
+    assert len(pcd.points) == 3
+
+def test_bad_header_falls_back_to_open3d(tmp_path, fake_open3d):
+    path = tmp_path / "abc.ply"
+    path.write_text("ply\nformat ascii 1.0\nelement vertex 1\nproperty float a\nend_header\n0\n")
+    load_point_cloud(str(path))
+    assert fake_open3d == [str(path)]
+
+def test_valid_file_does_not_need_open3d(tmp_path, cloud, fake_open3d):
+    points, normals = cloud
+    path = tmp_path / "cloud.ply"
+    write_ply(path, points, normals)
+    pcd = load_point_cloud(str(path))
+    assert fake_open3d == []
+    np.testing.assert_allclose(np.asarray(pcd.points), points, rtol=1e-6)
+    np.testing.assert_allclose(np.asarray(pcd.normals), normals, rtol=1e-6)
@@ -0,0 +1,107 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from src.pysr.formulation import trilinear_stencil, idx_to_coord
+from src.pysr.octree import SparseGrid, morton_encode, morton_decode, FACE_OFFSETS, BOX_OFFSETS, MAX_DEPTH
+from src.pysr.solver import solve_poisson_dense, solve_poisson_sparse
+
+DEPTH = 4
+RES = 2 ** DEPTH
+
+@pytest.fixture
+def grid_and_index():
+    """A SparseGrid over a random key set and the matching dense index volume (-1 = inactive)."""
+    rng = np.random.default_rng(0)
+    coords = rng.integers(0, RES, size=(600, 3))
+    grid = SparseGrid(DEPTH)
+    # Two batches, with repeats, to exercise the key union
+    grid.add_coords(coords[:400])
+    grid.add_coords(coords[300:])
+
+    dense = np.full((RES, RES, RES), -1, dtype=np.int64)
+    dense[tuple(grid.coords.T)] = np.arange(grid.get_num_nodes())
+    return grid, dense, coords
+
+def dense_lookup(dense, coords):
+    inside = np.all((coords >= 0) & (coords < RES), axis=1)
+    idx = np.full(len(coords), -1, dtype=np.int64)
+    idx[inside] = dense[tuple(coords[inside].T)]
+    return idx
+
+def sphere_samples(n=3000):
+    rng = np.random.default_rng(0)
+    normals = rng.normal(size=(n, 3))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return 0.5 + 0.3 * normals, normals
+
+def test_morton_round_trip():
+    rng = np.random.default_rng(1)
+    coords = rng.integers(0, 2 ** MAX_DEPTH, size=(1000, 3))
+    coords[0] = 2 ** MAX_DEPTH - 1
+    np.testing.assert_array_equal(morton_decode(morton_encode(coords)), coords)
+
+def test_keys_are_sorted_and_unique(grid_and_index):
+    grid, _, coords = grid_and_index
+    assert np.all(grid.keys[1:] > grid.keys[:-1])
+    assert {tuple(c) for c in grid.coords} == {tuple(c) for c in coords}
+
+def test_lookup_matches_dense_index(grid_and_index):
+    grid, dense, _ = grid_and_index
+    # Every node of the grid plus a ring of outside coords
+    query = np.stack(np.meshgrid(*[np.arange(-1, RES + 1)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    np.testing.assert_array_equal(grid.lookup(query), dense_lookup(dense, query))
+
+@pytest.mark.parametrize("offsets", [FACE_OFFSETS, BOX_OFFSETS])
+def test_neighbors_match_dense_index(grid_and_index, offsets):
+    grid, dense, _ = grid_and_index
+    expected = np.stack([dense_lookup(dense, grid.coords + off) for off in offsets], axis=1)
+    np.testing.assert_array_equal(grid.neighbors(offsets), expected)
+
+@pytest.mark.parametrize("steps", [1, 2])
+def test_expand_buffer_is_box_dilation(grid_and_index, steps):
+    grid, dense, _ = grid_and_index
+    active = dense >= 0
+    grid.expand_buffer(steps)
+
+    # Dilation by a (2 * steps + 1)^3 box, clipped to the grid
+    padded = np.pad(active, steps)
+    dilated = np.zeros_like(active)
+    for dx in range(2 * steps + 1):
+        for dy in range(2 * steps + 1):
+            for dz in range(2 * steps + 1):
+                dilated |= padded[dx:dx + RES, dy:dy + RES, dz:dz + RES]
+
+    assert grid.get_num_nodes() == dilated.sum()
+    np.testing.assert_array_equal(np.sort(np.ravel_multi_index(tuple(grid.coords.T), (RES,) * 3)),
+                                  np.flatnonzero(dilated))
+
+def test_depth_limit():
+    with pytest.raises(ValueError):
+        SparseGrid(MAX_DEPTH + 1)
+
+def solve_both(depth, padding):
+    points, normals = sphere_samples()
+    res = 2 ** depth
+    with contextlib.redirect_stdout(io.StringIO()):
+        x_dense = solve_poisson_dense(points, normals, res)
+        grid, x_sparse = solve_poisson_sparse(points, normals, depth, padding=padding)
+    return points, grid, x_sparse, x_dense.reshape(res, res, res)[tuple(grid.coords.T)]
+
+def test_sparse_solve_on_full_band_matches_dense():
+    # A padding of res covers the whole grid: the same linear system
+    _, grid, x_sparse, x_dense = solve_both(DEPTH, padding=RES)
+    assert grid.get_num_nodes() == RES ** 3
+    np.testing.assert_allclose(x_sparse, x_dense, rtol=0, atol=1e-8 * np.abs(x_dense).max())
+
+def test_sparse_solve_in_band_agrees_with_dense():
+    # The default band is Dirichlet zero outside, so only the sign at the
+    # samples' stencil nodes (where the surface is extracted) must agree
+    depth = DEPTH + 1
+    points, grid, x_sparse, x_dense = solve_both(depth, padding=2)
+    idx, _ = trilinear_stencil(points, 2 ** depth)
+    stencil = grid.lookup(np.stack(idx_to_coord(np.unique(idx), 2 ** depth), axis=1))
+    assert np.all(stencil >= 0)
+    assert np.mean(np.sign(x_sparse[stencil]) == np.sign(x_dense[stencil])) > 0.99
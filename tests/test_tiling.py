@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.pysr.iso import edge_keys, march_dense_brick, weld_bricks
+from src.tiling import lattice_keys, weld_seams
+
+BRICK = 8
+
+@pytest.fixture
+def bricks():
+    """Marching cubes of two touching spheres' distance field on 2^3 bricks sharing their faces."""
+    grid = np.stack(np.meshgrid(*[np.arange(2 * BRICK + 1)] * 3, indexing="ij"), axis=-1).astype(np.float64)
+    sdf = np.minimum(np.linalg.norm(grid - [8.2, 4.9, 8.1], axis=-1) - 3.7,
+                     np.linalg.norm(grid - [7.7, 11.6, 8.3], axis=-1) - 3.1)
+    origins = [(x, y, z) for x in (0, BRICK) for y in (0, BRICK) for z in (0, BRICK)]
+    return [r for r in (march_dense_brick(sdf, o, BRICK, 0.0) for o in origins) if r is not None]
+
+@pytest.fixture
+def layout():
+    # Tiles of BRICK voxels with their own grid of 2 * BRICK voxels
+    return {"origin": np.array([-1.5, 0.25, 3.0]), "voxel": 0.125, "core": BRICK, "margin": 2,
+            "counts": np.array([2, 2, 2]), "max_dim": 2 * BRICK * 0.125}
+
+def to_world(verts, layout):
+    return layout["origin"] + verts.astype(np.float64) * layout["voxel"]
+
+def open_edges(triangles):
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return int(np.sum(counts == 1))
+
+def test_lattice_keys_match_brick_keys(bricks, layout):
+    # lattice_keys shifts the lattice by one tile grid
+    pad = round(layout["max_dim"] / layout["voxel"])
+    shift = edge_keys(np.array([[pad, pad, pad]]), 0)[0]
+    for _, verts, _, keys in bricks:
+        np.testing.assert_array_equal(lattice_keys(to_world(verts, layout), layout), keys + shift)
+
+def test_weld_seams_matches_weld_bricks(bricks, layout):
+    ref_verts, ref_faces = weld_bricks(bricks)
+    assert open_edges(ref_faces) == 0
+
+    offsets = np.cumsum([0] + [len(verts) for _, verts, _, _ in bricks])
+    vertices = np.concatenate([to_world(verts, layout) for _, verts, _, _ in bricks])
+    triangles = np.concatenate([faces + off for (_, _, faces, _), off in zip(bricks, offsets)])
+    densities = np.arange(len(vertices), dtype=np.float64)
+
+    verts, faces, dens, welded = weld_seams(vertices, triangles, densities, layout, 0.5 * layout["voxel"])
+
+    # Every seam vertex is welded exactly to its twin, nothing else
+    assert welded == len(vertices) - len(ref_verts)
+    assert len(verts) == len(ref_verts) and len(dens) == len(verts)
+    assert open_edges(faces) == 0
+    np.testing.assert_allclose(np.sort(verts, axis=0), np.sort(to_world(ref_verts, layout), axis=0), atol=1e-6)